@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+# Модули, которые не должны импортироваться при старте CLI:
+# они нужны только командам, реально запускающим пайплайн.
+FORBIDDEN_AT_STARTUP = (
+    "openai",
+    "pydantic",
+    "bugsy_multi_agent.orchestration.pipeline",
+    "bugsy_multi_agent.agents",
+)
+
+
+def measure_import_time(module: str) -> dict[str, int]:
+    """
+    Запускает `python -X importtime -c "import <module>"` в отдельном процессе
+    и возвращает словарь {имя модуля: cumulative время импорта в мкс}.
+    """
+    project_root = Path(__file__).resolve().parent
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(project_root / "src")
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    timings: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # Формат: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def check_startup_budget(module: str, budget_ms: float) -> list[str]:
+    """
+    Проверяет, что импорт CLI укладывается в бюджет и не тянет тяжёлые модули.
+    Возвращает список нарушений (пустой, если всё в порядке).
+    """
+    timings = measure_import_time(module)
+    problems: list[str] = []
+
+    total_ms = timings.get(module, 0) / 1000
+    print(f"import {module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    if total_ms > budget_ms:
+        problems.append(
+            f"import of {module} took {total_ms:.1f} ms, budget is {budget_ms:.0f} ms"
+        )
+
+    for name in timings:
+        if any(
+            name == forbidden or name.startswith(forbidden + ".")
+            for forbidden in FORBIDDEN_AT_STARTUP
+        ):
+            problems.append(f"{name} is imported at CLI startup")
+
+    return problems
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark: import-time budget check for the CLI."
+    )
+    parser.add_argument(
+        "--module",
+        default="bugsy_multi_agent.main",
+        help="Модуль, время импорта которого проверяется.",
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=50.0,
+        help="Допустимое cumulative время импорта, мс.",
+    )
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    problems = check_startup_budget(args.module, args.budget_ms)
+    for problem in problems:
+        print("FAIL:", problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from typing import List
+from typing import List, Tuple
 
+from bugsy_multi_agent.analysis.coverage_index import AttributeCoverageIndex
 from bugsy_multi_agent.config.settings import Settings
 from bugsy_multi_agent.data_access.attribute_store import load_attributes
 from bugsy_multi_agent.data_access.attribute_coverage_store import (
@@ -19,8 +20,13 @@ from bugsy_multi_agent.orchestration.agent_base import AgentBase
 
 class AttributeCoverageCheckerAgent(AgentBase):
     """
-    Строит отчёт по покрытию core_passages атрибутами.
-    Пока без domain_entities (их у нас ещё не генерят).
+    Строит отчёт по покрытию атрибутами:
+    - core_passages и supporting_passages — по source_section_ids атрибутов;
+    - domain_entities — по совпадению нормализованных токенов сущности
+      с текстом атрибутов (name, description, примеры, цитаты).
+
+    Индексы section_id -> attribute_ids и токен -> attribute_ids строятся
+    один раз (AttributeCoverageIndex), поэтому проверка линейна по числу атрибутов.
     """
 
     def __init__(self, settings: Settings | None = None) -> None:
@@ -40,67 +46,95 @@ class AttributeCoverageCheckerAgent(AgentBase):
         return load_attributes(self.settings, query_id)
 
     def _build_passage_coverage(
-        self, passages: List[Passage], attributes: List[Attribute]
-    ) -> AttributeCoverageReport:
-        covered: List[AttributeCoverageEntry] = []
-        uncovered: List[AttributeCoverageEntry] = []
-
+        self,
+        passages: List[Passage],
+        index: AttributeCoverageIndex,
+        report: AttributeCoverageReport,
+    ) -> Tuple[int, int]:
+        """
+        Добавляет записи по passages в отчёт. Возвращает (covered, uncovered).
+        """
+        covered_count = 0
         for passage in passages:
-            attr_ids_for_passage: list[str] = []
-            for attr in attributes:
-                if passage.section_id in attr.source_section_ids:
-                    attr_ids_for_passage.append(attr.id)
-
+            attribute_ids = index.attributes_for_section(passage.section_id)
             entry = AttributeCoverageEntry(
                 entity_id=passage.section_id,
                 entity_type="passage",
                 description=passage.title or passage.summary[:200],
-                attribute_ids=attr_ids_for_passage,
+                attribute_ids=attribute_ids,
             )
 
-            if attr_ids_for_passage:
-                covered.append(entry)
+            if attribute_ids:
+                report.covered.append(entry)
+                covered_count += 1
             else:
-                uncovered.append(entry)
+                report.uncovered.append(entry)
 
-        report = AttributeCoverageReport(
-            query="",
-            covered=covered,
-            uncovered=uncovered,
-            summary="",
-        )
+        return covered_count, len(passages) - covered_count
 
-        return report
+    def _build_entity_coverage(
+        self,
+        entities: List[str],
+        index: AttributeCoverageIndex,
+        report: AttributeCoverageReport,
+    ) -> Tuple[int, int]:
+        """
+        Добавляет записи по domain_entities в отчёт. Возвращает (covered, uncovered).
+        """
+        covered_count = 0
+        for entity in entities:
+            attribute_ids = index.attributes_for_entity(entity)
+            entry = AttributeCoverageEntry(
+                entity_id=entity,
+                entity_type="domain_entity",
+                description=entity,
+                attribute_ids=attribute_ids,
+            )
+
+            if attribute_ids:
+                report.covered.append(entry)
+                covered_count += 1
+            else:
+                report.uncovered.append(entry)
+
+        return covered_count, len(entities) - covered_count
 
     def run(self, query_id: str) -> AttributeCoverageReport:
         """
-        Строит отчёт по покрытию core_passages атрибутами
+        Строит отчёт по покрытию passages и domain_entities атрибутами
         и сохраняет его в JSON.
         """
         ctx = self._load_testing_context(query_id)
         attributes = self._load_attributes(query_id)
 
-        base_report = self._build_passage_coverage(ctx.core_passages, attributes)
-        base_report.query = ctx.query
-
-        covered_count = len(base_report.covered)
-        uncovered_count = len(base_report.uncovered)
+        index = AttributeCoverageIndex(attributes)
+        report = AttributeCoverageReport(query=ctx.query)
 
-        base_report.summary = (
-            f"Core passages: {covered_count + uncovered_count}. "
-            f"Covered: {covered_count}. Uncovered: {uncovered_count}."
+        core = self._build_passage_coverage(ctx.core_passages, index, report)
+        supporting = self._build_passage_coverage(
+            ctx.supporting_passages, index, report
+        )
+        entities = self._build_entity_coverage(ctx.domain_entities, index, report)
+
+        report.summary = (
+            f"Core passages: {sum(core)}. "
+            f"Covered: {core[0]}. Uncovered: {core[1]}. "
+            f"Supporting passages: {sum(supporting)}. "
+            f"Covered: {supporting[0]}. Uncovered: {supporting[1]}. "
+            f"Domain entities: {sum(entities)}. "
+            f"Covered: {entities[0]}. Uncovered: {entities[1]}."
         )
 
         out_path = save_attribute_coverage_report(
             self.settings,
             query_id,
-            base_report,
+            report,
         )
 
         print(
             f"AttributeCoverageCheckerAgent finished for query_id={query_id}. "
-            f"Covered={covered_count}, uncovered={uncovered_count}. "
+            f"Covered={len(report.covered)}, uncovered={len(report.uncovered)}. "
             f"Output: {out_path}"
         )
 
-        return base_report
+        return report
@@ -1,14 +1,30 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Dict, List, Mapping, Set, Tuple
 
+from bugsy_multi_agent.analysis.delta import changed_keys, next_id_number, section_hashes
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
 from bugsy_multi_agent.config.settings import Settings
-from bugsy_multi_agent.data_access.attribute_store import save_attributes
+from bugsy_multi_agent.data_access.artifact_meta_store import (
+    load_artifact_meta,
+    update_artifact_meta,
+)
+from bugsy_multi_agent.data_access.attribute_store import (
+    get_attributes_path,
+    load_attributes,
+    save_attributes,
+)
+from bugsy_multi_agent.data_access.context_store import load_raw_context
 from bugsy_multi_agent.data_access.json_io import read_json
 from bugsy_multi_agent.data_access.query_mapping import get_query_text
-from bugsy_multi_agent.llm.client import DeepSeekLLMClient
-from bugsy_multi_agent.llm.json_utils import extract_json_from_text
-from bugsy_multi_agent.llm.prompts_attributes import build_attribute_generator_prompt
+from bugsy_multi_agent.llm.client import LLMClient
+from bugsy_multi_agent.llm.json_utils import extract_json_from_text, unwrap_json_list
+from bugsy_multi_agent.llm.parallel import map_parallel
+from bugsy_multi_agent.llm.repair import validate_items_with_repair
+from bugsy_multi_agent.llm.prompts_attributes import (
+    ATTRIBUTE_GENERATOR_PROMPT_VERSION,
+    build_attribute_generator_prompt_parts,
+)
 from bugsy_multi_agent.models.attribute import Attribute
 from bugsy_multi_agent.models.testing_context import TestingContext, Passage
 from bugsy_multi_agent.orchestration.agent_base import AgentBase
@@ -21,11 +37,23 @@ class AttributeGeneratorAgent(AgentBase):
     Порядок:
     - пробуем LLM (DeepSeek);
     - при ошибках откатываемся на локальную заглушку.
+
+    При settings.attribute_chunked_generation passages делятся на пачки
+    ограниченного размера, атрибуты для пачек генерируются параллельными
+    вызовами LLM и затем сводятся с глобальной перенумерацией id.
+
+    При settings.incremental_generation контекст сравнивается с предыдущим
+    запуском по хешам секций (meta/attribute_generator_{query_id}.json):
+    перегенерируются только атрибуты, чьи source_section_ids задевают
+    изменившиеся секции; остальные атрибуты и их id не меняются.
     """
 
-    def __init__(self, settings: Settings | None = None) -> None:
-        super().__init__(settings=settings)
-        self.llm_client = DeepSeekLLMClient()
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        llm_client: LLMClient | None = None,
+    ) -> None:
+        super().__init__(settings=settings, llm_client=llm_client)
 
     def _load_testing_context(self, query_id: str) -> TestingContext:
         path = self.settings.ontology_retriever_dir / f"{query_id}.json"
@@ -112,30 +140,286 @@ class AttributeGeneratorAgent(AgentBase):
 
         return attributes
 
+    def _prompt_version(self) -> str:
+        """
+        Версия промпта для метаданных: шаблон из data/prompts или встроенный.
+        """
+        template = self.prompt_template("attribute_generator")
+        if template is not None:
+            return template.version_tag
+        return f"attribute_generator@{ATTRIBUTE_GENERATOR_PROMPT_VERSION}"
+
+    def _parse_attributes(
+        self,
+        response_text: str,
+        llm_client: LLMClient | None = None,
+        repair: bool = True,
+    ) -> List[Attribute]:
+        # В JSON-режиме список приходит в обёртке {"attributes": [...]}
+        data = unwrap_json_list(extract_json_from_text(response_text), "attributes")
+
+        if not isinstance(data, list):
+            raise ValueError("LLM response is not a JSON array for Attribute list")
+
+        # Невалидные элементы исправляются коротким repair-промптом,
+        # валидные сохраняются
+        return validate_items_with_repair(
+            data,
+            Attribute,
+            llm_client or self.llm_client,
+            max_rounds=self.settings.llm_repair_max_rounds if repair else 0,
+            json_object=self.settings.llm_json_mode,
+        )
+
+    @staticmethod
+    def _check_attributes(ctx: TestingContext, attributes: List[Attribute]) -> str | None:
+        """
+        Проверка качества ответа для каскада моделей: None или причина отказа.
+        """
+        if not attributes:
+            return "no attributes"
+        ids = [a.id for a in attributes]
+        if len(set(ids)) != len(ids):
+            return "duplicate attribute ids"
+        known = {p.section_id for p in ctx.core_passages + ctx.supporting_passages}
+        unknown = sorted(
+            {ref for a in attributes for ref in a.source_section_ids} - known
+        )
+        if unknown:
+            return f"unknown source_section_ids: {', '.join(unknown)}"
+        return None
+
     def _generate_attributes_with_llm(
         self,
         ctx: TestingContext,
         display_query: str,
     ) -> List[Attribute]:
-        prompt = build_attribute_generator_prompt(
-            ctx,
-            query_override=display_query,
+        # Шаблоны из data/prompts просят голый массив — JSON-режим только для встроенного
+        template = self.prompt_template("attribute_generator")
+        json_mode = self.settings.llm_json_mode and template is None
+        prompt = self.prompt_text(
+            build_attribute_generator_prompt_parts(
+                ctx,
+                query_override=display_query,
+                envelope_key="attributes" if json_mode else None,
+                template=template,
+                compressor=self.prompt_compressor(),
+            )
+        )
+        return self.generate_with_cascade(
+            "attribute_generator",
+            prompt,
+            self._parse_attributes,
+            json_object=json_mode,
+            check=lambda attrs: self._check_attributes(ctx, attrs),
         )
-        response_text = self.llm_client.generate(prompt)
-        data = extract_json_from_text(response_text)
 
-        if not isinstance(data, list):
-            raise ValueError("LLM response is not a JSON array for Attribute list")
+    # ---------- генерация по пачкам (map-reduce) ----------
 
-        attributes: List[Attribute] = []
-        for obj in data:
-            if not isinstance(obj, dict):
-                raise ValueError("Attribute item is not a JSON object")
-            attributes.append(Attribute.from_dict(obj))
+    def _chunk_context(self, ctx: TestingContext) -> List[TestingContext]:
+        """
+        Делит passages на пачки ограниченного размера (title + summary не больше
+        settings.attribute_chunk_max_chars). Каждая пачка — копия TestingContext
+        со своим подмножеством core/supporting passages; порядок passages сохраняется.
+        Passage, который сам больше лимита, попадает в отдельную пачку.
+        """
+        max_chars = self.settings.attribute_chunk_max_chars
+        chunks: List[Tuple[List[Passage], List[Passage]]] = []
+        current_core: List[Passage] = []
+        current_supp: List[Passage] = []
+        current_size = 0
 
-        return attributes
+        tagged = [(p, True) for p in ctx.core_passages] + [
+            (p, False) for p in ctx.supporting_passages
+        ]
+        for passage, is_core in tagged:
+            size = len(passage.title) + len(passage.summary)
+            if (current_core or current_supp) and current_size + size > max_chars:
+                chunks.append((current_core, current_supp))
+                current_core, current_supp, current_size = [], [], 0
+            (current_core if is_core else current_supp).append(passage)
+            current_size += size
+
+        if current_core or current_supp or not chunks:
+            chunks.append((current_core, current_supp))
+
+        return [
+            ctx.model_copy(
+                update={"core_passages": core, "supporting_passages": supp}
+            )
+            for core, supp in chunks
+        ]
+
+    @staticmethod
+    def merge_attribute_chunks(chunks: List[List[Attribute]]) -> List[Attribute]:
+        """
+        Сводит атрибуты пачек в один список:
+        - дубли (одинаковые name + description после нормализации) склеиваются,
+          их source_section_ids и source_quotes объединяются;
+        - id перенумеровываются глобально: EVT-001, EVT-002, ...
+        """
+        merged: List[Attribute] = []
+        by_key: Dict[str, int] = {}
+
+        for chunk in chunks:
+            for attr in chunk:
+                key = normalized_digest([attr.name, attr.description])
+                pos = by_key.get(key)
+                if pos is None:
+                    by_key[key] = len(merged)
+                    merged.append(attr)
+                    continue
+
+                existing = merged[pos]
+                section_ids = list(existing.source_section_ids)
+                section_ids += [
+                    s for s in attr.source_section_ids if s not in section_ids
+                ]
+                quotes = list(existing.source_quotes)
+                quotes += [q for q in attr.source_quotes if q not in quotes]
+                merged[pos] = existing.model_copy(
+                    update={"source_section_ids": section_ids, "source_quotes": quotes}
+                )
+
+        return [
+            attr.model_copy(update={"id": f"EVT-{idx:03d}"})
+            for idx, attr in enumerate(merged, start=1)
+        ]
+
+    def _generate_attributes_chunked(
+        self,
+        ctx: TestingContext,
+        display_query: str,
+    ) -> List[Attribute]:
+        """
+        Map: по пачке passages — отдельный параллельный вызов LLM.
+        Reduce: merge_attribute_chunks.
+        Упавшие пачки пропускаются; если упали все — пробрасывается первая ошибка.
+        """
+        sub_contexts = self._chunk_context(ctx)
+        results = map_parallel(
+            lambda sub_ctx: self._generate_attributes_with_llm(sub_ctx, display_query),
+            sub_contexts,
+            max_workers=self.settings.llm_max_concurrency,
+        )
+
+        chunks: List[List[Attribute]] = []
+        errors: List[Exception] = []
+        for idx, result in enumerate(results, start=1):
+            if isinstance(result, Exception):
+                print(
+                    f"AttributeGeneratorAgent: chunk {idx}/{len(results)} failed: "
+                    f"{result}. Skipping it."
+                )
+                self.note_degraded(result)
+                errors.append(result)
+            else:
+                chunks.append(result)
+
+        if not chunks:
+            raise errors[0]
+
+        print(
+            f"AttributeGeneratorAgent: chunked generation, "
+            f"{len(chunks)}/{len(results)} chunks succeeded."
+        )
+        return self.merge_attribute_chunks(chunks)
+
+    def _generate_attributes(
+        self,
+        query_id: str,
+        ctx: TestingContext,
+        display_query: str,
+    ) -> Tuple[List[Attribute], bool]:
+        """
+        LLM (целиком или по пачкам); при ошибке — заглушка.
+        Возвращает (атрибуты, used_llm).
+        """
+        try:
+            if self.settings.attribute_chunked_generation:
+                return self._generate_attributes_chunked(ctx, display_query), True
+            return self._generate_attributes_with_llm(ctx, display_query), True
+        except Exception as e:
+            print(
+                f"AttributeGeneratorAgent: LLM failed for query_id={query_id}: {e}. "
+                f"Falling back to stub."
+            )
+            self.note_degraded(e)
+            return self._generate_attributes_stub(ctx), False
+
+    # ---------- инкрементальная перегенерация ----------
+
+    def _load_raw_context(self, query_id: str) -> Mapping[str, Any]:
+        try:
+            return load_raw_context(self.settings, query_id)
+        except FileNotFoundError:
+            return {}
+
+    def _load_previous_attributes(self, query_id: str) -> List[Attribute] | None:
+        if not get_attributes_path(self.settings, query_id).exists():
+            return None
+        try:
+            return load_attributes(self.settings, query_id)
+        except Exception as e:
+            print(
+                f"AttributeGeneratorAgent: previous attributes for "
+                f"query_id={query_id} are unreadable: {e}. Regenerating all."
+            )
+            return None
+
+    def _generate_attributes_incremental(
+        self,
+        query_id: str,
+        ctx: TestingContext,
+        display_query: str,
+        previous: List[Attribute],
+        changed: Set[str],
+    ) -> Tuple[List[Attribute], bool]:
+        """
+        Перегенерирует атрибуты только по изменившимся (и новым) секциям.
+
+        - атрибуты, не ссылающиеся на изменившиеся секции, остаются как есть;
+        - атрибуты, ссылающиеся на них, заменяются новыми, сгенерированными
+          по контексту только из изменившихся секций;
+        - новый атрибут с тем же именем, что и заменённый, получает его id,
+          остальные — следующие свободные номера EVT-.
+        """
+        kept = [a for a in previous if not changed & set(a.source_section_ids)]
+        replaced = [a for a in previous if changed & set(a.source_section_ids)]
+
+        core = [p for p in ctx.core_passages if p.section_id in changed]
+        supp = [p for p in ctx.supporting_passages if p.section_id in changed]
+        if core or supp:
+            sub_ctx = ctx.model_copy(
+                update={"core_passages": core, "supporting_passages": supp}
+            )
+            regenerated, used_llm = self._generate_attributes(
+                query_id, sub_ctx, display_query
+            )
+        else:
+            # Секции только удалены — генерировать нечего
+            regenerated, used_llm = [], False
+
+        reusable_ids = {normalized_digest([a.name]): a.id for a in replaced}
+        next_number = next_id_number(a.id for a in previous)
+
+        attributes = list(kept)
+        for attr in regenerated:
+            attr_id = reusable_ids.pop(normalized_digest([attr.name]), None)
+            if attr_id is None:
+                attr_id = f"EVT-{next_number:03d}"
+                next_number += 1
+            attributes.append(attr.model_copy(update={"id": attr_id}))
+
+        print(
+            f"AttributeGeneratorAgent: incremental run for query_id={query_id}: "
+            f"{len(changed)} changed sections, kept {len(kept)}, "
+            f"replaced {len(replaced)} with {len(regenerated)} attributes."
+        )
+        return attributes, used_llm
 
     def run(self, query_id: str) -> List[Attribute]:
+        self.take_degraded_reasons()
         ctx = self._load_testing_context(query_id)
 
         display_query = get_query_text(
@@ -144,18 +428,49 @@ class AttributeGeneratorAgent(AgentBase):
             fallback=ctx.query,
         )
 
-        try:
-            attributes = self._generate_attributes_with_llm(ctx, display_query)
-            used_llm = True
-        except Exception as e:
-            print(
-                f"AttributeGeneratorAgent: LLM failed for query_id={query_id}: {e}. "
-                f"Falling back to stub."
+        hashes = section_hashes(ctx, self._load_raw_context(query_id))
+
+        previous = None
+        old_hashes: Dict[str, str] = {}
+        if self.settings.incremental_generation:
+            meta = load_artifact_meta(self.settings, "attribute_generator", query_id)
+            old_hashes = meta.get("section_hashes") or {}
+            # Деградировавший артефакт или артефакт другой версии промпта
+            # не годится как основа — генерируем заново
+            if (
+                old_hashes
+                and not meta.get("degraded")
+                and meta.get("prompt_version") == self._prompt_version()
+            ):
+                previous = self._load_previous_attributes(query_id)
+
+        if previous is not None:
+            attributes, used_llm = self._generate_attributes_incremental(
+                query_id,
+                ctx,
+                display_query,
+                previous,
+                changed_keys(old_hashes, hashes),
+            )
+        else:
+            attributes, used_llm = self._generate_attributes(
+                query_id, ctx, display_query
             )
-            attributes = self._generate_attributes_stub(ctx)
-            used_llm = False
 
         out_path = save_attributes(self.settings, query_id, attributes)
+        degraded_reasons = self.take_degraded_reasons()
+        update_artifact_meta(
+            self.settings,
+            "attribute_generator",
+            query_id,
+            section_hashes=hashes,
+            prompt_version=self._prompt_version(),
+            used_llm=used_llm,
+            degraded=bool(degraded_reasons),
+            degraded_reasons=degraded_reasons,
+            # Новый файл атрибутов ещё не сливался валидатором
+            near_duplicates_merged=0,
+        )
 
         print(
             f"AttributeGeneratorAgent finished for query_id={query_id}. "
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
 from collections import Counter
-from typing import List, Set
+from typing import Any, List, Mapping, Set
 
+from bugsy_multi_agent.analysis.minhash import find_near_duplicate_clusters
+from bugsy_multi_agent.analysis.quote_grounding import (
+    QuoteGroundingChecker,
+    QuoteGroundingResult,
+)
 from bugsy_multi_agent.config.settings import Settings
-from bugsy_multi_agent.data_access.attribute_store import load_attributes
+from bugsy_multi_agent.data_access.artifact_meta_store import update_artifact_meta
+from bugsy_multi_agent.data_access.attribute_store import (
+    load_attributes,
+    save_attributes,
+)
 from bugsy_multi_agent.data_access.attribute_validation_store import (
     save_validation_report,
 )
+from bugsy_multi_agent.data_access.context_store import load_raw_context
 from bugsy_multi_agent.data_access.json_io import read_json
 from bugsy_multi_agent.models.attribute import Attribute
 from bugsy_multi_agent.models.reports import ValidationIssue, ValidationReport
@@ -22,6 +32,14 @@ class AttributeValidatorAgent(AgentBase):
     - валидность ссылок на section_id
     - наличие позитивного/негативного примера
     - отсутствие пустых описаний
+    - почти-дубликаты по name/description/positive_example (MinHash + LSH)
+    - что source_quotes действительно встречаются в текстах секций
+      сырого контекста (автомат Ахо–Корасик, один проход по каждой секции)
+
+    При settings.attribute_near_duplicate_auto_merge кластеры почти-дубликатов
+    сливаются в один атрибут до остальных проверок: файл атрибутов перезаписывается
+    (до генерации сценариев), метаданные attribute_generator отмечают слияние,
+    а отчёт относится к итоговому списку.
     """
 
     def __init__(self, settings: Settings | None = None) -> None:
@@ -42,6 +60,12 @@ class AttributeValidatorAgent(AgentBase):
     def _load_attributes(self, query_id: str) -> List[Attribute]:
         return load_attributes(self.settings, query_id)
 
+    def _load_raw_context(self, query_id: str) -> Mapping[str, Any] | None:
+        try:
+            return load_raw_context(self.settings, query_id)
+        except FileNotFoundError:
+            return None
+
     # ---------- проверки ----------
 
     def _check_unique_ids(
@@ -127,6 +151,121 @@ class AttributeValidatorAgent(AgentBase):
                     )
                 )
 
+    def _find_near_duplicates(self, attributes: List[Attribute]) -> List[List[int]]:
+        texts = [
+            f"{a.name}\n{a.description}\n{a.positive_example}" for a in attributes
+        ]
+        return find_near_duplicate_clusters(
+            texts,
+            threshold=self.settings.attribute_near_duplicate_threshold,
+        )
+
+    def _check_near_duplicates(
+        self,
+        attributes: List[Attribute],
+        clusters: List[List[int]],
+        report: ValidationReport,
+    ) -> None:
+        for cluster in clusters:
+            ids = [attributes[i].id for i in cluster]
+            report.add_issue(
+                ValidationIssue(
+                    severity="warning",
+                    code="NEAR_DUPLICATE",
+                    message=(
+                        f"Attributes {', '.join(ids)} look like near-duplicates "
+                        f"(similar name/description/positive_example)."
+                    ),
+                    object_type="attribute",
+                    object_id=ids[0],
+                    field="description",
+                )
+            )
+
+    def _check_source_quotes(
+        self,
+        results: List[QuoteGroundingResult],
+        report: ValidationReport,
+        prefix_query_id: bool = False,
+    ) -> None:
+        for res in results:
+            if res.status == "grounded":
+                continue
+            object_id = (
+                f"{res.query_id}/{res.attribute_id}"
+                if prefix_query_id
+                else res.attribute_id
+            )
+            if res.status == "other_section":
+                report.add_issue(
+                    ValidationIssue(
+                        severity="warning",
+                        code="QUOTE_SECTION_MISMATCH",
+                        message=(
+                            f"Quote of attribute '{res.attribute_id}' is found only "
+                            f"in sections not listed in source_section_ids "
+                            f"({', '.join(res.found_in)}): \"{res.quote}\""
+                        ),
+                        object_type="attribute",
+                        object_id=object_id,
+                        field="source_quotes",
+                    )
+                )
+            else:
+                report.add_issue(
+                    ValidationIssue(
+                        severity="warning",
+                        code="QUOTE_NOT_GROUNDED",
+                        message=(
+                            f"Quote of attribute '{res.attribute_id}' is not found "
+                            f"in the documentation sections: \"{res.quote}\""
+                        ),
+                        object_type="attribute",
+                        object_id=object_id,
+                        field="source_quotes",
+                    )
+                )
+
+    # ---------- слияние почти-дубликатов ----------
+
+    @staticmethod
+    def merge_near_duplicates(
+        attributes: List[Attribute],
+        clusters: List[List[int]],
+    ) -> List[Attribute]:
+        """
+        Оставляет из каждого кластера один атрибут: с наивысшим приоритетом,
+        при равенстве — первый по порядку. Его source_section_ids и source_quotes
+        дополняются ссылками и цитатами остальных членов кластера.
+        Порядок оставшихся атрибутов сохраняется.
+        """
+        dropped: Set[int] = set()
+        merged: dict[int, Attribute] = {}
+
+        for cluster in clusters:
+            keep = min(cluster, key=lambda i: (attributes[i].priority, i))
+            section_ids = list(attributes[keep].source_section_ids)
+            quotes = list(attributes[keep].source_quotes)
+            for i in cluster:
+                if i == keep:
+                    continue
+                dropped.add(i)
+                for section_id in attributes[i].source_section_ids:
+                    if section_id not in section_ids:
+                        section_ids.append(section_id)
+                for quote in attributes[i].source_quotes:
+                    if quote not in quotes:
+                        quotes.append(quote)
+            merged[keep] = attributes[keep].model_copy(
+                update={"source_section_ids": section_ids, "source_quotes": quotes}
+            )
+
+        return [
+            merged.get(i, attr)
+            for i, attr in enumerate(attributes)
+            if i not in dropped
+        ]
+
     # ---------- главный метод ----------
 
     def run(self, query_id: str) -> ValidationReport:
@@ -139,6 +278,20 @@ class AttributeValidatorAgent(AgentBase):
 
         report = ValidationReport(is_valid=True, issues=[], summary="")
 
+        # Слияние — до проверок: отчёт описывает уже перезаписанный файл
+        clusters = self._find_near_duplicates(attributes)
+        loaded_count = len(attributes)
+        if clusters and self.settings.attribute_near_duplicate_auto_merge:
+            attributes = self.merge_near_duplicates(attributes, clusters)
+            save_attributes(self.settings, query_id, attributes)
+            update_artifact_meta(
+                self.settings,
+                "attribute_generator",
+                query_id,
+                near_duplicates_merged=loaded_count - len(attributes),
+            )
+            clusters = []
+
         # Список валидных section_id из TestingContext
         valid_section_ids: Set[str] = {
             p.section_id for p in ctx.core_passages
@@ -148,6 +301,15 @@ class AttributeValidatorAgent(AgentBase):
         self._check_section_refs(attributes, valid_section_ids, report)
         self._check_required_fields(attributes, report)
 
+        raw_context = self._load_raw_context(query_id)
+        if raw_context is not None:
+            checker = QuoteGroundingChecker()
+            checker.add_context(query_id, raw_context)
+            checker.add_attributes(query_id, attributes)
+            self._check_source_quotes(checker.run(), report)
+
+        self._check_near_duplicates(attributes, clusters, report)
+
         # Итоговое summary
         if not report.issues:
             report.summary = (
@@ -161,6 +323,11 @@ class AttributeValidatorAgent(AgentBase):
                 f"Errors: {error_count}, warnings: {warning_count}."
             )
 
+        if len(attributes) != loaded_count:
+            report.summary += (
+                f" Near-duplicates merged: {loaded_count} -> {len(attributes)} attributes."
+            )
+
         out_path = save_validation_report(self.settings, query_id, report)
 
         print(
@@ -170,3 +337,48 @@ class AttributeValidatorAgent(AgentBase):
         )
 
         return report
+
+    def run_quote_audit(
+        self,
+        query_ids: List[str],
+        corpus_id: str = "corpus",
+    ) -> ValidationReport:
+        """
+        Аудит source_quotes по всему корпусу запросов.
+
+        Цитаты всех запросов попадают в один автомат, каждая уникальная секция
+        сканируется один раз. Результат сохраняется как
+        attribute_validation_quote_audit_{corpus_id}.json.
+        """
+        checker = QuoteGroundingChecker()
+        quotes_total = 0
+        for query_id in query_ids:
+            raw_context = self._load_raw_context(query_id)
+            if raw_context is None:
+                print(
+                    f"AttributeValidatorAgent: raw context for query_id={query_id} "
+                    f"not found, skipping quote audit."
+                )
+                continue
+            attributes = self._load_attributes(query_id)
+            quotes_total += sum(len(a.source_quotes) for a in attributes)
+            checker.add_context(query_id, raw_context)
+            checker.add_attributes(query_id, attributes)
+
+        report = ValidationReport(is_valid=True, issues=[], summary="")
+        results = checker.run()
+        self._check_source_quotes(results, report, prefix_query_id=True)
+
+        not_found = sum(1 for r in results if r.status == "not_found")
+        mismatched = sum(1 for r in results if r.status == "other_section")
+        report.summary = (
+            f"{quotes_total} quotes audited across {len(query_ids)} queries. "
+            f"Grounded: {quotes_total - not_found - mismatched}, "
+            f"wrong section: {mismatched}, not found: {not_found}."
+        )
+
+        out_path = save_validation_report(
+            self.settings, f"quote_audit_{corpus_id}", report
+        )
+        print(f"{report.summary} Output: {out_path}")
+        return report
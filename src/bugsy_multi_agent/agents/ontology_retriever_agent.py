@@ -1,15 +1,30 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+from typing import Any, Dict, List, Mapping
 
 from bugsy_multi_agent.config.settings import Settings
-from bugsy_multi_agent.data_access.json_io import read_json, write_json
+from bugsy_multi_agent.data_access.artifact_meta_store import update_artifact_meta
+from bugsy_multi_agent.data_access.context_store import load_raw_context
+from bugsy_multi_agent.data_access.json_io import write_json
 from bugsy_multi_agent.data_access.query_mapping import get_query_text
-from bugsy_multi_agent.llm.client import DeepSeekLLMClient
+from bugsy_multi_agent.data_access.section_cache_store import SectionSummaryCache
+from bugsy_multi_agent.llm.client import LLMClient
 from bugsy_multi_agent.llm.json_utils import extract_json_from_text
-from bugsy_multi_agent.llm.prompts_ontology import build_ontology_retriever_prompt
-from bugsy_multi_agent.models.testing_context import TestingContext, Passage
+from bugsy_multi_agent.llm.parallel import map_parallel
+from bugsy_multi_agent.llm.prompts_ontology import (
+    ONTOLOGY_REDUCE_PROMPT_VERSION,
+    ONTOLOGY_RETRIEVER_PROMPT_VERSION,
+    SECTION_SUMMARY_PROMPT_VERSION,
+    build_ontology_reduce_prompt,
+    build_ontology_retriever_prompt_parts,
+    build_section_summary_prompt_parts,
+)
+from bugsy_multi_agent.models.testing_context import (
+    Passage,
+    SectionSummary,
+    TestingContext,
+)
 from bugsy_multi_agent.orchestration.agent_base import AgentBase
 
 
@@ -19,20 +34,41 @@ class OntologyRAGRetrieverAgent(AgentBase):
     и превращает их в стандартизированный TestingContext.
 
     Теперь умеет звать DeepSeek; при проблемах с JSON откатывается на эвристику.
+
+    При settings.ontology_map_reduce вместо одного большого промпта:
+    - map: каждая секция классифицируется и суммаризируется отдельным
+      небольшим вызовом LLM, вызовы идут параллельно;
+    - reduce: один короткий вызов по готовым summary собирает
+      focus_summary, domain_entities и hints_for_tests.
+
+    Результаты map-шага кэшируются между запросами (SectionSummaryCache,
+    settings.section_cache_enabled): известная секция не отправляется в LLM
+    совсем или отправляется коротким summary вместо полного текста.
     """
 
-    def __init__(self, settings: Settings | None = None) -> None:
-        super().__init__(settings=settings)
-        # Инициализируем клиента один раз на агент
-        self.llm_client = DeepSeekLLMClient()
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        llm_client: LLMClient | None = None,
+    ) -> None:
+        super().__init__(settings=settings, llm_client=llm_client)
+        self._section_cache: SectionSummaryCache | None = None
+
+    @property
+    def section_cache(self) -> SectionSummaryCache | None:
+        """
+        Кэш summary секций; читается с диска при первом обращении.
+        """
+        if not self.settings.section_cache_enabled:
+            return None
+        if self._section_cache is None:
+            self._section_cache = SectionSummaryCache(self.settings)
+        return self._section_cache
 
-    def _load_raw_context(self, query_id: str) -> dict:
-        path = self.settings.contexts_dir / f"{query_id}.json"
-        if not path.exists():
-            raise FileNotFoundError(f"Raw context file not found: {path}")
-        return read_json(path)
+    def _load_raw_context(self, query_id: str) -> Mapping[str, Any]:
+        return load_raw_context(self.settings, query_id)
 
-    def _build_testing_context_heuristic(self, raw: dict) -> TestingContext:
+    def _build_testing_context_heuristic(self, raw: Mapping[str, Any]) -> TestingContext:
         query = raw.get("query", "")
         section_candidates = raw.get("section_candidates", [])
 
@@ -71,17 +107,45 @@ class OntologyRAGRetrieverAgent(AgentBase):
             hints_for_tests=[],
         )
 
+    def _prompt_version(self) -> str:
+        """
+        Версия промпта(ов) для метаданных: шаблон из data/prompts или встроенный;
+        в режиме map-reduce — версии промптов map- и reduce-шагов.
+        """
+        if self.settings.ontology_map_reduce:
+            return (
+                f"section_summary@{SECTION_SUMMARY_PROMPT_VERSION}+"
+                f"ontology_reduce@{ONTOLOGY_REDUCE_PROMPT_VERSION}"
+            )
+        template = self.prompt_template("ontology_retriever")
+        if template is not None:
+            return template.version_tag
+        return f"ontology_retriever@{ONTOLOGY_RETRIEVER_PROMPT_VERSION}"
+
     def _build_testing_context_with_llm(
         self,
-        raw: dict,
+        raw: Mapping[str, Any],
         display_query: str,
     ) -> TestingContext:
-        prompt = build_ontology_retriever_prompt(
-            raw_context=raw,
-            query_override=display_query,
+        prompt = self.prompt_text(
+            build_ontology_retriever_prompt_parts(
+                raw_context=raw,
+                query_override=display_query,
+                template=self.prompt_template("ontology_retriever"),
+                compressor=self.prompt_compressor(),
+            )
         )
 
-        response_text = self.llm_client.generate(prompt)
+        return self.generate_with_cascade(
+            "ontology_retriever",
+            prompt,
+            lambda text, client, repair: self._parse_testing_context(text),
+            json_object=self.settings.llm_json_mode,
+            check=lambda ctx: self._check_testing_context(raw, ctx),
+        )
+
+    @staticmethod
+    def _parse_testing_context(response_text: str) -> TestingContext:
         data = extract_json_from_text(response_text)
 
         # Ожидаем один JSON-объект
@@ -90,6 +154,236 @@ class OntologyRAGRetrieverAgent(AgentBase):
 
         return TestingContext.from_dict(data)
 
+    @staticmethod
+    def _check_testing_context(raw: Mapping[str, Any], ctx: TestingContext) -> str | None:
+        """
+        Проверка качества ответа для каскада моделей: None или причина отказа.
+        """
+        if not ctx.core_passages:
+            return "no core passages"
+        known = {sec.get("section_id") for sec in raw.get("section_candidates", [])}
+        unknown = sorted(
+            {p.section_id for p in ctx.core_passages + ctx.supporting_passages} - known
+        )
+        if unknown:
+            return f"unknown section_ids: {', '.join(unknown)}"
+        return None
+
+    # ---------- map-reduce ----------
+
+    def _summarize_section(self, query: str, section: Mapping[str, Any]) -> SectionSummary:
+        prompt = self.prompt_text(
+            build_section_summary_prompt_parts(
+                query=query,
+                section=section,
+                compressor=self.prompt_compressor(),
+            )
+        )
+        return self.generate_with_cascade(
+            "section_summary",
+            prompt,
+            lambda text, client, repair: self._parse_section_summary(text, section),
+            json_object=self.settings.llm_json_mode,
+            check=self._check_section_summary,
+        )
+
+    @staticmethod
+    def _parse_section_summary(response_text: str, section: Mapping[str, Any]) -> SectionSummary:
+        data = extract_json_from_text(response_text)
+
+        if not isinstance(data, dict):
+            raise ValueError("LLM response is not a JSON object for SectionSummary")
+
+        # section_id и title берём из исходной секции, а не из ответа модели
+        data["section_id"] = section.get("section_id", data.get("section_id", ""))
+        data["title"] = section.get("title", data.get("title", ""))
+        return SectionSummary.from_dict(data)
+
+    @staticmethod
+    def _check_section_summary(summary: SectionSummary) -> str | None:
+        """
+        Проверка качества ответа для каскада моделей: у core/supporting
+        секции должно быть summary.
+        """
+        if summary.role != "discarded" and not summary.summary.strip():
+            return f"empty summary for {summary.role} section"
+        return None
+
+    def _summarize_section_cached(
+        self,
+        query: str,
+        section: Mapping[str, Any],
+    ) -> SectionSummary:
+        """
+        _summarize_section через кэш:
+        - секция уже разобрана для этого запроса — без вызова LLM;
+        - секция известна по другим запросам — в промпт идёт короткое summary
+          вместо полного текста, summary и сущности берутся из кэша;
+        - иначе полный вызов, результат кладётся в кэш.
+        """
+        cache = self.section_cache
+        if cache is None:
+            return self._summarize_section(query, section)
+
+        section_id = section.get("section_id", "")
+        text = section.get("text", "")
+
+        cached = cache.get_full(section_id, text, query)
+        if cached is not None:
+            return cached
+
+        known = cache.get_summary(section_id, text)
+        if known is not None:
+            result = self._summarize_section(query, {**section, "text": known["summary"]})
+            result = result.model_copy(update=known)
+        else:
+            result = self._summarize_section(query, section)
+
+        cache.put(text, query, result)
+        return result
+
+    @staticmethod
+    def _section_summary_heuristic(section: Mapping[str, Any]) -> SectionSummary:
+        return SectionSummary(
+            section_id=section.get("section_id", ""),
+            title=section.get("title", ""),
+            role="supporting",
+            importance="medium",
+            summary=section.get("text", "")[:500],
+        )
+
+    def _summarize_sections(
+        self,
+        query: str,
+        sections: List[Mapping[str, Any]],
+    ) -> List[SectionSummary]:
+        """
+        Map-шаг: параллельные вызовы по секциям. Секция, для которой вызов упал,
+        получает эвристическое summary; если упали все — пробрасывается первая ошибка.
+        """
+        results = map_parallel(
+            lambda section: self._summarize_section_cached(query, section),
+            sections,
+            max_workers=self.settings.llm_max_concurrency,
+        )
+
+        cache = self.section_cache
+        if cache is not None:
+            cache.save()
+            stats = cache.stats()
+            print(
+                f"OntologyRAGRetrieverAgent: section cache hit_rate="
+                f"{stats['hit_rate']:.2f} (full={stats['full_hits']}, "
+                f"summary={stats['summary_hits']}, misses={stats['misses']}, "
+                f"entries={stats['entries']}, evictions={stats['evictions']})"
+            )
+
+        summaries: List[SectionSummary] = []
+        errors: List[Exception] = []
+        for section, result in zip(sections, results):
+            if isinstance(result, Exception):
+                print(
+                    f"OntologyRAGRetrieverAgent: section "
+                    f"{section.get('section_id', '')} failed: {result}. "
+                    f"Using heuristic summary."
+                )
+                self.note_degraded(result)
+                errors.append(result)
+                summaries.append(self._section_summary_heuristic(section))
+            else:
+                summaries.append(result)
+
+        if errors and len(errors) == len(sections):
+            raise errors[0]
+
+        return summaries
+
+    @staticmethod
+    def _parse_reduce(response_text: str) -> Dict[str, Any]:
+        data = extract_json_from_text(response_text)
+        if not isinstance(data, dict):
+            raise ValueError("LLM response is not a JSON object for reduce step")
+        return data
+
+    @staticmethod
+    def _check_reduce(data: Dict[str, Any]) -> str | None:
+        if not str(data.get("focus_summary", "")).strip():
+            return "empty focus_summary"
+        return None
+
+    def _build_testing_context_map_reduce(
+        self,
+        raw: Mapping[str, Any],
+        display_query: str,
+    ) -> TestingContext:
+        # Секции с section_id передаются как есть: тексты ленивого контекста
+        # читаются только при обращении
+        sections = [
+            sec if "section_id" in sec else {**sec, "section_id": f"sec_{idx}"}
+            for idx, sec in enumerate(raw.get("section_candidates", []))
+        ]
+        summaries = self._summarize_sections(display_query, sections)
+
+        core_passages: List[Passage] = []
+        supporting_passages: List[Passage] = []
+        discarded_sections: List[str] = []
+        for summary in summaries:
+            if summary.role == "discarded":
+                discarded_sections.append(summary.section_id)
+                continue
+            passage = Passage(
+                section_id=summary.section_id,
+                title=summary.title,
+                role=summary.role,
+                importance=summary.importance,
+                summary=summary.summary,
+            )
+            if summary.role == "core":
+                core_passages.append(passage)
+            else:
+                supporting_passages.append(passage)
+
+        kept = [s.to_dict() for s in summaries if s.role != "discarded"]
+        entities: List[str] = []
+        for summary in summaries:
+            if summary.role != "discarded":
+                entities += [e for e in summary.domain_entities if e not in entities]
+
+        # Reduce: при ошибке собираем поля из результатов map-шага
+        try:
+            data = self.generate_with_cascade(
+                "ontology_reduce",
+                build_ontology_reduce_prompt(display_query, kept),
+                lambda text, client, repair: self._parse_reduce(text),
+                json_object=self.settings.llm_json_mode,
+                check=self._check_reduce,
+            )
+            focus_summary = str(data.get("focus_summary", ""))
+            domain_entities = list(data.get("domain_entities") or entities)
+            hints_for_tests = list(data.get("hints_for_tests") or [])
+        except Exception as e:
+            print(
+                f"OntologyRAGRetrieverAgent: reduce step failed: {e}. "
+                f"Using map results only."
+            )
+            self.note_degraded(e)
+            focus_summary = (
+                f"Auto-generated focus summary for query: {display_query}. "
+                f"Core passages count: {len(core_passages)}."
+            )
+            domain_entities = entities
+            hints_for_tests = []
+
+        return TestingContext(
+            query=display_query,
+            focus_summary=focus_summary,
+            core_passages=core_passages,
+            supporting_passages=supporting_passages,
+            discarded_sections=discarded_sections,
+            domain_entities=domain_entities,
+            hints_for_tests=hints_for_tests,
+        )
+
     def run(self, query_id: str) -> TestingContext:
         """
         Главная точка входа.
@@ -99,6 +393,7 @@ class OntologyRAGRetrieverAgent(AgentBase):
         - при ошибке откатывается на эвристику,
         - сохраняет результат в JSON.
         """
+        self.take_degraded_reasons()
         raw = self._load_raw_context(query_id)
 
         display_query = get_query_text(
@@ -108,21 +403,38 @@ class OntologyRAGRetrieverAgent(AgentBase):
         )
 
         try:
-            testing_context = self._build_testing_context_with_llm(
-                raw=raw,
-                display_query=display_query,
-            )
+            if self.settings.ontology_map_reduce:
+                testing_context = self._build_testing_context_map_reduce(
+                    raw=raw,
+                    display_query=display_query,
+                )
+            else:
+                testing_context = self._build_testing_context_with_llm(
+                    raw=raw,
+                    display_query=display_query,
+                )
             used_llm = True
         except Exception as e:
             print(
                 f"OntologyRAGRetrieverAgent: LLM failed for query_id={query_id}: {e}. "
                 f"Falling back to heuristic."
             )
+            self.note_degraded(e)
             testing_context = self._build_testing_context_heuristic(raw)
             used_llm = False
 
         out_path = self.settings.ontology_retriever_dir / f"{query_id}.json"
         write_json(out_path, testing_context.to_dict())
+        degraded_reasons = self.take_degraded_reasons()
+        update_artifact_meta(
+            self.settings,
+            "ontology_retriever",
+            query_id,
+            prompt_version=self._prompt_version(),
+            used_llm=used_llm,
+            degraded=bool(degraded_reasons),
+            degraded_reasons=degraded_reasons,
+        )
 
         print(
             f"OntologyRAGRetrieverAgent finished for query_id={query_id}. "
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from typing import Dict, List, Sequence, Tuple
+
+from bugsy_multi_agent.analysis.incidence_matrix import IncidenceMatrix
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.attribute_store import load_attributes
+from bugsy_multi_agent.data_access.json_io import read_json
+from bugsy_multi_agent.data_access.scenario_coverage_store import (
+    save_corpus_coverage_report,
+    save_scenario_coverage_report,
+)
+from bugsy_multi_agent.data_access.scenario_store import load_scenarios
+from bugsy_multi_agent.models.attribute import Attribute
+from bugsy_multi_agent.models.reports import (
+    PriorityCoverageEntry,
+    ScenarioCoverageEntry,
+    ScenarioCoverageReport,
+)
+from bugsy_multi_agent.models.scenario import Scenario
+from bugsy_multi_agent.models.testing_context import TestingContext
+from bugsy_multi_agent.orchestration.agent_base import AgentBase
+
+
+class ScenarioCoverageCheckerAgent(AgentBase):
+    """
+    Строит отчёт по покрытию атрибутов сценариями.
+
+    По Scenario.attributes_covered собирается разреженная матрица
+    атрибут × сценарий (IncidenceMatrix), и все метрики считаются по ней
+    за линейное время:
+    - атрибуты без сценариев и сценарии без (известных) атрибутов;
+    - покрытие по приоритетам атрибутов;
+    - избыточность: сценарии, все атрибуты которых покрыты другими сценариями.
+
+    run_corpus() считает тот же отчёт по объединению нескольких query_id.
+    """
+
+    def __init__(self, settings: Settings | None = None) -> None:
+        super().__init__(settings=settings)
+
+    # ---------- загрузка данных ----------
+
+    def _load_testing_context(self, query_id: str) -> TestingContext:
+        path = self.settings.ontology_retriever_dir / f"{query_id}.json"
+        if not path.exists():
+            raise FileNotFoundError(
+                f"TestingContext file not found: {path}. "
+                f"Run OntologyRAGRetrieverAgent first."
+            )
+        raw = read_json(path)
+        return TestingContext.from_dict(raw)
+
+    def _load_attributes(self, query_id: str) -> List[Attribute]:
+        return load_attributes(self.settings, query_id)
+
+    def _load_scenarios(self, query_id: str) -> List[Scenario]:
+        return load_scenarios(self.settings, query_id)
+
+    # ---------- расчёт покрытия ----------
+
+    def _build_report(
+        self,
+        query: str,
+        attribute_rows: List[Tuple[str, str]],
+        scenario_columns: List[Tuple[str, Sequence[str]]],
+    ) -> ScenarioCoverageReport:
+        """
+        attribute_rows — пары (attribute_id, priority),
+        scenario_columns — пары (scenario_id, attributes_covered).
+        """
+        matrix = IncidenceMatrix.from_columns(
+            [attr_id for attr_id, _ in attribute_rows],
+            scenario_columns,
+        )
+        col_ids = matrix.col_ids
+        row_nnz = matrix.row_nnz()
+
+        attribute_coverage = [
+            ScenarioCoverageEntry(
+                attribute_id=attr_id,
+                scenario_ids=[col_ids[j] for j in matrix.row(i)],
+            )
+            for i, attr_id in enumerate(matrix.row_ids)
+        ]
+
+        # Приоритет строки матрицы — у первого атрибута с этим id
+        row_priority: Dict[str, str] = {}
+        for attr_id, priority in attribute_rows:
+            row_priority.setdefault(attr_id, priority)
+
+        priority_coverage: Dict[str, PriorityCoverageEntry] = {}
+        for attr_id, count in zip(matrix.row_ids, row_nnz):
+            priority = row_priority[attr_id]
+            entry = priority_coverage.get(priority)
+            if entry is None:
+                entry = PriorityCoverageEntry(priority=priority)
+                priority_coverage[priority] = entry
+            entry.total += 1
+            if count:
+                entry.covered += 1
+
+        report = ScenarioCoverageReport(
+            query=query,
+            attribute_coverage=attribute_coverage,
+            attributes_without_scenarios=matrix.empty_rows(),
+            scenarios_without_attributes=matrix.empty_cols(),
+            priority_coverage=dict(sorted(priority_coverage.items())),
+            redundant_scenarios=matrix.redundant_cols(),
+            duplicate_attribute_ids=matrix.duplicate_row_ids,
+        )
+
+        n_attrs, n_scenarios = matrix.shape
+        covered = n_attrs - len(report.attributes_without_scenarios)
+        per_priority = ", ".join(
+            f"{p}: {e.covered}/{e.total}" for p, e in report.priority_coverage.items()
+        )
+        avg_per_attr = matrix.nnz / n_attrs if n_attrs else 0.0
+        report.summary = (
+            f"Attributes: {n_attrs}. Covered: {covered}. "
+            f"Uncovered: {len(report.attributes_without_scenarios)}. "
+            f"Scenarios: {n_scenarios}. "
+            f"Without attributes: {len(report.scenarios_without_attributes)}. "
+            f"Redundant: {len(report.redundant_scenarios)}. "
+            f"Duplicate attribute ids: {len(report.duplicate_attribute_ids)}. "
+            f"By priority: {per_priority or '-'}. "
+            f"Avg scenarios per attribute: {avg_per_attr:.2f}."
+        )
+        return report
+
+    # ---------- главные методы ----------
+
+    def run(self, query_id: str) -> ScenarioCoverageReport:
+        """
+        Строит отчёт по покрытию атрибутов сценариями для query_id
+        и сохраняет его в JSON.
+        """
+        ctx = self._load_testing_context(query_id)
+        attributes = self._load_attributes(query_id)
+        scenarios = self._load_scenarios(query_id)
+
+        report = self._build_report(
+            ctx.query,
+            [(a.id, a.priority) for a in attributes],
+            [(sc.id, sc.attributes_covered) for sc in scenarios],
+        )
+
+        out_path = save_scenario_coverage_report(self.settings, query_id, report)
+
+        print(
+            f"ScenarioCoverageCheckerAgent finished for query_id={query_id}. "
+            f"Uncovered attributes={len(report.attributes_without_scenarios)}, "
+            f"scenarios without attributes={len(report.scenarios_without_attributes)}. "
+            f"Output: {out_path}"
+        )
+
+        return report
+
+    def run_corpus(
+        self,
+        query_ids: List[str],
+        corpus_id: str = "corpus",
+    ) -> ScenarioCoverageReport:
+        """
+        Отчёт по объединённому корпусу нескольких query_id.
+
+        Id атрибутов и сценариев локальны для запроса (EVT-001 есть почти везде),
+        поэтому в корпусе они получают префикс: "{query_id}/{id}".
+        Результат сохраняется как corpus/scenario_coverage_{corpus_id}.json
+        (отдельно от отчётов отдельных query_id).
+        """
+        attribute_rows: List[Tuple[str, str]] = []
+        scenario_columns: List[Tuple[str, List[str]]] = []
+
+        for query_id in query_ids:
+            for attr in self._load_attributes(query_id):
+                attribute_rows.append((f"{query_id}/{attr.id}", attr.priority))
+            for sc in self._load_scenarios(query_id):
+                scenario_columns.append(
+                    (
+                        f"{query_id}/{sc.id}",
+                        [f"{query_id}/{ref}" for ref in sc.attributes_covered],
+                    )
+                )
+
+        report = self._build_report(corpus_id, attribute_rows, scenario_columns)
+        out_path = save_corpus_coverage_report(self.settings, corpus_id, report)
+
+        print(
+            f"ScenarioCoverageCheckerAgent corpus report for {len(query_ids)} queries. "
+            f"{report.summary} Output: {out_path}"
+        )
+
+        return report
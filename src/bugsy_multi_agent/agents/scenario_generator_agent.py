@@ -1,15 +1,30 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Dict, List, Set, Tuple
 
+from bugsy_multi_agent.analysis.delta import attribute_hash, changed_keys, next_id_number
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
 from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.artifact_meta_store import (
+    load_artifact_meta,
+    update_artifact_meta,
+)
 from bugsy_multi_agent.data_access.attribute_store import load_attributes
 from bugsy_multi_agent.data_access.json_io import read_json
 from bugsy_multi_agent.data_access.query_mapping import get_query_text
-from bugsy_multi_agent.data_access.scenario_store import save_scenarios
-from bugsy_multi_agent.llm.client import DeepSeekLLMClient
-from bugsy_multi_agent.llm.json_utils import extract_json_from_text
-from bugsy_multi_agent.llm.prompts_scenarios import build_scenario_generator_prompt
+from bugsy_multi_agent.data_access.scenario_store import (
+    get_scenarios_path,
+    load_scenarios,
+    save_scenarios,
+)
+from bugsy_multi_agent.llm.client import LLMClient
+from bugsy_multi_agent.llm.json_utils import extract_json_from_text, unwrap_json_list
+from bugsy_multi_agent.llm.parallel import map_parallel
+from bugsy_multi_agent.llm.repair import validate_items_with_repair
+from bugsy_multi_agent.llm.prompts_scenarios import (
+    SCENARIO_GENERATOR_PROMPT_VERSION,
+    build_scenario_generator_prompt_parts,
+)
 from bugsy_multi_agent.models.attribute import Attribute
 from bugsy_multi_agent.models.scenario import Scenario
 from bugsy_multi_agent.models.testing_context import TestingContext
@@ -23,11 +38,24 @@ class ScenarioGeneratorAgent(AgentBase):
     Порядок:
     - пробуем LLM (DeepSeek),
     - при ошибке откатываемся на заглушку: один сценарий на атрибут.
+
+    При settings.scenario_sharded_generation атрибуты делятся на шарды
+    (общие source_section_ids в пределах одного priority, не больше
+    scenario_shard_max_attributes атрибутов), сценарии для шардов генерируются
+    параллельно и затем сводятся с дедупликацией и глобальными id SCN-.
+
+    При settings.incremental_generation атрибуты сравниваются с предыдущим
+    запуском по хешам содержимого (meta/scenario_generator_{query_id}.json):
+    перегенерируются только сценарии, покрывающие изменившиеся атрибуты;
+    остальные сценарии и их id не меняются.
     """
 
-    def __init__(self, settings: Settings | None = None) -> None:
-        super().__init__(settings=settings)
-        self.llm_client = DeepSeekLLMClient()
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        llm_client: LLMClient | None = None,
+    ) -> None:
+        super().__init__(settings=settings, llm_client=llm_client)
 
     def _load_testing_context(self, query_id: str) -> TestingContext:
         path = self.settings.ontology_retriever_dir / f"{query_id}.json"
@@ -82,32 +110,319 @@ class ScenarioGeneratorAgent(AgentBase):
 
         return scenarios
 
+    def _prompt_version(self) -> str:
+        """
+        Версия промпта для метаданных: шаблон из data/prompts или встроенный.
+        """
+        template = self.prompt_template("scenario_generator")
+        if template is not None:
+            return template.version_tag
+        return f"scenario_generator@{SCENARIO_GENERATOR_PROMPT_VERSION}"
+
+    def _parse_scenarios(
+        self,
+        response_text: str,
+        llm_client: LLMClient | None = None,
+        repair: bool = True,
+    ) -> List[Scenario]:
+        # В JSON-режиме список приходит в обёртке {"scenarios": [...]}
+        data = unwrap_json_list(extract_json_from_text(response_text), "scenarios")
+
+        if not isinstance(data, list):
+            raise ValueError("LLM response is not a JSON array for Scenario list")
+
+        # Невалидные элементы исправляются коротким repair-промптом,
+        # валидные сохраняются
+        return validate_items_with_repair(
+            data,
+            Scenario,
+            llm_client or self.llm_client,
+            max_rounds=self.settings.llm_repair_max_rounds if repair else 0,
+            json_object=self.settings.llm_json_mode,
+        )
+
+    def _check_scenarios(
+        self,
+        attributes: List[Attribute],
+        scenarios: List[Scenario],
+    ) -> str | None:
+        """
+        Проверка качества ответа для каскада моделей: None или причина отказа.
+        Доля покрытых атрибутов — не меньше llm_cascade_min_scenario_coverage.
+        """
+        if not scenarios:
+            return "no scenarios"
+        known = {a.id for a in attributes}
+        covered = {aid for s in scenarios for aid in s.attributes_covered}
+        unknown = sorted(covered - known)
+        if unknown:
+            return f"unknown attribute ids: {', '.join(unknown)}"
+        coverage = len(covered) / len(known) if known else 1.0
+        if coverage < self.settings.llm_cascade_min_scenario_coverage:
+            return f"attribute coverage {coverage:.0%}"
+        return None
+
     def _generate_scenarios_with_llm(
         self,
         ctx: TestingContext,
         attributes: List[Attribute],
         display_query: str,
     ) -> List[Scenario]:
-        prompt = build_scenario_generator_prompt(
-            ctx=ctx,
-            attributes=attributes,
-            query_override=display_query,
+        # Шаблоны из data/prompts просят голый массив — JSON-режим только для встроенного
+        template = self.prompt_template("scenario_generator")
+        json_mode = self.settings.llm_json_mode and template is None
+        prompt = self.prompt_text(
+            build_scenario_generator_prompt_parts(
+                ctx=ctx,
+                attributes=attributes,
+                query_override=display_query,
+                envelope_key="scenarios" if json_mode else None,
+                template=template,
+                compressor=self.prompt_compressor(),
+            )
+        )
+        return self.generate_with_cascade(
+            "scenario_generator",
+            prompt,
+            self._parse_scenarios,
+            json_object=json_mode,
+            check=lambda scenarios: self._check_scenarios(attributes, scenarios),
         )
-        response_text = self.llm_client.generate(prompt)
-        data = extract_json_from_text(response_text)
 
-        if not isinstance(data, list):
-            raise ValueError("LLM response is not a JSON array for Scenario list")
+    # ---------- генерация по шардам ----------
 
-        scenarios: List[Scenario] = []
-        for obj in data:
-            if not isinstance(obj, dict):
-                raise ValueError("Scenario item is not a JSON object")
-            scenarios.append(Scenario.from_dict(obj))
+    def _shard_attributes(self, attributes: List[Attribute]) -> List[List[Attribute]]:
+        """
+        Группирует атрибуты в шарды:
+        - атрибуты одного priority, ссылающиеся на общие секции, попадают в одну группу
+          (связные компоненты по source_section_ids);
+        - группы упаковываются в шарды не больше scenario_shard_max_attributes,
+          слишком большая группа режется на части.
+        Порядок атрибутов внутри шарда сохраняется.
+        """
+        max_size = max(1, self.settings.scenario_shard_max_attributes)
 
-        return scenarios
+        parent = list(range(len(attributes)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        first_by_section: Dict[Tuple[str, str], int] = {}
+        for idx, attr in enumerate(attributes):
+            for section_id in attr.source_section_ids:
+                key = (attr.priority, section_id)
+                other = first_by_section.setdefault(key, idx)
+                parent[find(idx)] = find(other)
+
+        groups: Dict[int, List[Attribute]] = {}
+        for idx, attr in enumerate(attributes):
+            groups.setdefault(find(idx), []).append(attr)
+
+        shards: List[List[Attribute]] = []
+        current: List[Attribute] = []
+        for group in groups.values():
+            if len(group) > max_size:
+                shards.extend(
+                    group[i:i + max_size] for i in range(0, len(group), max_size)
+                )
+                continue
+            if current and len(current) + len(group) > max_size:
+                shards.append(current)
+                current = []
+            current.extend(group)
+        if current:
+            shards.append(current)
+
+        return shards
+
+    @staticmethod
+    def _shard_context(ctx: TestingContext, shard: List[Attribute]) -> TestingContext:
+        """
+        Копия контекста только с passages, на которые ссылаются атрибуты шарда.
+        Если атрибуты ни на что не ссылаются, контекст остаётся полным.
+        """
+        section_ids = {s for attr in shard for s in attr.source_section_ids}
+        core = [p for p in ctx.core_passages if p.section_id in section_ids]
+        supp = [p for p in ctx.supporting_passages if p.section_id in section_ids]
+        if not core and not supp:
+            return ctx
+        return ctx.model_copy(
+            update={"core_passages": core, "supporting_passages": supp}
+        )
+
+    @staticmethod
+    def merge_scenario_shards(shards: List[List[Scenario]]) -> List[Scenario]:
+        """
+        Сводит сценарии шардов в один список:
+        - дубли (одинаковые title, steps и expected_result после нормализации)
+          склеиваются, attributes_covered объединяются;
+        - id перенумеровываются глобально: SCN-001, SCN-002, ...
+        """
+        merged: List[Scenario] = []
+        by_key: Dict[str, int] = {}
+
+        for shard in shards:
+            for scenario in shard:
+                key = normalized_digest(
+                    [scenario.title, *scenario.steps, scenario.expected_result]
+                )
+                pos = by_key.get(key)
+                if pos is None:
+                    by_key[key] = len(merged)
+                    merged.append(scenario)
+                    continue
+
+                existing = merged[pos]
+                covered = list(existing.attributes_covered)
+                covered += [a for a in scenario.attributes_covered if a not in covered]
+                merged[pos] = existing.model_copy(
+                    update={"attributes_covered": covered}
+                )
+
+        return [
+            scenario.model_copy(update={"id": f"SCN-{idx:03d}"})
+            for idx, scenario in enumerate(merged, start=1)
+        ]
+
+    def _generate_scenarios_sharded(
+        self,
+        ctx: TestingContext,
+        attributes: List[Attribute],
+        display_query: str,
+    ) -> List[Scenario]:
+        """
+        Параллельная генерация по шардам. Для упавшего шарда используется
+        заглушка (по сценарию на атрибут), чтобы его атрибуты не остались
+        без покрытия; если упали все шарды — пробрасывается первая ошибка.
+        """
+        shards = self._shard_attributes(attributes)
+        results = map_parallel(
+            lambda shard: self._generate_scenarios_with_llm(
+                ctx=self._shard_context(ctx, shard),
+                attributes=shard,
+                display_query=display_query,
+            ),
+            shards,
+            max_workers=self.settings.llm_max_concurrency,
+        )
+
+        shard_scenarios: List[List[Scenario]] = []
+        errors: List[Exception] = []
+        for idx, (shard, result) in enumerate(zip(shards, results), start=1):
+            if isinstance(result, Exception):
+                print(
+                    f"ScenarioGeneratorAgent: shard {idx}/{len(shards)} failed: "
+                    f"{result}. Using stub for its {len(shard)} attributes."
+                )
+                self.note_degraded(result)
+                errors.append(result)
+                shard_scenarios.append(self._generate_scenarios_stub(ctx, shard))
+            else:
+                shard_scenarios.append(result)
+
+        if errors and len(errors) == len(shards):
+            raise errors[0]
+
+        print(
+            f"ScenarioGeneratorAgent: sharded generation, "
+            f"{len(shards) - len(errors)}/{len(shards)} shards succeeded."
+        )
+        return self.merge_scenario_shards(shard_scenarios)
+
+    def _generate_scenarios(
+        self,
+        query_id: str,
+        ctx: TestingContext,
+        attributes: List[Attribute],
+        display_query: str,
+    ) -> Tuple[List[Scenario], bool]:
+        """
+        LLM (целиком или по шардам); при ошибке — заглушка.
+        Возвращает (сценарии, used_llm).
+        """
+        try:
+            if self.settings.scenario_sharded_generation and attributes:
+                scenarios = self._generate_scenarios_sharded(
+                    ctx=ctx,
+                    attributes=attributes,
+                    display_query=display_query,
+                )
+            else:
+                scenarios = self._generate_scenarios_with_llm(
+                    ctx=ctx,
+                    attributes=attributes,
+                    display_query=display_query,
+                )
+            return scenarios, True
+        except Exception as e:
+            print(
+                f"ScenarioGeneratorAgent: LLM failed for query_id={query_id}: {e}. "
+                f"Falling back to stub."
+            )
+            self.note_degraded(e)
+            return self._generate_scenarios_stub(ctx, attributes), False
+
+    # ---------- инкрементальная перегенерация ----------
+
+    def _load_previous_scenarios(self, query_id: str) -> List[Scenario] | None:
+        if not get_scenarios_path(self.settings, query_id).exists():
+            return None
+        try:
+            return load_scenarios(self.settings, query_id)
+        except Exception as e:
+            print(
+                f"ScenarioGeneratorAgent: previous scenarios for "
+                f"query_id={query_id} are unreadable: {e}. Regenerating all."
+            )
+            return None
+
+    def _generate_scenarios_incremental(
+        self,
+        query_id: str,
+        ctx: TestingContext,
+        attributes: List[Attribute],
+        display_query: str,
+        previous: List[Scenario],
+        changed: Set[str],
+    ) -> Tuple[List[Scenario], bool]:
+        """
+        Перегенерирует только сценарии, затронутые изменившимися атрибутами.
+
+        - сценарии, не покрывающие изменившиеся (или удалённые) атрибуты, остаются;
+        - новые сценарии генерируются для изменившихся атрибутов и для атрибутов,
+          которые после удаления старых сценариев остались без покрытия;
+        - новые сценарии получают следующие свободные номера SCN-.
+        """
+        kept = [s for s in previous if not changed & set(s.attributes_covered)]
+        covered = {attr_id for s in kept for attr_id in s.attributes_covered}
+        pending = [a for a in attributes if a.id in changed or a.id not in covered]
+
+        if pending:
+            regenerated, used_llm = self._generate_scenarios(
+                query_id, ctx, pending, display_query
+            )
+        else:
+            regenerated, used_llm = [], False
+
+        next_number = next_id_number(s.id for s in previous)
+        scenarios = list(kept)
+        for offset, scenario in enumerate(regenerated):
+            scenarios.append(
+                scenario.model_copy(update={"id": f"SCN-{next_number + offset:03d}"})
+            )
+
+        print(
+            f"ScenarioGeneratorAgent: incremental run for query_id={query_id}: "
+            f"{len(changed)} changed attributes, kept {len(kept)} scenarios, "
+            f"generated {len(regenerated)} for {len(pending)} attributes."
+        )
+        return scenarios, used_llm
 
     def run(self, query_id: str) -> List[Scenario]:
+        self.take_degraded_reasons()
         ctx = self._load_testing_context(query_id)
         attributes = self._load_attributes(query_id)
 
@@ -117,22 +432,48 @@ class ScenarioGeneratorAgent(AgentBase):
             fallback=ctx.query,
         )
 
-        try:
-            scenarios = self._generate_scenarios_with_llm(
-                ctx=ctx,
-                attributes=attributes,
-                display_query=display_query,
+        hashes = {attr.id: attribute_hash(attr) for attr in attributes}
+
+        previous = None
+        old_hashes: Dict[str, str] = {}
+        if self.settings.incremental_generation:
+            meta = load_artifact_meta(self.settings, "scenario_generator", query_id)
+            old_hashes = meta.get("attribute_hashes") or {}
+            # Деградировавший артефакт или артефакт другой версии промпта
+            # не годится как основа — генерируем заново
+            if (
+                old_hashes
+                and not meta.get("degraded")
+                and meta.get("prompt_version") == self._prompt_version()
+            ):
+                previous = self._load_previous_scenarios(query_id)
+
+        if previous is not None:
+            scenarios, used_llm = self._generate_scenarios_incremental(
+                query_id,
+                ctx,
+                attributes,
+                display_query,
+                previous,
+                changed_keys(old_hashes, hashes),
             )
-            used_llm = True
-        except Exception as e:
-            print(
-                f"ScenarioGeneratorAgent: LLM failed for query_id={query_id}: {e}. "
-                f"Falling back to stub."
+        else:
+            scenarios, used_llm = self._generate_scenarios(
+                query_id, ctx, attributes, display_query
             )
-            scenarios = self._generate_scenarios_stub(ctx, attributes)
-            used_llm = False
 
         out_path = save_scenarios(self.settings, query_id, scenarios)
+        degraded_reasons = self.take_degraded_reasons()
+        update_artifact_meta(
+            self.settings,
+            "scenario_generator",
+            query_id,
+            attribute_hashes=hashes,
+            prompt_version=self._prompt_version(),
+            used_llm=used_llm,
+            degraded=bool(degraded_reasons),
+            degraded_reasons=degraded_reasons,
+        )
 
         print(
             f"ScenarioGeneratorAgent finished for query_id={query_id}. "
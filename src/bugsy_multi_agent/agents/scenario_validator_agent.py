@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from typing import Dict, List, Set
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.attribute_store import load_attributes
+from bugsy_multi_agent.data_access.scenario_store import load_scenarios
+from bugsy_multi_agent.data_access.scenario_validation_store import (
+    save_scenario_validation_report,
+)
+from bugsy_multi_agent.models.attribute import Attribute
+from bugsy_multi_agent.models.reports import ValidationIssue, ValidationReport
+from bugsy_multi_agent.models.scenario import Scenario
+from bugsy_multi_agent.orchestration.agent_base import AgentBase
+
+
+class ScenarioValidatorAgent(AgentBase):
+    """
+    Проверяет сгенерированные сценарии за один проход:
+    - уникальность id
+    - ссылки attributes_covered на существующие атрибуты
+    - наличие шагов и отсутствие пустых шагов
+    - непустой expected_result
+    - дубли последовательностей шагов (по хешу нормализованных шагов)
+
+    Множество id атрибутов и словари уже встреченных id / хешей шагов
+    строятся по ходу прохода, поэтому проверка линейна по размеру сценариев.
+    """
+
+    def __init__(self, settings: Settings | None = None) -> None:
+        super().__init__(settings=settings)
+
+    # ---------- загрузка данных ----------
+
+    def _load_attributes(self, query_id: str) -> List[Attribute]:
+        return load_attributes(self.settings, query_id)
+
+    def _load_scenarios(self, query_id: str) -> List[Scenario]:
+        return load_scenarios(self.settings, query_id)
+
+    # ---------- проверки ----------
+
+    def _validate(
+        self,
+        scenarios: List[Scenario],
+        valid_attribute_ids: Set[str],
+        report: ValidationReport,
+    ) -> None:
+        # id -> сколько раз встретился; хеш шагов -> id первого сценария
+        seen_ids: Dict[str, int] = {}
+        seen_steps: Dict[str, str] = {}
+
+        for sc in scenarios:
+            count = seen_ids.get(sc.id, 0) + 1
+            seen_ids[sc.id] = count
+            if count == 2:
+                report.add_issue(
+                    ValidationIssue(
+                        severity="error",
+                        code="DUPLICATE_ID",
+                        message=f"Scenario id '{sc.id}' is not unique.",
+                        object_type="scenario",
+                        object_id=sc.id,
+                        field="id",
+                    )
+                )
+
+            for attr_id in sc.attributes_covered:
+                if attr_id not in valid_attribute_ids:
+                    report.add_issue(
+                        ValidationIssue(
+                            severity="error",
+                            code="UNKNOWN_ATTRIBUTE_REF",
+                            message=(
+                                f"Scenario '{sc.id}' references "
+                                f"unknown attribute id '{attr_id}'."
+                            ),
+                            object_type="scenario",
+                            object_id=sc.id,
+                            field="attributes_covered",
+                        )
+                    )
+
+            if not sc.steps:
+                report.add_issue(
+                    ValidationIssue(
+                        severity="error",
+                        code="EMPTY_STEPS",
+                        message="Scenario must have at least one step.",
+                        object_type="scenario",
+                        object_id=sc.id,
+                        field="steps",
+                    )
+                )
+            elif any(not step.strip() for step in sc.steps):
+                report.add_issue(
+                    ValidationIssue(
+                        severity="error",
+                        code="EMPTY_STEP",
+                        message="Scenario steps must not be empty strings.",
+                        object_type="scenario",
+                        object_id=sc.id,
+                        field="steps",
+                    )
+                )
+
+            if not sc.expected_result.strip():
+                report.add_issue(
+                    ValidationIssue(
+                        severity="error",
+                        code="EMPTY_EXPECTED_RESULT",
+                        message="Scenario expected_result must not be empty.",
+                        object_type="scenario",
+                        object_id=sc.id,
+                        field="expected_result",
+                    )
+                )
+
+            if sc.steps:
+                digest = normalized_digest(sc.steps)
+                first_id = seen_steps.setdefault(digest, sc.id)
+                if first_id != sc.id:
+                    report.add_issue(
+                        ValidationIssue(
+                            severity="warning",
+                            code="DUPLICATE_STEPS",
+                            message=(
+                                f"Scenario '{sc.id}' has the same step sequence "
+                                f"as '{first_id}'."
+                            ),
+                            object_type="scenario",
+                            object_id=sc.id,
+                            field="steps",
+                        )
+                    )
+
+    # ---------- главный метод ----------
+
+    def run(self, query_id: str) -> ValidationReport:
+        """
+        Загружает attributes и scenarios, выполняет проверки
+        и сохраняет ValidationReport.
+        """
+        attributes = self._load_attributes(query_id)
+        scenarios = self._load_scenarios(query_id)
+
+        report = ValidationReport(is_valid=True, issues=[], summary="")
+        valid_attribute_ids: Set[str] = {a.id for a in attributes}
+
+        self._validate(scenarios, valid_attribute_ids, report)
+
+        if not report.issues:
+            report.summary = (
+                f"{len(scenarios)} scenarios validated. No issues found."
+            )
+        else:
+            error_count = sum(1 for i in report.issues if i.severity == "error")
+            warning_count = sum(1 for i in report.issues if i.severity == "warning")
+            report.summary = (
+                f"{len(scenarios)} scenarios validated. "
+                f"Errors: {error_count}, warnings: {warning_count}."
+            )
+
+        out_path = save_scenario_validation_report(self.settings, query_id, report)
+
+        print(
+            f"ScenarioValidatorAgent finished for query_id={query_id}. "
+            f"Valid={report.is_valid}. Issues={len(report.issues)}. "
+            f"Output: {out_path}"
+        )
+
+        return report
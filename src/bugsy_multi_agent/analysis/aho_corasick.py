@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, List, Set
+
+
+class AhoCorasick:
+    """
+    Автомат Ахо–Корасик для поиска многих подстрок за один проход по тексту.
+
+    Построение — O(суммарной длины паттернов), поиск — O(длины текста + число
+    совпадений), независимо от количества паттернов. Паттерны идентифицируются
+    индексом в исходном списке; пустые паттерны игнорируются.
+    """
+
+    def __init__(self, patterns: List[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pattern_id)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self) -> None:
+        queue: deque[int] = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # Совпадения суффиксов наследуются по ссылке неудачи
+                if self._out[self._fail[child]]:
+                    self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str) -> Set[int]:
+        """
+        Множество id паттернов, встретившихся в text.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
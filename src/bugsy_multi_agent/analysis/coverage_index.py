@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_tokens
+from bugsy_multi_agent.models.attribute import Attribute
+
+
+def _attribute_text(attr: Attribute) -> Iterable[str]:
+    yield attr.name
+    yield attr.description
+    yield attr.positive_example
+    yield attr.negative_example
+    yield from attr.source_quotes
+
+
+class AttributeCoverageIndex:
+    """
+    Инвертированные индексы по списку атрибутов, строятся за один проход:
+
+    - section_id -> id атрибутов, ссылающихся на секцию (source_section_ids);
+    - нормализованный токен -> id атрибутов, в тексте которых он встречается.
+
+    Построение линейно по суммарному размеру атрибутов, запрос по секции — O(1),
+    запрос по сущности — пересечение постинг-листов её токенов.
+    Id атрибутов в ответах идут в порядке исходного списка.
+    """
+
+    def __init__(self, attributes: List[Attribute]) -> None:
+        self.section_index: Dict[str, List[str]] = {}
+        self.token_index: Dict[str, List[str]] = {}
+        # Позиция атрибута в исходном списке: для упорядочивания пересечений
+        self._order: Dict[str, int] = {}
+
+        for pos, attr in enumerate(attributes):
+            self._order.setdefault(attr.id, pos)
+
+            for section_id in attr.source_section_ids:
+                postings = self.section_index.setdefault(section_id, [])
+                # Атрибуты обходятся по порядку, поэтому дубль может быть только последним
+                if not postings or postings[-1] != attr.id:
+                    postings.append(attr.id)
+
+            for text in _attribute_text(attr):
+                for token in normalized_tokens(text):
+                    postings = self.token_index.setdefault(token, [])
+                    if not postings or postings[-1] != attr.id:
+                        postings.append(attr.id)
+
+    def attributes_for_section(self, section_id: str) -> List[str]:
+        return list(self.section_index.get(section_id, []))
+
+    def attributes_for_entity(self, entity: str) -> List[str]:
+        """
+        Атрибуты, в тексте которых встречаются все нормализованные токены сущности.
+        """
+        tokens = set(normalized_tokens(entity))
+        if not tokens:
+            return []
+
+        postings = sorted(
+            (self.token_index.get(token, []) for token in tokens),
+            key=len,
+        )
+        if not postings[0]:
+            return []
+
+        # Пересекаем, начиная с самого короткого постинг-листа
+        result = set(postings[0])
+        for other in postings[1:]:
+            result.intersection_update(other)
+            if not result:
+                return []
+
+        return sorted(result, key=self._order.__getitem__)
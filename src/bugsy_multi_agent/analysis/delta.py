@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, Mapping, Set
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
+from bugsy_multi_agent.models.attribute import Attribute
+from bugsy_multi_agent.models.testing_context import TestingContext
+
+
+_ID_NUMBER_RE = re.compile(r"(\d+)$")
+
+
+def section_hashes(ctx: TestingContext, raw_context: Mapping[str, Any]) -> Dict[str, str]:
+    """
+    section_id -> хеш секции для passages контекста.
+
+    Хешируется исходный текст секции из data/contexts (он не зависит от того,
+    как LLM переформулировала summary); если секции там нет — title + summary.
+    """
+    texts = {
+        sec.get("section_id", f"sec_{idx}"): sec.get("text", "")
+        for idx, sec in enumerate(raw_context.get("section_candidates", []))
+    }
+    hashes: Dict[str, str] = {}
+    for passage in [*ctx.core_passages, *ctx.supporting_passages]:
+        if passage.section_id in texts:
+            hashes[passage.section_id] = normalized_digest([texts[passage.section_id]])
+        else:
+            hashes[passage.section_id] = normalized_digest([passage.title, passage.summary])
+    return hashes
+
+
+def attribute_hash(attr: Attribute) -> str:
+    """
+    Хеш содержимого атрибута (без id) — по нему видно, менялся ли атрибут.
+    """
+    return normalized_digest(
+        [
+            attr.name,
+            attr.type,
+            attr.priority,
+            attr.description,
+            attr.positive_example,
+            attr.negative_example,
+            *attr.source_section_ids,
+        ]
+    )
+
+
+def changed_keys(old: Dict[str, str], new: Dict[str, str]) -> Set[str]:
+    """
+    Ключи, которые появились, исчезли или у которых изменился хеш.
+    """
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+
+def next_id_number(ids: Iterable[str]) -> int:
+    """
+    Номер для следующего id: максимум числовых суффиксов (EVT-007 -> 7) плюс один.
+    """
+    numbers = [int(m.group(1)) for m in map(_ID_NUMBER_RE.search, ids) if m]
+    return max(numbers, default=0) + 1
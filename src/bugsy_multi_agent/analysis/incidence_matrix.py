@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+class IncidenceMatrix:
+    """
+    Разреженная булева матрица атрибут × сценарий в формате CSR (как scipy.sparse.csr_matrix):
+
+    - строки — атрибуты (row_ids), столбцы — сценарии (col_ids);
+    - indptr[i]:indptr[i + 1] — диапазон в indices со столбцами строки i;
+    - col_nnz[j] — число атрибутов сценария j.
+
+    Построение — подсчётом (counting sort) за O(число атрибутов + сценариев + связей),
+    без Python-объектов на каждую связь: массивы array('l').
+    Ссылки сценариев на неизвестные атрибуты в матрицу не попадают
+    и учитываются в unknown_refs. Повторяющиеся id строк схлопываются в одну
+    строку (первое вхождение) и перечисляются в duplicate_row_ids.
+    """
+
+    def __init__(
+        self,
+        row_ids: List[str],
+        col_ids: List[str],
+        indptr: array,
+        indices: array,
+        col_nnz: array,
+        unknown_refs: int = 0,
+        duplicate_row_ids: List[str] | None = None,
+    ) -> None:
+        self.row_ids = row_ids
+        self.col_ids = col_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.col_nnz = col_nnz
+        self.unknown_refs = unknown_refs
+        self.duplicate_row_ids = duplicate_row_ids or []
+
+    @classmethod
+    def from_columns(
+        cls,
+        row_ids: List[str],
+        columns: Iterable[Tuple[str, Sequence[str]]],
+    ) -> "IncidenceMatrix":
+        """
+        Строит матрицу по столбцам: columns — пары (col_id, список row_id).
+        Повторы row_id внутри одного столбца схлопываются.
+        """
+        # Повтор id в row_ids дал бы строку, на которую не ведёт ни одна
+        # ссылка, — ложный «непокрытый» атрибут; оставляем первое вхождение
+        row_pos: Dict[str, int] = {}
+        duplicate_row_ids: List[str] = []
+        for row_id in row_ids:
+            if row_id in row_pos:
+                if row_id not in duplicate_row_ids:
+                    duplicate_row_ids.append(row_id)
+                continue
+            row_pos[row_id] = len(row_pos)
+        row_ids = list(row_pos)
+
+        col_ids: List[str] = []
+        col_nnz = array("l")
+        # Координаты ненулевых элементов в порядке столбцов (COO)
+        coo_rows = array("l")
+        coo_cols = array("l")
+        unknown_refs = 0
+
+        for col, (col_id, refs) in enumerate(columns):
+            col_ids.append(col_id)
+            seen: set[int] = set()
+            for ref in refs:
+                row = row_pos.get(ref)
+                if row is None:
+                    unknown_refs += 1
+                    continue
+                if row in seen:
+                    continue
+                seen.add(row)
+                coo_rows.append(row)
+                coo_cols.append(col)
+            col_nnz.append(len(seen))
+
+        # COO -> CSR подсчётом
+        n_rows = len(row_ids)
+        indptr = array("l", [0]) * (n_rows + 1)
+        for row in coo_rows:
+            indptr[row + 1] += 1
+        for i in range(n_rows):
+            indptr[i + 1] += indptr[i]
+
+        indices = array("l", [0]) * len(coo_rows)
+        fill = array("l", indptr[:n_rows])
+        for row, col in zip(coo_rows, coo_cols):
+            indices[fill[row]] = col
+            fill[row] += 1
+
+        return cls(
+            row_ids, col_ids, indptr, indices, col_nnz, unknown_refs, duplicate_row_ids
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.row_ids), len(self.col_ids)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    def row_nnz(self) -> List[int]:
+        """
+        Число сценариев на каждый атрибут (сумма по строкам).
+        """
+        indptr = self.indptr
+        return [indptr[i + 1] - indptr[i] for i in range(len(self.row_ids))]
+
+    def row(self, i: int) -> List[int]:
+        """
+        Индексы столбцов (сценариев) строки i.
+        """
+        return list(self.indices[self.indptr[i]:self.indptr[i + 1]])
+
+    def empty_rows(self) -> List[str]:
+        indptr = self.indptr
+        return [
+            row_id
+            for i, row_id in enumerate(self.row_ids)
+            if indptr[i + 1] == indptr[i]
+        ]
+
+    def empty_cols(self) -> List[str]:
+        return [
+            col_id
+            for col_id, nnz in zip(self.col_ids, self.col_nnz)
+            if nnz == 0
+        ]
+
+    def redundant_cols(self) -> List[str]:
+        """
+        Столбцы (сценарии), все строки которых покрыты ещё хотя бы одним столбцом.
+        Каждый такой сценарий по отдельности можно убрать без потери покрытия.
+        """
+        row_nnz = self.row_nnz()
+        # Столбец избыточен, если в нём нет строки с единственным покрытием
+        has_unique_row = bytearray(len(self.col_ids))
+        for i, count in enumerate(row_nnz):
+            if count == 1:
+                has_unique_row[self.indices[self.indptr[i]]] = 1
+
+        return [
+            col_id
+            for j, col_id in enumerate(self.col_ids)
+            if self.col_nnz[j] > 0 and not has_unique_row[j]
+        ]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+from array import array
+from typing import Dict, List, Set, Tuple
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_tokens
+
+
+_EMPTY_HASH = (1 << 32) - 1
+
+# Один blake2b-дайджест (64 байта) даёт 16 независимых 32-битных хешей
+_HASHES_PER_DIGEST = 16
+
+
+def shingles(text: str, k: int = 2) -> Set[str]:
+    """
+    Множество словных k-шинглов по нормализованным токенам.
+    Для текста короче k токенов возвращаются сами токены.
+    """
+    tokens = normalized_tokens(text)
+    if len(tokens) < k:
+        return set(tokens)
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры фиксированной длины num_perm.
+
+    Вместо num_perm отдельных хеш-функций на каждый шингл считается
+    num_perm / 16 дайджестов blake2b с разными salt: каждый 64-байтный дайджест
+    режется на 16 32-битных значений. Хеширование и поэлементный минимум идут
+    в C (hashlib, array, map(min, zip(...))), поэтому сигнатура считается
+    на порядок быстрее, чем через Python-цикл по перестановкам.
+    Соль фиксирована — сигнатуры воспроизводимы между запусками.
+    """
+
+    def __init__(self, num_perm: int = 64) -> None:
+        if num_perm % _HASHES_PER_DIGEST != 0:
+            raise ValueError(f"num_perm must be a multiple of {_HASHES_PER_DIGEST}")
+        self.num_perm = num_perm
+        self._salts = [
+            i.to_bytes(2, "little") for i in range(num_perm // _HASHES_PER_DIGEST)
+        ]
+
+    def _hash_values(self, item: str) -> array:
+        data = item.encode("utf-8")
+        values = array("I")
+        for salt in self._salts:
+            values.frombytes(hashlib.blake2b(data, digest_size=64, salt=salt).digest())
+        return values
+
+    def signature(self, items: Set[str]) -> Tuple[int, ...]:
+        if not items:
+            return tuple([_EMPTY_HASH] * self.num_perm)
+        return tuple(map(min, zip(*(self._hash_values(item) for item in items))))
+
+
+def estimated_jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """
+    Оценка сходства Жаккара: доля совпавших позиций сигнатур.
+    """
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / len(sig_a)
+
+
+def find_near_duplicate_clusters(
+    texts: List[str],
+    threshold: float = 0.7,
+    num_perm: int = 64,
+    bands: int = 16,
+) -> List[List[int]]:
+    """
+    Кластеры почти-дубликатов среди texts (списки индексов, от двух элементов).
+
+    LSH: сигнатура режется на bands полос по num_perm // bands строк; тексты,
+    совпавшие хотя бы в одной полосе, становятся кандидатами и проверяются
+    оценкой Жаккара по полной сигнатуре. Вместо O(n^2) сравнений всех пар
+    проверяются только кандидаты из общих корзин, а кластеры собираются
+    через union-find. Тексты без шинглов ни с чем не объединяются.
+    """
+    if num_perm % bands != 0:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+
+    hasher = MinHasher(num_perm=num_perm)
+    shingle_sets = [shingles(text) for text in texts]
+    signatures = [hasher.signature(items) for items in shingle_sets]
+
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets: Dict[Tuple[int, ...], List[int]] = {}
+        start = band * rows
+        for idx, sig in enumerate(signatures):
+            # Пустое множество шинглов (пунктуация, однобуквенные токены) даёт
+            # одинаковую сигнатуру для всех таких текстов — это не дубликаты
+            if not shingle_sets[idx]:
+                continue
+            buckets.setdefault(sig[start:start + rows], []).append(idx)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            # Каждый элемент сравнивается только с представителями уже
+            # найденных в корзине кластеров, а не со всеми элементами
+            reps: List[int] = []
+            for idx in members:
+                root = find(idx)
+                for rep in reps:
+                    if find(rep) == root:
+                        break
+                    if estimated_jaccard(signatures[rep], signatures[idx]) >= threshold:
+                        parent[root] = find(rep)
+                        break
+                else:
+                    reps.append(idx)
+
+    clusters: Dict[int, List[int]] = {}
+    for idx in range(len(texts)):
+        clusters.setdefault(find(idx), []).append(idx)
+
+    return [members for members in clusters.values() if len(members) > 1]
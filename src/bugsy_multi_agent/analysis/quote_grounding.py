@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Set, Tuple
+
+from bugsy_multi_agent.analysis.aho_corasick import AhoCorasick
+from bugsy_multi_agent.analysis.text_normalize import normalize_text
+from bugsy_multi_agent.models.attribute import Attribute
+
+
+# Многоточие внутри цитаты означает пропуск: части ищутся по отдельности
+_ELLIPSIS_RE = re.compile(r"\.\.\.|…")
+_EDGE_PUNCTUATION = " \t\n.,;:!?\"'«»“”„()[]-–—"
+
+
+def quote_fragments(quote: str) -> List[str]:
+    """
+    Нормализованные фрагменты цитаты: регистр, пробелы, ё -> е;
+    обрамляющие кавычки и пунктуация срезаются, многоточие делит цитату на части.
+    """
+    fragments = []
+    for part in _ELLIPSIS_RE.split(quote):
+        fragment = normalize_text(part).strip(_EDGE_PUNCTUATION)
+        if fragment:
+            fragments.append(fragment)
+    return fragments
+
+
+@dataclass
+class QuoteGroundingResult:
+    """
+    Результат проверки одной цитаты атрибута.
+
+    status:
+    - "grounded" — найдена в одной из секций source_section_ids;
+    - "other_section" — найдена, но только в секциях, на которые атрибут не ссылается;
+    - "not_found" — не найдена ни в одной секции.
+    """
+
+    query_id: str
+    attribute_id: str
+    quote: str
+    status: str
+    found_in: List[str] = field(default_factory=list)
+
+
+class QuoteGroundingChecker:
+    """
+    Проверка, что Attribute.source_quotes дословно (с точностью до нормализации)
+    встречаются в текстах секций из data/contexts/*.json.
+
+    Все фрагменты всех цитат (одного запроса или всего корпуса) собираются
+    в один автомат Ахо–Корасик, и каждый уникальный текст секции сканируется
+    один раз. Секции, повторяющиеся в разных запросах (section_ch1080 и т.п.),
+    сканируются однажды.
+    """
+
+    def __init__(self) -> None:
+        # нормализованный текст секции -> его индекс (одинаковые тексты не дублируются)
+        self._texts: Dict[str, int] = {}
+        # query_id -> [(section_id, индекс текста)] секций контекста запроса
+        self._query_sections: Dict[str, List[Tuple[str, int]]] = {}
+        self._patterns: Dict[str, int] = {}
+        # (query_id, attribute_id, цитата, id фрагментов, source_section_ids)
+        self._quotes: List[Tuple[str, str, str, List[int], List[str]]] = []
+
+    def add_context(self, query_id: str, raw_context: Mapping[str, Any]) -> None:
+        sections = []
+        for idx, sec in enumerate(raw_context.get("section_candidates", [])):
+            section_id = sec.get("section_id", f"sec_{idx}")
+            text = normalize_text(sec.get("text", ""))
+            sections.append((section_id, self._texts.setdefault(text, len(self._texts))))
+        self._query_sections[query_id] = sections
+
+    def add_attributes(self, query_id: str, attributes: Iterable[Attribute]) -> None:
+        for attr in attributes:
+            for quote in attr.source_quotes:
+                pattern_ids = [
+                    self._patterns.setdefault(fragment, len(self._patterns))
+                    for fragment in quote_fragments(quote)
+                ]
+                self._quotes.append(
+                    (query_id, attr.id, quote, pattern_ids, attr.source_section_ids)
+                )
+
+    def run(self) -> List[QuoteGroundingResult]:
+        automaton = AhoCorasick(list(self._patterns))
+
+        # Один проход по каждому уникальному тексту
+        found_by_text: List[Set[int]] = [
+            automaton.find_all(text) for text in self._texts
+        ]
+
+        results: List[QuoteGroundingResult] = []
+        for query_id, attr_id, quote, pattern_ids, refs in self._quotes:
+            # Цитата найдена в секции, если там найдены все её фрагменты
+            found_in: List[str] = []
+            if pattern_ids:
+                for section_id, text_idx in self._query_sections.get(query_id, []):
+                    found = found_by_text[text_idx]
+                    if all(pattern_id in found for pattern_id in pattern_ids):
+                        found_in.append(section_id)
+
+            if set(found_in) & set(refs):
+                status = "grounded"
+            elif found_in:
+                status = "other_section"
+            else:
+                status = "not_found"
+
+            results.append(
+                QuoteGroundingResult(
+                    query_id=query_id,
+                    attribute_id=attr_id,
+                    quote=quote,
+                    status=status,
+                    found_in=found_in,
+                )
+            )
+
+        return results
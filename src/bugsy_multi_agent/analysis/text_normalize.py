@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Iterable, List
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Длина префикса, до которой обрезаются длинные токены.
+# Грубый "стемминг" для русского текста: "события"/"событие" -> "событ".
+STEM_PREFIX_LEN = 5
+
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализует текст для сравнения: нижний регистр, ё -> е,
+    все пробельные последовательности -> один пробел.
+    """
+    text = text.lower().replace("ё", "е")
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def stem_token(token: str) -> str:
+    """
+    Обрезает токен до STEM_PREFIX_LEN символов.
+    Не заменяет морфологию, но склеивает падежные и числовые формы.
+    """
+    return token[:STEM_PREFIX_LEN]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает нормализованный текст на словарные токены (буквы/цифры).
+    """
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def normalized_tokens(text: str, min_len: int = 2) -> List[str]:
+    """
+    Токены после нормализации и стемминга; слишком короткие
+    (предлоги, союзы) отбрасываются.
+    """
+    return [stem_token(t) for t in tokenize(text) if len(t) >= min_len]
+
+
+def normalized_digest(parts: Iterable[str]) -> str:
+    """
+    Хеш последовательности строк после normalize_text.
+    Последовательности, отличающиеся только регистром/пробелами/ё, дают один хеш;
+    порядок элементов учитывается.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(normalize_text(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
@@ -1,12 +1,178 @@
 from __future__ import annotations
 
+import json
+import math
+import os
 from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+
+# Префикс переменных окружения: BUGSY_LLM_MAX_CONCURRENCY=8
+ENV_PREFIX = "BUGSY_"
+# Переменная окружения с путём к TOML-конфигу
+CONFIG_ENV_VAR = "BUGSY_CONFIG"
+# Конфиг по умолчанию в корне проекта (читается, если есть)
+DEFAULT_CONFIG_NAME = "bugsy.toml"
+
+# Настройки, задаваемые из TOML, env и CLI: имя -> (вид, минимум, максимум).
+# Вид: bool, int, int? (int или None), float, float? (float или None), str,
+# str? (str или None), path, list (строк), dict (строка -> строка)
+TUNABLE_SETTINGS: Dict[str, Tuple[str, Optional[float], Optional[float]]] = {
+    "llm_model": ("str", None, None),
+    "llm_base_url": ("str", None, None),
+    "llm_temperature": ("float", 0, 2),
+    "llm_timeout_seconds": ("float", 1, None),
+    "llm_max_retries": ("int", 0, 20),
+    "llm_max_output_tokens": ("int?", 1, None),
+    "llm_stage_models": ("dict", None, None),
+    "llm_cascade": ("bool", None, None),
+    "llm_cascade_fast_model": ("str?", None, None),
+    "llm_cascade_stages": ("list", None, None),
+    "llm_cascade_min_scenario_coverage": ("float", 0, 1),
+    "llm_max_concurrency": ("int", 1, 256),
+    "llm_repair_max_rounds": ("int", 0, 10),
+    "llm_max_continuations": ("int", 0, 20),
+    "llm_json_mode": ("bool", None, None),
+    "llm_single_flight": ("bool", None, None),
+    "llm_circuit_breaker": ("bool", None, None),
+    "llm_circuit_failure_threshold": ("int", 1, 1000),
+    "llm_circuit_reset_seconds": ("float", 1, None),
+    "llm_price_input_cache_hit_per_m": ("float", 0, None),
+    "llm_price_input_cache_miss_per_m": ("float", 0, None),
+    "llm_price_output_per_m": ("float", 0, None),
+    "budget_run_max_tokens": ("int?", 1, None),
+    "budget_run_max_cost_usd": ("float?", 0, None),
+    "budget_run_max_seconds": ("float?", 1, None),
+    "budget_run_window_seconds": ("float?", 1, None),
+    "budget_query_max_tokens": ("int?", 1, None),
+    "budget_query_max_cost_usd": ("float?", 0, None),
+    "budget_query_max_seconds": ("float?", 1, None),
+    "budget_on_exceeded": ("str", None, None),
+    "budget_defer_priorities": ("list", None, None),
+    "prompt_templates": ("dict", None, None),
+    "prompt_compression": ("bool", None, None),
+    "prompt_compression_min_repeat_chars": ("int", 1, None),
+    "prompt_compression_compact_attributes": ("bool", None, None),
+    "cache_dir": ("path", None, None),
+    "meta_dir": ("path", None, None),
+    "context_lazy_loading": ("bool", None, None),
+    "ontology_map_reduce": ("bool", None, None),
+    "section_cache_enabled": ("bool", None, None),
+    "section_cache_max_entries": ("int", 1, None),
+    "section_cache_max_decisions": ("int", 1, None),
+    "attribute_chunked_generation": ("bool", None, None),
+    "attribute_chunk_max_chars": ("int", 100, None),
+    "attribute_near_duplicate_threshold": ("float", 0, 1),
+    "attribute_near_duplicate_auto_merge": ("bool", None, None),
+    "incremental_generation": ("bool", None, None),
+    "scenario_sharded_generation": ("bool", None, None),
+    "scenario_shard_max_attributes": ("int", 1, None),
+    "server_workers": ("int", 1, 256),
+}
+
+# Допустимые значения строковых настроек с фиксированным набором вариантов
+SETTING_CHOICES: Dict[str, Tuple[str, ...]] = {
+    "budget_on_exceeded": ("degrade", "defer", "stop"),
+}
+
+_TRUE_STRINGS = {"1", "true", "yes", "on"}
+_FALSE_STRINGS = {"0", "false", "no", "off"}
+
+
+class SettingsError(ValueError):
+    """
+    Неизвестная настройка или недопустимое значение (TOML, env, CLI).
+    """
+
+
+def _coerce_setting(name: str, value: Any, source: str) -> Any:
+    """
+    Приводит значение к виду настройки из TUNABLE_SETTINGS и проверяет границы.
+    Строки (env, CLI) разбираются; значения из TOML уже типизированы.
+    """
+    kind, minimum, maximum = TUNABLE_SETTINGS[name]
+
+    def fail(expected: str) -> SettingsError:
+        return SettingsError(f"{source}: {name} must be {expected}, got {value!r}")
+
+    if kind == "bool":
+        if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS | _FALSE_STRINGS:
+            value = value.strip().lower() in _TRUE_STRINGS
+        if not isinstance(value, bool):
+            raise fail("a boolean")
+        return value
+
+    if kind in ("int", "int?", "float", "float?"):
+        is_float = kind.startswith("float")
+        if kind.endswith("?") and (value is None or value in ("", "none", "None")):
+            return None
+        if isinstance(value, str):
+            try:
+                value = float(value) if is_float else int(value)
+            except ValueError:
+                raise fail("a number") from None
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise fail("a number")
+        # nan проходит любые сравнения с границами, inf — верхнюю без maximum
+        if isinstance(value, float) and not math.isfinite(value):
+            raise fail("a finite number")
+        if not is_float and not isinstance(value, int):
+            raise fail("an integer")
+        if minimum is not None and value < minimum:
+            raise fail(f">= {minimum:g}")
+        if maximum is not None and value > maximum:
+            raise fail(f"<= {maximum:g}")
+        return float(value) if is_float else value
+
+    if kind == "str?" and (value is None or value in ("", "none", "None")):
+        return None
+    if kind in ("str", "str?", "path"):
+        if not isinstance(value, (str, Path)) or not str(value):
+            raise fail("a non-empty string")
+        choices = SETTING_CHOICES.get(name)
+        if choices is not None and str(value) not in choices:
+            raise fail("one of " + ", ".join(choices))
+        return Path(value) if kind == "path" else str(value)
+
+    # list / dict: строка из env/CLI — JSON или "a,b" / "k=v,k2=v2"
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith(("[", "{")):
+            try:
+                value = json.loads(text)
+            except ValueError:
+                raise fail("valid JSON") from None
+        elif kind == "list":
+            value = [item.strip() for item in text.split(",") if item.strip()]
+        else:
+            pairs = [item.partition("=") for item in text.split(",") if item.strip()]
+            if any(not sep for _, sep, _ in pairs):
+                raise fail("KEY=VALUE pairs")
+            value = {k.strip(): v.strip() for k, _, v in pairs}
+
+    if kind == "list":
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise fail("a list of strings")
+        return list(value)
+    if not isinstance(value, dict) or not all(
+        isinstance(k, str) and isinstance(v, str) for k, v in value.items()
+    ):
+        raise fail("a table of strings")
+    return dict(value)
 
 
 class Settings:
     """
-    Глобальные настройки проекта, в первую очередь пути к данным.
-    Можно потом добавить чтение из env, конфиг-файла и т.д.
+    Глобальные настройки проекта: пути к данным и параметры производительности.
+
+    Settings() — значения по умолчанию. Settings.load() / configure() накладывают
+    поверх (по возрастанию приоритета):
+    1) TOML-конфиг: явный путь, иначе $BUGSY_CONFIG, иначе bugsy.toml в корне
+       проекта, если он есть; ключи верхнего уровня — имена настроек;
+    2) переменные окружения BUGSY_<ИМЯ НАСТРОЙКИ>;
+    3) переопределения из CLI (--set имя=значение).
+    Список настраиваемых полей и их границы — TUNABLE_SETTINGS; неизвестное имя
+    или недопустимое значение — SettingsError.
     """
 
     def __init__(self, project_root: Path | None = None) -> None:
@@ -19,6 +185,7 @@ class Settings:
 
         self.data_dir = self.project_root / "data"
         self.contexts_dir = self.data_dir / "contexts"
+        self.prompts_dir = self.data_dir / "prompts"
         self.outputs_dir = self.data_dir / "outputs"
 
         self.ontology_retriever_dir = self.outputs_dir / "ontologyRAG_retriever"
@@ -32,6 +199,223 @@ class Settings:
         self.scenario_coverage_checker_dir = (
             self.outputs_dir / "scenario_coverage_checker"
         )
+        # Кэши между запросами (summary секций и т.п.)
+        self.cache_dir = self.outputs_dir / "cache"
+        # Служебные метаданные артефактов шагов (хеши входов и т.п.)
+        self.meta_dir = self.outputs_dir / "meta"
+
+        # Модель и температура LLM по умолчанию
+        self.llm_model = "deepseek-chat"
+        self.llm_base_url = "https://api.deepseek.com"
+        self.llm_temperature = 0.2
+        # Таймаут одного HTTP-запроса к LLM и число повторов SDK при сетевых
+        # ошибках/429/5xx
+        self.llm_timeout_seconds = 120.0
+        self.llm_max_retries = 2
+        # Лимит токенов ответа на один запрос (None — по умолчанию провайдера)
+        self.llm_max_output_tokens: int | None = None
+        # Модели по вызовам LLM: ontology_retriever, section_summary, ontology_reduce,
+        # attribute_generator, scenario_generator; нет в словаре — llm_model
+        self.llm_stage_models: Dict[str, str] = {}
+        # Каскад: сначала быстрая модель, модель вызова — только если ответ
+        # не прошёл валидацию или проверку качества. Быстрая модель задаётся
+        # явно и должна отличаться от модели шага (см. validate)
+        self.llm_cascade = False
+        self.llm_cascade_fast_model: str | None = None
+        self.llm_cascade_stages: List[str] = [
+            "ontology_retriever",
+            "section_summary",
+            "ontology_reduce",
+            "attribute_generator",
+            "scenario_generator",
+        ]
+        # Проверка качества сценариев быстрой модели: доля покрытых атрибутов
+        self.llm_cascade_min_scenario_coverage = 1.0
+
+        # Максимум одновременных запросов к LLM на процесс
+        self.llm_max_concurrency = 4
+        # Раундов repair-промпта для невалидных элементов ответа (0 — без исправления)
+        self.llm_repair_max_rounds = 2
+        # Максимум запросов-продолжений для ответа, оборванного по лимиту токенов
+        self.llm_max_continuations = 3
+        # JSON-режим провайдера (response_format=json_object) для промптов,
+        # возвращающих JSON; списки оборачиваются в объект {"attributes": [...]} и т.п.
+        self.llm_json_mode = True
+        # Склейка одинаковых одновременных запросов к LLM в один сетевой запрос
+        self.llm_single_flight = True
+        # Автомат защиты: после стольких сбоев провайдера подряд запросы к LLM
+        # сразу уходят в эвристику/заглушку; пробный запрос — раз в reset секунд
+        self.llm_circuit_breaker = True
+        self.llm_circuit_failure_threshold = 5
+        self.llm_circuit_reset_seconds = 30.0
+        # Цены провайдера, USD за 1M токенов (оценка стоимости для budget_*):
+        # входные токены с попаданием в кэш контекста / без него, выходные
+        self.llm_price_input_cache_hit_per_m = 0.07
+        self.llm_price_input_cache_miss_per_m = 0.56
+        self.llm_price_output_per_m = 1.68
+
+        # Бюджет LLM на прогон (batch/serve, весь процесс) и на один query_id:
+        # токены (prompt + completion), оценка стоимости в USD, секунды.
+        # Секунды запроса — время его шагов без ожидания в очереди.
+        # None — без ограничения; все None — учёт бюджета выключен
+        self.budget_run_max_tokens: Optional[int] = None
+        self.budget_run_max_cost_usd: Optional[float] = None
+        # В serve не поддерживается: у демона нет конца прогона и checkpoint
+        self.budget_run_max_seconds: Optional[float] = None
+        # Окно прогона: расход прогона обнуляется каждые столько секунд
+        # (например, 3600 — почасовой бюджет serve); None — одно окно на процесс
+        self.budget_run_window_seconds: Optional[float] = None
+        self.budget_query_max_tokens: Optional[int] = None
+        self.budget_query_max_cost_usd: Optional[float] = None
+        self.budget_query_max_seconds: Optional[float] = None
+        # Что делать, когда исчерпан бюджет прогона:
+        # degrade — шаги идут без LLM (эвристика/заглушка, артефакты помечаются degraded);
+        # defer — задания с приоритетом из budget_defer_priorities откладываются;
+        # stop — откладываются все не начатые шаги (batch сохраняет checkpoint для --resume)
+        self.budget_on_exceeded = "degrade"
+        self.budget_defer_priorities: List[str] = ["bulk"]
+        # Шаблоны промптов из data/prompts по шагам, например
+        # {"attribute_generator": "AG_prompt_2"}; шага нет — встроенный промпт
+        self.prompt_templates: Dict[str, str] = {}
+        # Сжатие текстов секций/passages перед отправкой в LLM (см. PromptCompressor);
+        # выключено — промпты не меняются
+        self.prompt_compression = False
+        # Повторяющиеся строки короче этого (символы) не удаляются
+        self.prompt_compression_min_repeat_chars = 20
+        # Список атрибутов в промпте сценариев — компактной таблицей
+        self.prompt_compression_compact_attributes = False
+
+        # Ленивое чтение data/contexts: в памяти только индекс смещений
+        # (cache/context_index), тексты секций читаются из файла при обращении
+        self.context_lazy_loading = True
+
+        # OntologyRAG Retriever: map (по вызову LLM на секцию, параллельно) + reduce
+        self.ontology_map_reduce = False
+        # Кэш summary секций между запросами (используется в map-шаге)
+        self.section_cache_enabled = True
+        # Максимум записей в кэше; вытесняются давно не использованные
+        self.section_cache_max_entries = 5000
+        # Максимум решений (по разным запросам) в одной записи; старые вытесняются
+        self.section_cache_max_decisions = 64
+
+        # Генерация атрибутов по пачкам passages с параллельными вызовами LLM
+        self.attribute_chunked_generation = False
+        # Ограничение размера одной пачки (символы title + summary)
+        self.attribute_chunk_max_chars = 6000
+
+        # Поиск почти-дубликатов атрибутов (MinHash/LSH) в AttributeValidatorAgent
+        self.attribute_near_duplicate_threshold = 0.7
+        # Сливать найденные почти-дубликаты до генерации сценариев
+        self.attribute_near_duplicate_auto_merge = False
+
+        # Инкрементальная перегенерация: только атрибуты/сценарии,
+        # затронутые изменившимися секциями
+        self.incremental_generation = False
+
+        # Генерация сценариев по шардам атрибутов с параллельными вызовами LLM
+        self.scenario_sharded_generation = False
+        # Максимум атрибутов в одном шарде
+        self.scenario_shard_max_attributes = 12
+
+        # Число заданий, выполняемых одновременно в режиме serve
+        self.server_workers = 4
+
+    @classmethod
+    def load(
+        cls,
+        project_root: Path | None = None,
+        config_path: Path | str | None = None,
+        environ: Mapping[str, str] | None = None,
+        overrides: Mapping[str, Any] | None = None,
+    ) -> Settings:
+        """
+        Настройки по умолчанию + TOML + env + overrides (см. configure).
+        """
+        return cls(project_root).configure(config_path, environ, overrides)
+
+    def configure(
+        self,
+        config_path: Path | str | None = None,
+        environ: Mapping[str, str] | None = None,
+        overrides: Mapping[str, Any] | None = None,
+    ) -> Settings:
+        """
+        Накладывает TOML-конфиг, переменные окружения и overrides на текущие значения.
+        """
+        environ = os.environ if environ is None else environ
+
+        if config_path is None and environ.get(CONFIG_ENV_VAR):
+            config_path = environ[CONFIG_ENV_VAR]
+        if config_path is not None:
+            self.apply(self._read_config_file(Path(config_path)), source=str(config_path))
+        else:
+            default_path = self.project_root / DEFAULT_CONFIG_NAME
+            if default_path.exists():
+                self.apply(self._read_config_file(default_path), source=str(default_path))
+
+        from_env = {
+            name: environ[ENV_PREFIX + name.upper()]
+            for name in TUNABLE_SETTINGS
+            if ENV_PREFIX + name.upper() in environ
+        }
+        self.apply(from_env, source="environment")
+
+        if overrides:
+            self.apply(overrides, source="command line")
+        self.validate()
+        return self
+
+    @staticmethod
+    def _read_config_file(path: Path) -> Dict[str, Any]:
+        import tomllib
+
+        try:
+            with path.open("rb") as f:
+                return tomllib.load(f)
+        except FileNotFoundError:
+            raise SettingsError(f"Config file not found: {path}") from None
+        except tomllib.TOMLDecodeError as e:
+            raise SettingsError(f"{path}: invalid TOML: {e}") from e
+
+    def apply(self, values: Mapping[str, Any], source: str = "settings") -> None:
+        """
+        Проверяет и устанавливает значения; все или ничего — при ошибке
+        ни одно значение из values не меняется.
+        """
+        unknown = sorted(set(values) - set(TUNABLE_SETTINGS))
+        if unknown:
+            raise SettingsError(f"{source}: unknown settings: {', '.join(unknown)}")
+
+        coerced = {
+            name: _coerce_setting(name, value, source) for name, value in values.items()
+        }
+        for name, value in coerced.items():
+            if isinstance(value, Path) and not value.is_absolute():
+                value = self.project_root / value
+            setattr(self, name, value)
+
+    def validate(self) -> None:
+        """
+        Проверки, связывающие несколько настроек (значения по отдельности
+        проверяет apply).
+        """
+        if self.llm_cascade:
+            fast = self.llm_cascade_fast_model
+            stage_models = {
+                self.llm_stage_models.get(stage) or self.llm_model
+                for stage in self.llm_cascade_stages
+            }
+            if fast is None or stage_models <= {fast}:
+                raise SettingsError(
+                    "llm_cascade requires llm_cascade_fast_model different from "
+                    f"the cascade stage models, got {fast!r}"
+                )
+
+    def tunable_values(self) -> Dict[str, Any]:
+        """
+        Текущие значения настраиваемых полей (для вывода эффективной конфигурации).
+        """
+        return {name: getattr(self, name) for name in TUNABLE_SETTINGS}
 
     def ensure_dirs(self) -> None:
         """
@@ -46,6 +430,8 @@ class Settings:
         self.scenario_generator_dir.mkdir(parents=True, exist_ok=True)
         self.scenario_validator_dir.mkdir(parents=True, exist_ok=True)
         self.scenario_coverage_checker_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_dir.mkdir(parents=True, exist_ok=True)
 
 
 settings = Settings()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.json_io import read_json, write_json
+
+
+def get_artifact_meta_path(settings: Settings, stage: str, query_id: str) -> Path:
+    """
+    Путь к метаданным артефакта шага.
+    Формат: meta/{stage}_{query_id}.json (например, meta/attribute_generator_query_1.json)
+
+    Метаданные лежат отдельно от самих артефактов: контракт файлов
+    attributes_*.json / scenarios_*.json (голый JSON-массив) не меняется.
+    """
+    return settings.meta_dir / f"{stage}_{query_id}.json"
+
+
+def load_artifact_meta(settings: Settings, stage: str, query_id: str) -> Dict[str, Any]:
+    """
+    Загружает метаданные артефакта; если их нет — пустой dict.
+    """
+    path = get_artifact_meta_path(settings, stage, query_id)
+    if not path.exists():
+        return {}
+    raw = read_json(path)
+    return raw if isinstance(raw, dict) else {}
+
+
+def save_artifact_meta(
+    settings: Settings, stage: str, query_id: str, meta: Dict[str, Any]
+) -> Path:
+    """
+    Полностью перезаписывает метаданные артефакта.
+    """
+    path = get_artifact_meta_path(settings, stage, query_id)
+    write_json(path, meta)
+    return path
+
+
+def update_artifact_meta(
+    settings: Settings, stage: str, query_id: str, **fields: Any
+) -> Path:
+    """
+    Обновляет отдельные поля метаданных, остальные сохраняются.
+    """
+    meta = load_artifact_meta(settings, stage, query_id)
+    meta.update(fields)
+    return save_artifact_meta(settings, stage, query_id, meta)
+
+
+def list_degraded_artifacts(
+    settings: Settings, stages: Iterable[str]
+) -> List[Dict[str, Any]]:
+    """
+    Артефакты шагов stages, помеченные degraded (собраны без LLM из-за ошибок
+    или разомкнутого автомата защиты): [{"stage", "query_id", "reasons"}].
+    """
+    prefixes = sorted(stages, key=len, reverse=True)
+    result: List[Dict[str, Any]] = []
+    for path in sorted(settings.meta_dir.glob("*.json")):
+        stage = next((s for s in prefixes if path.stem.startswith(f"{s}_")), None)
+        if stage is None:
+            continue
+        meta = read_json(path)
+        if isinstance(meta, dict) and meta.get("degraded"):
+            result.append(
+                {
+                    "stage": stage,
+                    "query_id": path.stem[len(stage) + 1:],
+                    "reasons": list(meta.get("degraded_reasons") or []),
+                }
+            )
+    return result
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.json_io import read_json, write_json
+
+
+def get_batch_checkpoint_path(settings: Settings) -> Path:
+    """
+    Путь к checkpoint пакетного прогона, остановленного по бюджету LLM.
+    """
+    return settings.outputs_dir / "batch_checkpoint.json"
+
+
+def save_batch_checkpoint(
+    settings: Settings,
+    jobs: List[Dict[str, Any]],
+    budget: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Сохраняет отложенные задания: [{"query_id", "stages", "priority", "submitter"}],
+    stages — ещё не выполненные шаги. budget — снимок BudgetGovernor на момент остановки.
+    """
+    path = get_batch_checkpoint_path(settings)
+    write_json(
+        path,
+        {
+            "saved_at": time.time(),
+            "jobs": jobs,
+            "budget": budget or {},
+        },
+    )
+    return path
+
+
+def load_batch_checkpoint(settings: Settings) -> List[Dict[str, Any]]:
+    """
+    Отложенные задания из checkpoint; если его нет — пустой список.
+    """
+    path = get_batch_checkpoint_path(settings)
+    if not path.exists():
+        return []
+    raw = read_json(path)
+    jobs = raw.get("jobs") if isinstance(raw, dict) else None
+    return [job for job in jobs or [] if isinstance(job, dict) and job.get("query_id")]
+
+
+def clear_batch_checkpoint(settings: Settings) -> None:
+    path = get_batch_checkpoint_path(settings)
+    if path.exists():
+        path.unlink()
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.json_io import read_json, read_json_cached, write_json
+
+
+# Версия формата индекса; другая версия — индекс перестраивается
+CONTEXT_INDEX_VERSION = 2
+
+# Допустимый query_id: он становится частью имён файлов в data/
+QUERY_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+_WS_RE = re.compile(rb"[ \t\r\n]*")
+_SCALAR_RE = re.compile(rb"[^,}\]\s]+")
+_CONTAINER_TOKEN_RE = re.compile(rb'["\[\]{}]')
+
+
+def get_context_path(settings: Settings, query_id: str) -> Path:
+    """
+    Путь к сырому контексту OntologyRAG: contexts/{query_id}.json.
+    """
+    return settings.contexts_dir / f"{query_id}.json"
+
+
+def validate_query_id(query_id: Any) -> str:
+    """
+    Проверяет query_id, пришедший извне (HTTP API): только [A-Za-z0-9_.-],
+    без "." и "..", чтобы путь не выходил за пределы data/contexts/.
+    """
+    if (
+        not isinstance(query_id, str)
+        or not QUERY_ID_RE.match(query_id)
+        or query_id in (".", "..")
+    ):
+        raise ValueError(f"Invalid query_id: {query_id!r}. Expected [A-Za-z0-9_.-]+")
+    return query_id
+
+
+def save_raw_context(settings: Settings, query_id: str, raw_context: Dict[str, Any]) -> Path:
+    """
+    Атомарно записывает сырой контекст: во временный файл рядом и os.replace.
+    Читатели старой версии (LazyContext) не видят недописанного файла.
+    """
+    path = get_context_path(settings, validate_query_id(query_id))
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write_json(tmp_path, raw_context)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path
+
+
+def _file_stamp(stat: os.stat_result) -> List[int]:
+    """
+    Версия файла контекста: inode (меняется при атомарной замене), mtime и размер.
+    """
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def get_context_index_path(settings: Settings, query_id: str) -> Path:
+    """
+    Путь к индексу смещений контекста: cache/context_index/{query_id}.json.
+    """
+    return settings.cache_dir / "context_index" / f"{query_id}.json"
+
+
+# ---------- построение индекса ----------
+
+
+class _Scanner:
+    """
+    Минимальный сканер JSON по байтам (mmap): находит границы значений,
+    не разбирая их. Структурные символы JSON — ASCII, поэтому UTF-8 безопасен.
+    """
+
+    def __init__(self, buf: Any) -> None:
+        self.buf = buf
+        self.pos = 0
+
+    def error(self, message: str) -> ValueError:
+        return ValueError(f"Invalid JSON at byte {self.pos}: {message}")
+
+    def peek(self) -> bytes:
+        self.pos = _WS_RE.match(self.buf, self.pos).end()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: bytes) -> None:
+        if self.peek() != char:
+            raise self.error(f"expected {char.decode()!r}")
+        self.pos += 1
+
+    def string_span(self) -> Tuple[int, int]:
+        if self.peek() != b'"':
+            raise self.error("expected a string")
+        start = self.pos
+        # Конец строки — кавычка, перед которой чётное число обратных слэшей;
+        # find по mmap заметно быстрее регулярного выражения на длинных текстах
+        end = start + 1
+        while True:
+            end = self.buf.find(b'"', end)
+            if end < 0:
+                raise self.error("unterminated string")
+            backslash = end - 1
+            while self.buf[backslash] == 0x5C:
+                backslash -= 1
+            if (end - 1 - backslash) % 2 == 0:
+                break
+            end += 1
+        self.pos = end + 1
+        return start, self.pos
+
+    def value_span(self) -> Tuple[int, int]:
+        char = self.peek()
+        start = self.pos
+        if char == b'"':
+            return self.string_span()
+        if char in (b"{", b"["):
+            depth = 0
+            while True:
+                m = _CONTAINER_TOKEN_RE.search(self.buf, self.pos)
+                if m is None:
+                    raise self.error("unterminated container")
+                if m.group() == b'"':
+                    self.pos = m.start()
+                    self.string_span()
+                    continue
+                self.pos = m.end()
+                depth += 1 if m.group() in (b"{", b"[") else -1
+                if depth == 0:
+                    return start, self.pos
+        m = _SCALAR_RE.match(self.buf, self.pos)
+        if m is None:
+            raise self.error("expected a value")
+        self.pos = m.end()
+        return start, self.pos
+
+    def value(self) -> Any:
+        start, end = self.value_span()
+        return json.loads(self.buf[start:end])
+
+    def object_keys(self) -> Iterator[str]:
+        """
+        Ключи объекта по порядку; значение каждого ключа читает вызывающий.
+        """
+        self.expect(b"{")
+        if self.peek() == b"}":
+            self.pos += 1
+            return
+        while True:
+            start, end = self.string_span()
+            key = json.loads(self.buf[start:end])
+            self.expect(b":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == b"}":
+                return
+            if char != b",":
+                raise self.error("expected ',' or '}'")
+
+    def array_items(self) -> Iterator[None]:
+        """
+        По шагу на элемент массива; элемент читает вызывающий.
+        """
+        self.expect(b"[")
+        if self.peek() == b"]":
+            self.pos += 1
+            return
+        while True:
+            yield None
+            char = self.peek()
+            self.pos += 1
+            if char == b"]":
+                return
+            if char != b",":
+                raise self.error("expected ',' or ']'")
+
+
+def build_context_index(path: Path) -> Dict[str, Any]:
+    """
+    Индекс контекста за один проход по файлу через mmap:
+    поля верхнего уровня (кроме section_candidates) и метаданные секций
+    разбираются, для text секций запоминаются только байтовые смещения.
+    """
+    stat = path.stat()
+    fields: Dict[str, Any] = {}
+    sections: List[Dict[str, Any]] = []
+    with path.open("rb") as f:
+        if stat.st_size == 0:
+            raise ValueError(f"Raw context file is empty: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            scanner = _Scanner(buf)
+            for key in scanner.object_keys():
+                if key != "section_candidates" or scanner.peek() != b"[":
+                    fields[key] = scanner.value()
+                    continue
+                fields[key] = None
+                for _ in scanner.array_items():
+                    if scanner.peek() != b"{":
+                        raise scanner.error("section_candidates must contain objects")
+                    section: Dict[str, Any] = {"keys": [], "fields": {}, "text_span": None}
+                    for section_key in scanner.object_keys():
+                        section["keys"].append(section_key)
+                        if section_key == "text" and scanner.peek() == b'"':
+                            section["text_span"] = list(scanner.string_span())
+                        else:
+                            section["fields"][section_key] = scanner.value()
+                    sections.append(section)
+            if scanner.peek():
+                raise scanner.error("extra data after JSON object")
+
+    return {
+        "version": CONTEXT_INDEX_VERSION,
+        "source_stamp": _file_stamp(stat),
+        "fields": fields,
+        "sections": sections,
+    }
+
+
+def _index_is_fresh(index: Any, path: Path) -> bool:
+    if not isinstance(index, dict) or index.get("version") != CONTEXT_INDEX_VERSION:
+        return False
+    return index.get("source_stamp") == _file_stamp(path.stat())
+
+
+def load_context_index(settings: Settings, query_id: str) -> Dict[str, Any]:
+    """
+    Индекс контекста из sidecar-файла; если его нет или контекст изменился
+    (inode/mtime/размер) — перестраивается и сохраняется. Ошибка записи индекса
+    не мешает: индекс используется из памяти.
+    """
+    path = get_context_path(settings, query_id)
+    index_path = get_context_index_path(settings, query_id)
+
+    if index_path.exists():
+        try:
+            index = read_json_cached(index_path)
+        except ValueError:
+            # Недописанный индекс (параллельная запись) — перестраиваем
+            index = None
+        if _index_is_fresh(index, path):
+            return index
+
+    index = build_context_index(path)
+    try:
+        write_json(index_path, index, indent=None)
+    except OSError as e:
+        print(f"context_store: failed to save context index {index_path}: {e}")
+    return index
+
+
+# ---------- ленивый доступ ----------
+
+
+class LazySection(Mapping[str, Any]):
+    """
+    Секция из section_candidates: метаданные (section_id, title, score, ...)
+    в памяти, text читается из файла контекста при каждом обращении
+    и не удерживается.
+    """
+
+    def __init__(self, context: LazyContext, entry: Dict[str, Any]) -> None:
+        self._context = context
+        self._entry = entry
+
+    def __getitem__(self, key: str) -> Any:
+        span = self._entry["text_span"]
+        if key == "text" and span is not None:
+            return self._context.read_span(span[0], span[1])
+        return self._entry["fields"][key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entry["keys"])
+
+    def __len__(self) -> int:
+        return len(self._entry["keys"])
+
+    def __repr__(self) -> str:
+        return f"LazySection({self._entry['fields']!r})"
+
+
+class LazyContext(Mapping[str, Any]):
+    """
+    Сырой контекст OntologyRAG с ленивым чтением текстов секций.
+
+    Ведёт себя как dict из json.load (raw.get("query"), raw["section_candidates"],
+    sec.get("text", "")), но в памяти держит только индекс: метаданные секций
+    и смещения их текстов в файле. Текст секции читается позиционным чтением
+    по смещениям; если файл контекста изменился после построения индекса,
+    чтение текста завершается ошибкой, а не возвращает чужой фрагмент.
+    """
+
+    def __init__(self, path: Path, index: Dict[str, Any]) -> None:
+        self.path = path
+        self._index = index
+        self._sections: Optional[List[LazySection]] = None
+
+    def read_span(self, start: int, end: int) -> Any:
+        with self.path.open("rb") as f:
+            if _file_stamp(os.fstat(f.fileno())) != self._index["source_stamp"]:
+                raise RuntimeError(f"Raw context file changed while in use: {self.path}")
+            f.seek(start)
+            return json.loads(f.read(end - start))
+
+    def __getitem__(self, key: str) -> Any:
+        fields = self._index["fields"]
+        if key == "section_candidates" and key in fields and fields[key] is None:
+            if self._sections is None:
+                self._sections = [
+                    LazySection(self, entry) for entry in self._index["sections"]
+                ]
+            return self._sections
+        return fields[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index["fields"])
+
+    def __len__(self) -> int:
+        return len(self._index["fields"])
+
+
+def load_raw_context(settings: Settings, query_id: str) -> Mapping[str, Any]:
+    """
+    Сырой контекст data/contexts/{query_id}.json (FileNotFoundError, если файла нет).
+
+    При settings.context_lazy_loading — LazyContext поверх sidecar-индекса,
+    иначе — весь файл через json.load.
+    """
+    path = get_context_path(settings, query_id)
+    if not path.exists():
+        raise FileNotFoundError(f"Raw context file not found: {path}")
+    if not settings.context_lazy_loading:
+        return read_json(path)
+    return LazyContext(path, load_context_index(settings, query_id))
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
 import json
+import threading
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Tuple
+
+
+# path -> (mtime_ns, size, данные); см. read_json_cached
+_json_cache: Dict[Path, Tuple[int, int, Any]] = {}
+_json_cache_lock = threading.Lock()
 
 
 def read_json(path: Path) -> Any:
@@ -13,6 +19,26 @@ def read_json(path: Path) -> Any:
         return json.load(f)
 
 
+def read_json_cached(path: Path) -> Any:
+    """
+    Как read_json, но держит разобранный файл в памяти процесса и перечитывает его
+    только при изменении mtime/размера. Для долгоживущего процесса (serve),
+    где одни и те же справочные файлы читаются на каждом задании.
+
+    Возвращаемый объект общий для всех вызывающих: его нельзя мутировать.
+    """
+    stat = path.stat()
+    with _json_cache_lock:
+        cached = _json_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    data = read_json(path)
+    with _json_cache_lock:
+        _json_cache[path] = (stat.st_mtime_ns, stat.st_size, data)
+    return data
+
+
 def write_json(path: Path, data: Any, *, indent: int = 2) -> None:
     """
     Записывает Python-объект в JSON-файл.
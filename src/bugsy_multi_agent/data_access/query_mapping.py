@@ -4,7 +4,7 @@ from pathlib import Path
 from typing import Any, Dict, Optional
 
 from bugsy_multi_agent.config.settings import Settings
-from bugsy_multi_agent.data_access.json_io import read_json
+from bugsy_multi_agent.data_access.json_io import read_json_cached
 
 
 def _get_queries_path(settings: Settings) -> Path:
@@ -27,11 +27,14 @@ def load_query_mapping(settings: Settings) -> Dict[str, Dict[str, Any]]:
       },
       ...
     }
+
+    Файл читается через кеш: при неизменном queries.json повторные вызовы
+    не трогают диск.
     """
     path = _get_queries_path(settings)
     if not path.exists():
         return {}
-    raw = read_json(path)
+    raw = read_json_cached(path)
     if not isinstance(raw, dict):
         raise ValueError(f"queries.json must contain a JSON object, got: {type(raw)}")
     return raw  # type: ignore[return-value]
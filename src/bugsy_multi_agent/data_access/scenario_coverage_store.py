@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.json_io import read_json, write_json
+from bugsy_multi_agent.models.reports import ScenarioCoverageReport
+
+
+def get_scenario_coverage_path(settings: Settings, query_id: str) -> Path:
+    """
+    Путь к файлу отчёта покрытия атрибутов сценариями.
+    Формат: scenario_coverage_{query_id}.json
+    """
+    filename = f"scenario_coverage_{query_id}.json"
+    return settings.scenario_coverage_checker_dir / filename
+
+
+def get_corpus_coverage_path(settings: Settings, corpus_id: str) -> Path:
+    """
+    Путь к отчёту покрытия по корпусу из нескольких query_id.
+    Формат: corpus/scenario_coverage_{corpus_id}.json — отдельный подкаталог,
+    чтобы отчёт корпуса не перезаписал отчёт запроса с тем же id.
+    """
+    filename = f"scenario_coverage_{corpus_id}.json"
+    return settings.scenario_coverage_checker_dir / "corpus" / filename
+
+
+def save_scenario_coverage_report(
+    settings: Settings, query_id: str, report: ScenarioCoverageReport
+) -> Path:
+    """
+    Сохраняет ScenarioCoverageReport в JSON.
+    """
+    path = get_scenario_coverage_path(settings, query_id)
+    write_json(path, report.model_dump())
+    return path
+
+
+def load_scenario_coverage_report(
+    settings: Settings, query_id: str
+) -> ScenarioCoverageReport:
+    """
+    Загружает ScenarioCoverageReport из JSON.
+    """
+    path = get_scenario_coverage_path(settings, query_id)
+    raw = read_json(path)
+    return ScenarioCoverageReport.model_validate(raw)
+
+
+def save_corpus_coverage_report(
+    settings: Settings, corpus_id: str, report: ScenarioCoverageReport
+) -> Path:
+    """
+    Сохраняет ScenarioCoverageReport корпуса в JSON.
+    """
+    path = get_corpus_coverage_path(settings, corpus_id)
+    write_json(path, report.model_dump())
+    return path
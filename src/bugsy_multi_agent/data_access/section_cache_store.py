@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
+from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.data_access.json_io import read_json, write_json
+from bugsy_multi_agent.models.testing_context import SectionSummary
+
+
+def get_section_cache_path(settings: Settings) -> Path:
+    """
+    Путь к файлу кэша summary секций.
+    """
+    return settings.cache_dir / "section_summaries.json"
+
+
+class SectionSummaryCache:
+    """
+    Персистентный кэш результатов map-шага OntologyRAG Retriever между запросами.
+
+    Ключ записи — section_id + хеш нормализованного текста секции: изменившийся
+    текст даёт новый ключ, старая версия той же секции при записи удаляется.
+
+    В записи хранятся summary и domain_entities (от запроса не зависят) и решения
+    о роли/важности/отбрасывании по хешу текста запроса (зависят от запроса):
+    - get_full: есть и summary, и решение для этого запроса — вызов LLM не нужен;
+    - get_summary: секция известна, но не для этого запроса — в LLM можно отдать
+      короткое summary вместо полного текста.
+
+    Вытеснение: записи лежат в OrderedDict в порядке использования, при
+    превышении max_entries удаляются самые давние (O(1) на запись). Решений
+    в записи не больше max_decisions — вытесняются самые давние запросы.
+    Статистика попаданий копится и сохраняется вместе с кэшем.
+    Потокобезопасен (map-шаг вызывает его из пула потоков).
+    """
+
+    def __init__(self, settings: Settings, max_entries: int | None = None) -> None:
+        self.path = get_section_cache_path(settings)
+        self.max_entries = max_entries or settings.section_cache_max_entries
+        self.max_decisions = settings.section_cache_max_decisions
+        self._lock = threading.Lock()
+        # key -> запись; от давно не использованных к недавним
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # section_id -> key текущей версии секции
+        self._section_keys: Dict[str, str] = {}
+        self._stats: Dict[str, int] = {
+            "full_hits": 0,
+            "summary_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            raw = read_json(self.path)
+        except Exception as e:
+            print(f"SectionSummaryCache: failed to read {self.path}: {e}. Starting empty.")
+            return
+        entries = raw.get("entries", {})
+        # Файл сохраняется в порядке использования; сортировка по last_used —
+        # для файлов, записанных до этого
+        for key in sorted(entries, key=lambda k: entries[k].get("last_used", 0)):
+            stale = self._section_keys.get(self._section_id(key))
+            if stale is not None:
+                del self._entries[stale]
+            self._entries[key] = entries[key]
+            self._section_keys[self._section_id(key)] = key
+        self._evict()
+        for name, value in raw.get("stats", {}).items():
+            if name in self._stats:
+                self._stats[name] = int(value)
+
+    @staticmethod
+    def make_key(section_id: str, text: str) -> str:
+        return f"{section_id}:{normalized_digest([text])}"
+
+    @staticmethod
+    def _section_id(key: str) -> str:
+        return key.rpartition(":")[0]
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return normalized_digest([query])
+
+    # ---------- чтение ----------
+
+    def get_full(self, section_id: str, text: str, query: str) -> Optional[SectionSummary]:
+        """
+        Готовый SectionSummary для этой секции и этого запроса или None.
+        """
+        key = self.make_key(section_id, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            query_key = self._query_key(query)
+            decision = entry["decisions"].get(query_key) if entry else None
+            if decision is None:
+                return None
+            # Решение становится самым свежим в записи
+            entry["decisions"][query_key] = entry["decisions"].pop(query_key)
+            self._touch(key)
+            self._stats["full_hits"] += 1
+            self._dirty = True
+            return SectionSummary(
+                section_id=section_id,
+                title=entry["title"],
+                role=decision["role"],
+                importance=decision["importance"],
+                summary=entry["summary"],
+                domain_entities=list(entry["domain_entities"]),
+            )
+
+    def get_summary(self, section_id: str, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Кэшированные summary и domain_entities секции (без решения о роли) или None.
+        Промах здесь засчитывается в статистику как miss.
+        """
+        key = self.make_key(section_id, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            self._dirty = True
+            if entry is None or not entry["summary"]:
+                self._stats["misses"] += 1
+                return None
+            self._touch(key)
+            self._stats["summary_hits"] += 1
+            return {
+                "summary": entry["summary"],
+                "domain_entities": list(entry["domain_entities"]),
+            }
+
+    # ---------- запись ----------
+
+    def put(self, text: str, query: str, summary: SectionSummary) -> None:
+        key = self.make_key(summary.section_id, text)
+        decision = {"role": summary.role, "importance": summary.importance}
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Старая версия этой же секции (другой текст) больше не нужна
+                stale = self._section_keys.get(summary.section_id)
+                if stale is not None:
+                    del self._entries[stale]
+                self._section_keys[summary.section_id] = key
+                entry = {
+                    "title": summary.title,
+                    "summary": summary.summary,
+                    "domain_entities": list(summary.domain_entities),
+                    "decisions": {},
+                }
+                self._entries[key] = entry
+            elif summary.summary and not entry["summary"]:
+                entry["summary"] = summary.summary
+                entry["domain_entities"] = list(summary.domain_entities)
+            decisions = entry["decisions"]
+            query_key = self._query_key(query)
+            decisions.pop(query_key, None)
+            decisions[query_key] = decision
+            while len(decisions) > self.max_decisions:
+                del decisions[next(iter(decisions))]
+            self._touch(key)
+            self._evict()
+            self._dirty = True
+
+    def _touch(self, key: str) -> None:
+        self._entries[key]["last_used"] = time.time()
+        self._entries.move_to_end(key)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            del self._section_keys[self._section_id(key)]
+            self._stats["evictions"] += 1
+
+    # ---------- статистика и сохранение ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["full_hits"] + stats["summary_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["full_hits"] + stats["summary_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    def save(self) -> Optional[Path]:
+        """
+        Сохраняет кэш, если он менялся. Статистика сохраняется вместе с записями.
+        """
+        with self._lock:
+            if not self._dirty:
+                return None
+            data = {"entries": self._entries, "stats": self._stats}
+            write_json(self.path, data, indent=None)
+            self._dirty = False
+        return self.path
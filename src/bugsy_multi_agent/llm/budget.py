@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from bugsy_multi_agent.config.settings import Settings
+
+
+# query_id, к которому относятся вызовы LLM текущего потока/задачи;
+# map_parallel переносит его в рабочие потоки
+_current_query: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "bugsy_budget_query", default=None
+)
+
+
+def current_query_id() -> Optional[str]:
+    """
+    query_id активного query_scope в текущем потоке/задаче (None — вне запроса).
+    """
+    return _current_query.get()
+
+
+class BudgetExceededError(RuntimeError):
+    """
+    Запрос к LLM не отправлен: исчерпан бюджет прогона или запроса.
+    """
+
+
+@dataclass
+class UsageTotals:
+    """
+    Накопленный расход: запросы, токены, оценка стоимости (USD).
+
+    started_at — начало прогона (окна прогона); active_seconds — время,
+    проведённое в шагах query_id (ожидание в очереди планировщика не считается).
+    """
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    active_seconds: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        data = asdict(self)
+        del data["started_at"], data["active_seconds"]
+        data["total_tokens"] = self.total_tokens
+        data["cost_usd"] = round(self.cost_usd, 6)
+        data["elapsed_seconds"] = round(elapsed, 1)
+        return data
+
+
+class BudgetGovernor:
+    """
+    Учёт расхода LLM на прогон и на каждый query_id и ограничение по потолкам
+    из Settings (budget_*): токены (prompt + completion), оценка стоимости
+    по ценам llm_price_* и время.
+
+    Время прогона — с начала прогона или, при budget_run_window_seconds,
+    с начала текущего окна: по окончании окна расход прогона обнуляется
+    (для serve, где прогон — вся жизнь демона). Время запроса — сумма времени
+    его шагов (query_scope), без ожидания в очереди; потолок запроса действует
+    на одно задание — по его завершении расход сбрасывается (finish_query).
+
+    - потолок запроса исчерпан — дальнейшие вызовы LLM этого query_id
+      отклоняются (BudgetExceededError), шаги уходят в эвристику/заглушку;
+    - потолок прогона исчерпан — по budget_on_exceeded:
+      degrade — так же отклоняются все вызовы LLM;
+      defer — задания с приоритетом из budget_defer_priorities откладываются
+      (job_decision), остальные продолжаются;
+      stop — откладываются все ещё не начатые шаги; выполняемые доводятся до
+      конца, отложенное сохраняется в checkpoint для продолжения.
+
+    Расход известен только после ответа, поэтому параллельные запросы,
+    отправленные до исчерпания, могут немного превысить потолок.
+    Потокобезопасен.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.settings = settings
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.run = UsageTotals(started_at=clock())
+        self.queries: Dict[str, UsageTotals] = {}
+        # query_id -> моменты входа в ещё не завершённые query_scope
+        self._open_scopes: Dict[str, List[float]] = {}
+        self.refused_requests = 0
+        self.deferred_jobs = 0
+        self._announced: Set[str] = set()
+
+    # ---------- привязка вызовов к query_id ----------
+
+    @contextmanager
+    def query_scope(self, query_id: str) -> Iterator[None]:
+        """
+        Вызовы LLM внутри блока (и в потоках map_parallel) относятся к query_id.
+        """
+        if _current_query.get() == query_id:
+            # Вложенный блок того же запроса: время уже считается внешним
+            yield
+            return
+        with self._lock:
+            if query_id not in self.queries:
+                self.queries[query_id] = UsageTotals(started_at=self._clock())
+            entered = self._clock()
+            self._open_scopes.setdefault(query_id, []).append(entered)
+        token = _current_query.set(query_id)
+        try:
+            yield
+        finally:
+            _current_query.reset(token)
+            with self._lock:
+                self.queries[query_id].active_seconds += self._clock() - entered
+                scopes = self._open_scopes[query_id]
+                scopes.remove(entered)
+                if not scopes:
+                    del self._open_scopes[query_id]
+
+    def finish_query(self, query_id: str) -> None:
+        """
+        Задание query_id завершено: его расход забывается, и следующее задание
+        того же query_id начинает с нулевого бюджета запроса. Без этого в serve
+        query_id, однажды исчерпавший потолок, оставался бы без LLM до
+        перезапуска, а queries рос бы с каждым новым query_id.
+        """
+        with self._lock:
+            if query_id in self._open_scopes:
+                return
+            self.queries.pop(query_id, None)
+            self._announced.discard(f"query:{query_id}")
+
+    # ---------- время ----------
+
+    def _roll_run_window(self) -> None:
+        """
+        Начинает новое окно прогона, если текущее истекло. Вызывается под _lock.
+        """
+        window = self.settings.budget_run_window_seconds
+        now = self._clock()
+        if window is not None and now - self.run.started_at >= window:
+            self.run = UsageTotals(started_at=now)
+            self._announced.discard("run")
+
+    def _run_elapsed(self) -> float:
+        return self._clock() - self.run.started_at
+
+    def _query_elapsed(self, query_id: str) -> float:
+        now = self._clock()
+        usage = self.queries[query_id]
+        return usage.active_seconds + sum(
+            now - entered for entered in self._open_scopes.get(query_id, [])
+        )
+
+    # ---------- учёт ----------
+
+    def cost_usd(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cache_hit_tokens: int = 0,
+    ) -> float:
+        """
+        Оценка стоимости запроса в USD по ценам llm_price_* (за 1M токенов).
+        """
+        s = self.settings
+        cache_hit_tokens = min(cache_hit_tokens, prompt_tokens)
+        return (
+            cache_hit_tokens * s.llm_price_input_cache_hit_per_m
+            + (prompt_tokens - cache_hit_tokens) * s.llm_price_input_cache_miss_per_m
+            + completion_tokens * s.llm_price_output_per_m
+        ) / 1_000_000
+
+    def record(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cache_hit_tokens: int = 0,
+    ) -> None:
+        cost = self.cost_usd(prompt_tokens, completion_tokens, cache_hit_tokens)
+        query_id = _current_query.get()
+        with self._lock:
+            self._roll_run_window()
+            totals = [self.run]
+            if query_id is not None:
+                if query_id not in self.queries:
+                    self.queries[query_id] = UsageTotals(started_at=self._clock())
+                totals.append(self.queries[query_id])
+            for usage in totals:
+                usage.requests += 1
+                usage.prompt_tokens += prompt_tokens
+                usage.completion_tokens += completion_tokens
+                usage.cost_usd += cost
+
+    # ---------- проверки ----------
+
+    @staticmethod
+    def _exceeded(
+        usage: UsageTotals,
+        elapsed: float,
+        max_tokens: Optional[int],
+        max_cost: Optional[float],
+        max_seconds: Optional[float],
+    ) -> Optional[str]:
+        if max_tokens is not None and usage.total_tokens >= max_tokens:
+            return f"tokens {usage.total_tokens} >= {max_tokens}"
+        if max_cost is not None and usage.cost_usd >= max_cost:
+            return f"cost ${usage.cost_usd:.4f} >= ${max_cost:g}"
+        if max_seconds is not None and elapsed >= max_seconds:
+            return f"elapsed {elapsed:.0f}s >= {max_seconds:g}s"
+        return None
+
+    def run_exceeded(self) -> Optional[str]:
+        """
+        Причина, по которой бюджет прогона исчерпан, или None.
+        """
+        s = self.settings
+        with self._lock:
+            self._roll_run_window()
+            reason = self._exceeded(
+                self.run,
+                self._run_elapsed(),
+                s.budget_run_max_tokens,
+                s.budget_run_max_cost_usd,
+                s.budget_run_max_seconds,
+            )
+        if reason is not None:
+            self._announce(
+                "run",
+                f"run budget exceeded ({reason}); action={s.budget_on_exceeded}",
+            )
+        return reason
+
+    def query_exceeded(self, query_id: str) -> Optional[str]:
+        s = self.settings
+        with self._lock:
+            usage = self.queries.get(query_id)
+            if usage is None:
+                return None
+            reason = self._exceeded(
+                usage,
+                self._query_elapsed(query_id),
+                s.budget_query_max_tokens,
+                s.budget_query_max_cost_usd,
+                s.budget_query_max_seconds,
+            )
+        if reason is not None:
+            self._announce(
+                f"query:{query_id}",
+                f"budget of query_id={query_id} exceeded ({reason}); using fallbacks",
+            )
+        return reason
+
+    def _announce(self, key: str, message: str) -> None:
+        """
+        Печатает сообщение об исчерпании бюджета один раз на key.
+        """
+        with self._lock:
+            if key in self._announced:
+                return
+            self._announced.add(key)
+        print(f"BudgetGovernor: {message}")
+
+    def before_request(self) -> None:
+        """
+        Вызывается перед каждым сетевым запросом к LLM (включая repair
+        и продолжения); BudgetExceededError — запрос отправлять нельзя.
+        """
+        query_id = _current_query.get()
+        reason = self.query_exceeded(query_id) if query_id is not None else None
+        if reason is None and self.settings.budget_on_exceeded == "degrade":
+            reason = self.run_exceeded()
+        if reason is None:
+            return
+        with self._lock:
+            self.refused_requests += 1
+        raise BudgetExceededError(f"LLM budget exceeded: {reason}")
+
+    def job_decision(self, priority: str) -> str:
+        """
+        "run" — выполнять следующий шаг задания, "defer" — отложить задание.
+        """
+        action = self.settings.budget_on_exceeded
+        if action == "degrade" or self.run_exceeded() is None:
+            return "run"
+        if action == "defer" and priority not in self.settings.budget_defer_priorities:
+            return "run"
+        with self._lock:
+            self.deferred_jobs += 1
+        return "defer"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_run_window()
+            return {
+                "run": self.run.to_dict(self._run_elapsed()),
+                "queries": {
+                    qid: usage.to_dict(self._query_elapsed(qid))
+                    for qid, usage in self.queries.items()
+                },
+                "refused_requests": self.refused_requests,
+                "deferred_jobs": self.deferred_jobs,
+            }
+
+
+def budget_limits_configured(settings: Settings) -> bool:
+    """
+    Задан хотя бы один потолок budget_* (иначе governor не нужен).
+    """
+    return any(
+        getattr(settings, name) is not None
+        for name in (
+            "budget_run_max_tokens",
+            "budget_run_max_cost_usd",
+            "budget_run_max_seconds",
+            "budget_query_max_tokens",
+            "budget_query_max_cost_usd",
+            "budget_query_max_seconds",
+        )
+    )
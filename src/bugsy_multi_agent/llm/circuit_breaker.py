@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Optional
+
+from bugsy_multi_agent.llm.metrics import LLMMetrics
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Запрос к LLM не отправлен: автомат разомкнут после серии сбоев провайдера.
+    """
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для LLM-провайдера, общий для всех агентов процесса.
+
+    Состояния:
+    - closed — запросы идут как обычно, подряд идущие сбои считаются;
+    - open — после failure_threshold сбоев подряд запросы сразу завершаются
+      CircuitOpenError, не дожидаясь таймаутов и повторов SDK;
+    - half_open — через reset_timeout секунд пропускается один пробный запрос:
+      успех замыкает автомат, сбой снова размыкает его на reset_timeout.
+
+    Метрики (если передан metrics): circuit_opened, circuit_closed,
+    circuit_probes, circuit_short_circuited и флаг circuit_open (0/1).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        metrics: Optional[LLMMetrics] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be >= 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _count(self, name: str) -> None:
+        if self.metrics is not None:
+            self.metrics.increment(name)
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        if self.metrics is not None:
+            self.metrics.set("circuit_open", 0 if state == self.CLOSED else 1)
+
+    def before_call(self) -> None:
+        """
+        Пропускает запрос или бросает CircuitOpenError.
+        После пропуска вызывающий обязан вызвать record_success, record_failure
+        или record_neutral.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - self._clock()
+            if self._state == self.OPEN and remaining <= 0:
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._count("circuit_probes")
+                return
+            self._count("circuit_short_circuited")
+        raise CircuitOpenError(
+            f"LLM circuit is open after {self.failure_threshold} consecutive failures; "
+            f"next probe in {max(remaining, 0):.0f}s"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+                self._count("circuit_closed")
+
+    def record_neutral(self) -> None:
+        """
+        Запрос не дошёл до провайдера (отклонён бюджетом, прерван): состояние
+        не меняется, только освобождается слот пробного запроса.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._state == self.HALF_OPEN
+            self._probe_in_flight = False
+            if probe_failed or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = self._clock()
+                self._set_state(self.OPEN)
+                self._count("circuit_opened")
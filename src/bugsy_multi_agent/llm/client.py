@@ -1,10 +1,34 @@
 from __future__ import annotations
 
+import copy
+import hashlib
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from openai import OpenAI
+from bugsy_multi_agent.llm.budget import (
+    BudgetExceededError,
+    BudgetGovernor,
+    current_query_id,
+)
+from bugsy_multi_agent.llm.circuit_breaker import CircuitBreaker
+from bugsy_multi_agent.llm.json_utils import (
+    stitch_continuation,
+    truncate_to_last_complete_element,
+)
+from bugsy_multi_agent.llm.limiter import ConcurrencyLimiter
+from bugsy_multi_agent.llm.metrics import LLMMetrics
+from bugsy_multi_agent.llm.single_flight import SingleFlight
+
+
+# Запрос на продолжение ответа, оборванного по лимиту токенов
+_CONTINUATION_PROMPT = (
+    "Ответ оборвался из-за ограничения длины. Продолжи JSON ровно с места, "
+    "где закончился последний полный элемент выше: верни только оставшиеся "
+    "элементы массива через запятую (начиная с ',') и закрой все открытые скобки. "
+    "Не повторяй уже выданные элементы. Без пояснений и markdown."
+)
 
 
 class LLMClient(ABC):
@@ -13,19 +37,29 @@ class LLMClient(ABC):
     """
 
     @abstractmethod
-    def generate(self, prompt: str) -> str:
+    def generate(self, prompt: str, *, json_object: bool = False) -> str:
         """
         Синхронный вызов LLM: принимает текстовый промпт, возвращает текстовый ответ.
+
+        json_object=True — промпт просит один JSON-объект на верхнем уровне, и клиент
+        может включить JSON-режим провайдера; клиенты без него просто игнорируют флаг.
         """
         raise NotImplementedError
 
+    def with_model(self, model: str) -> LLMClient:
+        """
+        Клиент для запросов к другой модели того же провайдера (маршрутизация
+        по шагам, каскад). Клиенты без выбора модели возвращают себя.
+        """
+        return self
+
 
 class DummyLLMClient(LLMClient):
     """
     Временная заглушка, если LLM не настроен.
     """
 
-    def generate(self, prompt: str) -> str:
+    def generate(self, prompt: str, *, json_object: bool = False) -> str:
         raise NotImplementedError(
             "DummyLLMClient: LLM is not configured. "
             "Use DeepSeekLLMClient instead."
@@ -40,6 +74,42 @@ class DeepSeekLLMClient(LLMClient):
     - base_url = https://api.deepseek.com
     - API-ключ из переменной окружения DEEPSEEK_API_KEY
     - модель по умолчанию: deepseek-chat
+
+    openai импортируется внутри конструктора: SDK тяжёлый, и команды CLI,
+    которым LLM не нужен, не должны платить за его импорт.
+
+    Клиент потокобезопасен (OpenAI SDK держит пул HTTP-соединений), поэтому
+    один экземпляр можно разделять между агентами. Если передан limiter,
+    число одновременных запросов ограничивается им.
+
+    Если ответ оборван по лимиту токенов (finish_reason == "length"), клиент
+    обрезает его до последнего полного элемента массива и запрашивает
+    продолжение (не больше max_continuations раз), склеивая фрагменты в один
+    JSON. Если продолжения не хватило — возвращаются только полные элементы.
+    Счётчики — в self.metrics.
+
+    При json_mode и generate(..., json_object=True) запрос идёт с
+    response_format={"type": "json_object"}. Если провайдер отклоняет параметр
+    (400 с упоминанием response_format), JSON-режим отключается для клиента,
+    прочие 400 пробрасываются как есть; если в JSON-режиме пришёл пустой ответ,
+    запрос повторяется обычным текстовым. Запросы-продолжения всегда текстовые.
+
+    При single_flight одинаковые одновременные запросы (та же модель, параметры
+    и промпт) склеиваются: сетевой запрос делает первый, остальные ждут его
+    ответа, не занимая слот limiter (метрика coalesced_requests). Это помогает,
+    когда в пакете параллельно идут запросы с одинаковыми контекстами.
+
+    Если передан circuit_breaker, после серии сбоев провайдера (сеть, таймауты,
+    429, 5xx) запросы сразу завершаются CircuitOpenError, и агенты без ожидания
+    переходят к эвристике/заглушке; ошибки 4xx провайдера сбоем не считаются.
+
+    Если передан budget, расход каждого запроса (токены, оценка стоимости)
+    учитывается в BudgetGovernor, а перед каждым сетевым запросом проверяются
+    потолки: при исчерпании — BudgetExceededError без обращения к провайдеру.
+
+    with_model(model) возвращает клиента-"соседа" для другой модели: общие
+    HTTP-клиент, limiter и metrics (запросы считаются и по моделям —
+    requests:<model>), свой флаг JSON-режима.
     """
 
     def __init__(
@@ -48,6 +118,15 @@ class DeepSeekLLMClient(LLMClient):
         base_url: str = "https://api.deepseek.com",
         model: str = "deepseek-chat",
         temperature: float = 0.2,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        max_continuations: int = 3,
+        json_mode: bool = True,
+        timeout: Optional[float] = None,
+        max_retries: int = 2,
+        max_tokens: Optional[int] = None,
+        single_flight: bool = True,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[BudgetGovernor] = None,
     ) -> None:
         if api_key is None:
             api_key = os.environ.get("DEEPSEEK_API_KEY")
@@ -58,11 +137,38 @@ class DeepSeekLLMClient(LLMClient):
                 "Set DEEPSEEK_API_KEY environment variable."
             )
 
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        from openai import BadRequestError, OpenAI
+
+        client_options: Dict[str, Any] = {"max_retries": max_retries}
+        if timeout is not None:
+            client_options["timeout"] = timeout
+        self.client = OpenAI(api_key=api_key, base_url=base_url, **client_options)
+        self._bad_request_error = BadRequestError
         self.model = model
         self.temperature = temperature
+        self.limiter = limiter
+        self.max_continuations = max_continuations
+        self.json_mode = json_mode
+        self.max_tokens = max_tokens
+        self.metrics = LLMMetrics()
+        self.single_flight = SingleFlight() if single_flight else None
+        self.circuit_breaker = circuit_breaker
+        if circuit_breaker is not None and circuit_breaker.metrics is None:
+            circuit_breaker.metrics = self.metrics
+        self.budget = budget
+        self._siblings: Dict[str, DeepSeekLLMClient] = {model: self}
+        self._siblings_lock = threading.Lock()
 
-    def generate(self, prompt: str) -> str:
+    def with_model(self, model: str) -> DeepSeekLLMClient:
+        with self._siblings_lock:
+            sibling = self._siblings.get(model)
+            if sibling is None:
+                sibling = copy.copy(self)
+                sibling.model = model
+                self._siblings[model] = sibling
+            return sibling
+
+    def generate(self, prompt: str, *, json_object: bool = False) -> str:
         """
         Делает запрос к DeepSeek chat.completions.
 
@@ -70,21 +176,209 @@ class DeepSeekLLMClient(LLMClient):
         - system: роль сервиса, который обязан вернуть строго JSON.
         - user: наш промпт с описанием формата.
         """
+        if self.single_flight is None:
+            return self._generate_limited(prompt, json_object)
+
+        result, shared = self.single_flight.do(
+            self._request_key(prompt, json_object),
+            lambda: self._generate_limited(prompt, json_object),
+        )
+        if shared:
+            self.metrics.increment("coalesced_requests")
+        return result
+
+    def _request_key(self, prompt: str, json_object: bool) -> str:
+        """
+        Ключ склейки: всё, от чего зависит ответ провайдера. При учёте бюджета —
+        и query_id: иначе ведомый получил бы отказ по бюджету чужого запроса,
+        а расход целиком записался бы на запрос ведущего.
+        """
+        query_id = current_query_id() if self.budget is not None else None
+        h = hashlib.blake2b(digest_size=16)
+        for part in (
+            self.model, self.temperature, self.max_tokens, json_object, query_id, prompt
+        ):
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\x1f")
+        return h.hexdigest()
+
+    def _generate_limited(self, prompt: str, json_object: bool) -> str:
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return self._generate_with_limiter(prompt, json_object)
+
+        breaker.before_call()
+        try:
+            result = self._generate_with_limiter(prompt, json_object)
+        except BaseException as e:
+            if not isinstance(e, Exception) or isinstance(e, BudgetExceededError):
+                # Ответа провайдера не было: ни успех, ни сбой
+                breaker.record_neutral()
+            elif self._is_provider_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    @staticmethod
+    def _is_provider_failure(error: BaseException) -> bool:
+        """
+        Сбой провайдера для автомата защиты: сеть, таймаут, 429, 5xx.
+        Остальные ответы 4xx означают, что провайдер доступен.
+        """
+        if not isinstance(error, Exception) or isinstance(error, BudgetExceededError):
+            return False
+        status = getattr(error, "status_code", None)
+        return status is None or status >= 500 or status == 429
+
+    def _generate_with_limiter(self, prompt: str, json_object: bool) -> str:
+        if self.limiter is None:
+            return self._create_completion(prompt, json_object)
+        with self.limiter:
+            return self._create_completion(prompt, json_object)
+
+    def _request(
+        self,
+        messages: List[Dict[str, Any]],
+        json_object: bool = False,
+    ) -> Tuple[str, str]:
+        """
+        Один запрос chat.completions; возвращает (текст, finish_reason).
+        """
+        if self.budget is not None:
+            self.budget.before_request()
+        extra: Dict[str, Any] = {}
+        if json_object:
+            extra["response_format"] = {"type": "json_object"}
+        if self.max_tokens is not None:
+            extra["max_tokens"] = self.max_tokens
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a backend JSON generator. "
-                        "You must respond with STRICT JSON only, "
-                        "matching the user's schema description. "
-                        "No explanations, no comments, no markdown."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            messages=messages,
             temperature=self.temperature,
             stream=False,
+            **extra,
         )
-        return response.choices[0].message.content
+        self.metrics.increment("requests")
+        self.metrics.increment(f"requests:{self.model}")
+        self._record_usage(getattr(response, "usage", None))
+        choice = response.choices[0]
+        return choice.message.content or "", choice.finish_reason or ""
+
+    def _record_usage(self, usage: Any) -> None:
+        """
+        Токены запроса в метрики, включая попадания в кэш контекста провайдера:
+        DeepSeek отдаёт prompt_cache_hit_tokens / prompt_cache_miss_tokens,
+        OpenAI-совместимые API — prompt_tokens_details.cached_tokens.
+        """
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self.metrics.increment("prompt_tokens", prompt_tokens)
+        self.metrics.increment("completion_tokens", completion_tokens)
+
+        hit = getattr(usage, "prompt_cache_hit_tokens", None)
+        if hit is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            hit = getattr(details, "cached_tokens", None)
+        if hit is not None:
+            self.metrics.increment("prompt_cache_hit_tokens", hit or 0)
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+        if miss is not None:
+            self.metrics.increment("prompt_cache_miss_tokens", miss or 0)
+        if self.budget is not None:
+            self.budget.record(prompt_tokens, completion_tokens, hit or 0)
+
+    def _request_json_mode(self, messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """
+        Запрос в JSON-режиме с откатом на обычный текстовый запрос.
+        """
+        try:
+            content, finish_reason = self._request(messages, json_object=True)
+        except self._bad_request_error as e:
+            # Другие 400 (длина контекста и т.п.) относятся к этому запросу,
+            # а не к JSON-режиму: флаг общий для всех запросов клиента
+            if not self._is_json_mode_rejection(e):
+                raise
+            print(
+                f"DeepSeekLLMClient: JSON mode rejected by provider: {e}. "
+                f"Disabling it and falling back to free-text requests."
+            )
+            self.json_mode = False
+            self.metrics.increment("json_mode_rejected")
+            return self._request(messages)
+
+        if not content.strip() and finish_reason != "length":
+            self.metrics.increment("json_mode_empty_responses")
+            return self._request(messages)
+
+        self.metrics.increment("json_mode_requests")
+        return content, finish_reason
+
+    @staticmethod
+    def _is_json_mode_rejection(error: BaseException) -> bool:
+        """
+        Ошибка 400 говорит о неподдерживаемом response_format, а не о самом запросе.
+        """
+        message = str(error).lower()
+        return "response_format" in message or "json_object" in message
+
+    def _create_completion(self, prompt: str, json_object: bool = False) -> str:
+        messages = [
+            {
+                "role": "system",
+                "content": (
+                    "You are a backend JSON generator. "
+                    "You must respond with STRICT JSON only, "
+                    "matching the user's schema description. "
+                    "No explanations, no comments, no markdown."
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ]
+        if json_object and self.json_mode:
+            content, finish_reason = self._request_json_mode(messages)
+        else:
+            content, finish_reason = self._request(messages)
+        if finish_reason != "length":
+            return content
+        return self._continue_truncated(messages, content)
+
+    def _continue_truncated(self, messages: List[Dict[str, Any]], content: str) -> str:
+        """
+        Дозапрашивает оборванный ответ: в диалог кладётся ответ, обрезанный
+        до последнего полного элемента, и просьба продолжить с этого места.
+        """
+        self.metrics.increment("truncated_responses")
+        text = content
+
+        for _ in range(self.max_continuations):
+            cut = truncate_to_last_complete_element(text)
+            if cut is None:
+                # Оборван не массив — продолжать не с чего
+                self.metrics.increment("truncations_unrecoverable")
+                return text
+            prefix, _closers = cut
+
+            self.metrics.increment("continuation_requests")
+            continuation, finish_reason = self._request(
+                messages
+                + [
+                    {"role": "assistant", "content": prefix},
+                    {"role": "user", "content": _CONTINUATION_PROMPT},
+                ]
+            )
+            text = stitch_continuation(prefix, continuation)
+            if finish_reason != "length":
+                self.metrics.increment("truncations_recovered")
+                return text
+
+        # Лимит продолжений исчерпан: оставляем только полные элементы
+        self.metrics.increment("continuations_exhausted")
+        cut = truncate_to_last_complete_element(text)
+        if cut is None:
+            return text
+        return cut[0] + cut[1]
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
 import json
-from typing import Any
+import re
+from typing import Any, List, Tuple
+
+
+# Начало обёртки списка: {"<ключ>": [
+_ENVELOPE_START_RE = re.compile(r'\{\s*"((?:[^"\\]|\\.)*)"\s*:\s*\[')
 
 
 def extract_json_from_text(text: str) -> Any:
@@ -47,3 +52,131 @@ def extract_json_from_text(text: str) -> Any:
     s = s[: last_idx + 1]
 
     return json.loads(s)
+
+
+def unwrap_json_list(data: Any, envelope_key: str) -> Any:
+    """
+    Снимает обёртку {"<envelope_key>": [...]} (ответ в JSON-режиме).
+
+    Если ключа нет, но у объекта ровно одно поле-массив — берётся оно
+    (модель могла назвать ключ иначе). Массив и всё прочее возвращаются как есть.
+    """
+    if not isinstance(data, dict):
+        return data
+    if isinstance(data.get(envelope_key), list):
+        return data[envelope_key]
+    lists = [value for value in data.values() if isinstance(value, list)]
+    if len(lists) == 1:
+        return lists[0]
+    return data
+
+
+def truncate_to_last_complete_element(
+    text: str,
+    envelope_key: str | None = None,
+) -> Tuple[str, str] | None:
+    """
+    Для JSON, оборванного на середине (ответ LLM упёрся в лимит токенов):
+    находит конец последнего полного элемента внутри массива.
+
+    Обрезается только список верхнего уровня: голый массив или обёртка
+    {"attributes": [...]}, где массив — значение первого поля объекта
+    (envelope_key — если задан, ключ обёртки должен совпадать).
+    Элементы — объекты или массивы.
+
+    Возвращает (префикс до конца этого элемента включительно, закрывающие скобки),
+    так что префикс + скобки — валидный JSON только из полных элементов.
+    Если оборван не список (например, объект TestingContext с вложенными
+    массивами) — None: обрезка потеряла бы все поля после массива.
+    """
+    start = -1
+    for ch in ("{", "["):
+        i = text.find(ch)
+        if i != -1 and (start == -1 or i < start):
+            start = i
+    if start == -1:
+        return None
+
+    # Глубина стека, на которой должен открыться обрезаемый массив
+    if text[start] == "[":
+        list_depth = 1
+    else:
+        m = _ENVELOPE_START_RE.match(text, start)
+        if m is None:
+            return None
+        if envelope_key is not None and json.loads(f'"{m.group(1)}"') != envelope_key:
+            return None
+        list_depth = 2
+
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    best: Tuple[int, str] | None = None
+    # Глубина стека, на которой открыт внешний массив
+    array_depth = 0
+
+    for pos in range(start, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            if ch == "[" and not array_depth and len(stack) == list_depth:
+                # Массив открыт, но полных элементов ещё нет
+                array_depth = len(stack)
+                best = (pos + 1, _closers(stack))
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                # JSON закончился целиком — обрезать нечего
+                return text[start:pos + 1], ""
+            if len(stack) == array_depth:
+                best = (pos + 1, _closers(stack))
+
+    if best is None:
+        return None
+    end, closers = best
+    return text[start:end], closers
+
+
+def _closers(stack: List[str]) -> str:
+    return "".join("]" if ch == "[" else "}" for ch in reversed(stack))
+
+
+def stitch_continuation(prefix: str, continuation: str) -> str:
+    """
+    Склеивает префикс (оканчивающийся полным элементом массива или '[')
+    с продолжением от LLM. Продолжение может начинаться с ',', ']', '}',
+    с нового элемента '{' или с нового массива '[' — лишнее срезается,
+    недостающая запятая добавляется.
+    """
+    cont = continuation.strip()
+    if cont.startswith("```"):
+        cont = cont.strip("`")
+        if cont.startswith("json"):
+            cont = cont[len("json"):]
+        cont = cont.strip()
+
+    if cont.startswith("["):
+        # Модель начала массив заново: берём только его элементы
+        cont = cont[1:].lstrip()
+
+    opened = prefix.rstrip().endswith("[")
+    if cont.startswith(","):
+        if opened:
+            cont = cont[1:].lstrip()
+    elif cont and cont[0] not in "]}" and not opened:
+        cont = "," + cont
+
+    return prefix + cont
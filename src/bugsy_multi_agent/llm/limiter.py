@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import threading
+
+
+class ConcurrencyLimiter:
+    """
+    Ограничитель числа одновременных запросов к LLM.
+
+    Один экземпляр разделяется всеми агентами и потоками процесса, поэтому
+    параллельные задания (serve, пакетные прогоны) не превышают лимит провайдера.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Сколько запросов к LLM выполняется прямо сейчас.
+        """
+        return self._in_flight
+
+    def __enter__(self) -> "ConcurrencyLimiter":
+        self._semaphore.acquire()
+        with self._lock:
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._semaphore.release()
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict
+
+
+class LLMMetrics:
+    """
+    Потокобезопасные счётчики вызовов LLM одного клиента
+    (число запросов, обрывы по лимиту токенов, продолжения и т.п.).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: int) -> None:
+        """
+        Значение-флаг/показатель (например, circuit_open), а не счётчик.
+        """
+        with self._lock:
+            self._counters[name] = value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Копия всех счётчиков на текущий момент.
+        """
+        with self._lock:
+            return dict(self._counters)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence, TypeVar, Union
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_parallel(
+    fn: Callable[[T], R],
+    items: Sequence[T],
+    max_workers: int,
+) -> List[Union[R, Exception]]:
+    """
+    Выполняет fn для каждого элемента items в пуле потоков (для параллельных вызовов LLM).
+
+    Возвращает результаты в порядке items; исключение отдельного вызова
+    не прерывает остальные и возвращается на месте результата.
+    Один элемент выполняется в текущем потоке, без пула.
+    Каждый вызов видит contextvars вызывающего потока (например, query_id
+    для учёта бюджета LLM).
+    """
+
+    def call(item: T) -> Union[R, Exception]:
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    if len(items) <= 1:
+        return [call(item) for item in items]
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(items))),
+        thread_name_prefix="bugsy-llm",
+    ) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, call, item)
+            for item in items
+        ]
+        return [future.result() for future in futures]
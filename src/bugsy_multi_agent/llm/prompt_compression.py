@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+import re
+from typing import List, Set
+
+from bugsy_multi_agent.analysis.text_normalize import normalize_text
+from bugsy_multi_agent.models.attribute import Attribute
+
+
+# Грубая оценка: символов на токен для смешанного русского/английского текста
+CHARS_PER_TOKEN = 3.0
+
+_INLINE_SPACE_RE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# Маркеры заголовка перед текстом: "#", "##", "1.", "2.3)" и т.п.
+_HEADING_MARKER_RE = re.compile(r"^(#+|\d+(\.\d+)*[.)]?)\s*")
+
+_ATTRIBUTE_COLUMNS = (
+    "id",
+    "name",
+    "type",
+    "priority",
+    "source_section_ids",
+    "description",
+    "positive_example",
+    "negative_example",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Приблизительное число токенов текста (без токенизатора провайдера).
+    Годится для сравнения "до/после", а не для точного учёта.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Схлопывает пробелы и табы внутри строк, убирает пробелы по краям строк
+    и оставляет не больше одной пустой строки подряд.
+    """
+    lines = [_INLINE_SPACE_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _heading_key(line: str) -> str:
+    return normalize_text(_HEADING_MARKER_RE.sub("", line.strip())).rstrip(" .:")
+
+
+def _table_cell(value: str) -> str:
+    return " ".join(value.split()).replace("|", "/")
+
+
+def format_attributes_table(attrs: List[Attribute]) -> str:
+    """
+    Компактное табличное представление атрибутов: заголовок с именами колонок
+    один раз, дальше по строке на атрибут, значения через " | ".
+    """
+    if not attrs:
+        return "ATTRIBUTES: []"
+
+    lines = [f"ATTRIBUTES ({' | '.join(_ATTRIBUTE_COLUMNS)}):"]
+    for a in attrs:
+        cells = [
+            a.id,
+            a.name,
+            a.type,
+            a.priority,
+            ",".join(a.source_section_ids),
+            a.description,
+            a.positive_example,
+            a.negative_example,
+        ]
+        lines.append(" | ".join(_table_cell(str(c)) for c in cells))
+    return "\n".join(lines)
+
+
+class PromptCompressor:
+    """
+    Сжатие текстов секций/passages перед отправкой в LLM. Один экземпляр
+    на один промпт: повторы строк отслеживаются между всеми секциями промпта.
+
+    - пробелы и пустые строки нормализуются;
+    - первая строка, повторяющая title секции, удаляется (заголовок уже есть в TITLE:);
+    - строки не короче min_repeat_chars, уже встречавшиеся в этом промпте
+      (навигация, дублирующиеся абзацы), удаляются; короткие строки ("Важно!",
+      пункты списков) не трогаются;
+    - compact_attributes — список атрибутов таблицей (format_attributes_table).
+
+    tokens_before/tokens_after — оценка (estimate_tokens) по всем сжатым фрагментам;
+    их разность равна экономии на весь промпт, остальной текст не меняется.
+    """
+
+    def __init__(
+        self,
+        min_repeat_chars: int = 20,
+        compact_attributes: bool = False,
+    ) -> None:
+        self.min_repeat_chars = min_repeat_chars
+        self.compact_attributes = compact_attributes
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._seen_lines: Set[str] = set()
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def _record(self, before: str, after: str) -> str:
+        self.tokens_before += estimate_tokens(before)
+        self.tokens_after += estimate_tokens(after)
+        return after
+
+    def section_text(self, title: str, text: str) -> str:
+        title_key = _heading_key(title) if title else ""
+        kept: List[str] = []
+        first_line = True
+        for line in normalize_whitespace(text).split("\n"):
+            if not line:
+                if kept and kept[-1]:
+                    kept.append(line)
+                continue
+            key = normalize_text(line)
+            if first_line and title_key and _heading_key(line) == title_key:
+                first_line = False
+                continue
+            first_line = False
+            if len(key) >= self.min_repeat_chars:
+                if key in self._seen_lines:
+                    continue
+                self._seen_lines.add(key)
+            kept.append(line)
+        return self._record(text, "\n".join(kept).strip())
+
+    def attributes(self, attrs: List[Attribute], formatted: str) -> str:
+        """
+        formatted — обычное представление списка; при compact_attributes
+        возвращается табличное, иначе formatted без изменений.
+        """
+        if not self.compact_attributes:
+            return formatted
+        return self._record(formatted, format_attributes_table(attrs))
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
+
+
+@dataclass(frozen=True)
+class PromptParts:
+    """
+    Промпт, разделённый на статический префикс и динамический суффикс.
+
+    static_prefix (роль, правила, формат вывода, схема) побайтно одинаков для всех
+    вызовов одного шага и одной версии, поэтому у провайдера срабатывает кэш
+    контекста по общему префиксу. Всё, что зависит от запроса (query, focus_summary,
+    passages, атрибуты), — только в dynamic_suffix, после префикса.
+
+    version меняется вручную при любой правке префикса; prefix_digest позволяет
+    заметить, что префикс изменился без смены версии.
+
+    tokens_saved — оценка токенов, сэкономленных сжатием (PromptCompressor).
+    """
+
+    name: str
+    version: str
+    static_prefix: str
+    dynamic_suffix: str
+    tokens_saved: int = 0
+
+    @property
+    def text(self) -> str:
+        if not self.static_prefix:
+            return self.dynamic_suffix
+        return f"{self.static_prefix}\n\n{self.dynamic_suffix}"
+
+    @property
+    def prefix_digest(self) -> str:
+        return normalized_digest([self.static_prefix])
+
+    @property
+    def version_tag(self) -> str:
+        """
+        Метка для метаданных и ключей кэша: name@version.
+        """
+        return f"{self.name}@{self.version}"
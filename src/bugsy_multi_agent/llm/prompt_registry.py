@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import re
+import string
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bugsy_multi_agent.analysis.text_normalize import normalized_digest
+from bugsy_multi_agent.llm.prompt_parts import PromptParts
+
+
+# Шаг пайплайна -> подпапка data/prompts
+STAGE_DIRS: Dict[str, str] = {
+    "ontology_retriever": "ontologyRAG_retriever",
+    "attribute_generator": "attribute generator",
+    "scenario_generator": "scenario_generator",
+}
+
+# Плейсхолдеры, которые шаг умеет подставить (для ctx.* — корень ctx)
+ALLOWED_FIELDS: Dict[str, frozenset] = {
+    "ontology_retriever": frozenset({"query", "sections_text", "output_schema_description"}),
+    "attribute_generator": frozenset(
+        {"ctx", "query_text", "core_text", "supp_text", "domain_entities_text", "hints_text"}
+    ),
+    "scenario_generator": frozenset(
+        {"ctx", "query_text", "core_text", "supp_text", "attrs_text"}
+    ),
+}
+
+_VERSION_RE = re.compile(r"_(\d+)$")
+_FIELD_ROOT_RE = re.compile(r"^[^.\[]+")
+_formatter = string.Formatter()
+
+# (литерал, имя поля, format_spec, conversion) — результат string.Formatter.parse
+_Chunk = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+class PromptTemplateError(ValueError):
+    """
+    Шаблон промпта не найден или некорректен.
+    """
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Предкомпилированный шаблон промпта из data/prompts/<шаг>/<NAME>_<версия>.txt.
+
+    Текст разбирается один раз при загрузке: плейсхолдеры проверяются по
+    ALLOWED_FIELDS шага, а рендеринг только подставляет значения в готовые
+    фрагменты. Всё до первого плейсхолдера (до последней пустой строки перед ним)
+    считается статическим префиксом (см. PromptParts).
+
+    Файлы скопированы из f-строк Python, поэтому в них встречается \\" —
+    при загрузке он заменяется на ", а {{ }} работают как в str.format.
+    """
+
+    stage: str
+    name: str
+    version: str
+    path: Path
+    digest: str
+    static_prefix: str
+    chunks: Tuple[_Chunk, ...]
+
+    @property
+    def version_tag(self) -> str:
+        """
+        Версия для метаданных: имя файла и начало digest текста, чтобы правка
+        шаблона на месте тоже меняла prompt_version (как в list-prompts).
+        """
+        return f"{self.stage}@{self.name}#{self.digest[:8]}"
+
+    def render(self, values: Dict[str, Any]) -> PromptParts:
+        parts: List[str] = []
+        for literal, field_name, format_spec, conversion in self.chunks:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            value, _ = _formatter.get_field(field_name, (), values)
+            value = _formatter.convert_field(value, conversion)
+            parts.append(_formatter.format_field(value, format_spec or ""))
+
+        return PromptParts(
+            name=self.stage,
+            version=self.name,
+            static_prefix=self.static_prefix,
+            dynamic_suffix="".join(parts).strip(),
+        )
+
+
+def compile_prompt_template(stage: str, path: Path) -> PromptTemplate:
+    """
+    Читает и предкомпилирует шаблон; PromptTemplateError при ошибке разбора
+    или неизвестном плейсхолдере.
+    """
+    text = path.read_text(encoding="utf-8").replace('\\"', '"').strip()
+    try:
+        chunks: List[_Chunk] = list(_formatter.parse(text))
+    except ValueError as e:
+        raise PromptTemplateError(f"{path}: {e}") from e
+
+    allowed = ALLOWED_FIELDS[stage]
+    for _, field_name, _, _ in chunks:
+        if field_name is None:
+            continue
+        match = _FIELD_ROOT_RE.match(field_name)
+        if not match or match.group(0) not in allowed:
+            raise PromptTemplateError(
+                f"{path}: unknown placeholder {{{field_name}}} for stage {stage}; "
+                f"allowed: {', '.join(sorted(allowed))}"
+            )
+
+    # Статический префикс — начало первого литерала до последней пустой строки
+    static_prefix = ""
+    if chunks and chunks[0][1] is not None:
+        first_literal = chunks[0][0]
+        cut = first_literal.rfind("\n\n")
+        if cut != -1:
+            static_prefix = first_literal[:cut].strip()
+            chunks[0] = (first_literal[cut + 2:],) + chunks[0][1:]
+
+    version_match = _VERSION_RE.search(path.stem)
+    return PromptTemplate(
+        stage=stage,
+        name=path.stem,
+        version=version_match.group(1) if version_match else "",
+        path=path,
+        digest=normalized_digest([text]),
+        static_prefix=static_prefix,
+        chunks=tuple(chunks),
+    )
+
+
+class PromptRegistry:
+    """
+    Все шаблоны из data/prompts, загруженные и проверенные один раз.
+
+    Шаблон выбирается по имени файла без расширения (AG_prompt_2)
+    или только по версии ("2").
+    """
+
+    def __init__(self, prompts_dir: Path) -> None:
+        self.prompts_dir = prompts_dir
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        for stage, dirname in STAGE_DIRS.items():
+            stage_dir = prompts_dir / dirname
+            templates: Dict[str, PromptTemplate] = {}
+            if stage_dir.is_dir():
+                for path in sorted(stage_dir.glob("*.txt")):
+                    template = compile_prompt_template(stage, path)
+                    templates[template.name] = template
+            self._templates[stage] = templates
+
+    def list_templates(self) -> List[PromptTemplate]:
+        return [t for templates in self._templates.values() for t in templates.values()]
+
+    def get(self, stage: str, name: str) -> PromptTemplate:
+        if stage not in self._templates:
+            raise PromptTemplateError(f"Unknown prompt stage: {stage}")
+        templates = self._templates[stage]
+        if name in templates:
+            return templates[name]
+        by_version = [t for t in templates.values() if t.version == name]
+        if len(by_version) == 1:
+            return by_version[0]
+        raise PromptTemplateError(
+            f"Prompt template {name!r} not found for stage {stage}; "
+            f"available: {', '.join(sorted(templates)) or 'none'}"
+        )
+
+
+_registries: Dict[Path, PromptRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_prompt_registry(prompts_dir: Path) -> PromptRegistry:
+    """
+    Реестр шаблонов для каталога; загружается один раз на процесс.
+    """
+    with _registries_lock:
+        registry = _registries.get(prompts_dir)
+        if registry is None:
+            registry = PromptRegistry(prompts_dir)
+            _registries[prompts_dir] = registry
+        return registry
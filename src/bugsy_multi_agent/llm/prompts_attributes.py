@@ -1,75 +1,80 @@
 from __future__ import annotations
 
+from dataclasses import replace
+from functools import lru_cache
 from typing import List
 
+from bugsy_multi_agent.llm.prompt_compression import PromptCompressor
+from bugsy_multi_agent.llm.prompt_parts import PromptParts
+from bugsy_multi_agent.llm.prompt_registry import PromptTemplate
 from bugsy_multi_agent.models.testing_context import TestingContext, Passage
 
 
-def _format_passages(passages: List[Passage], label: str) -> str:
+def _format_passages(
+    passages: List[Passage],
+    label: str,
+    compressor: PromptCompressor | None = None,
+) -> str:
     """
     Форматирует список Passages в удобный для LLM текстовый блок.
+    compressor — сжать summary (см. PromptCompressor).
     """
     if not passages:
         return f"{label}: []"
 
     lines = [f"{label}:"]
     for idx, p in enumerate(passages, start=1):
+        summary = compressor.section_text(p.title, p.summary) if compressor else p.summary
         lines.append(
             f"[{idx}] section_id={p.section_id}\n"
             f"TITLE: {p.title}\n"
-            f"SUMMARY: {p.summary}\n"
+            f"SUMMARY: {summary}\n"
         )
     return "\n".join(lines)
 
 
-def build_attribute_generator_prompt(
-    ctx: TestingContext,
-    query_override: str | None = None,
-) -> str:
+def _output_format(envelope_key: str | None) -> tuple[str, str]:
     """
-    Собирает промпт для AttributeGeneratorAgent.
+    Описание формата вывода и финальное напоминание.
 
-    query_override позволяет подменить текст запроса
-    (например, взять его из data/queries.json).
+    envelope_key задаёт обёртку {"<envelope_key>": [...]} — она нужна для
+    JSON-режима провайдера (response_format=json_object требует объект
+    на верхнем уровне). Без него — голый JSON-массив, как раньше.
     """
-    core_text = _format_passages(ctx.core_passages, "CORE PASSAGES")
-    supp_text = _format_passages(ctx.supporting_passages, "SUPPORTING PASSAGES")
-
-    query_text = (query_override or ctx.query).strip()
-
-    domain_entities_text = (
-        "\n".join(f"- {e}" for e in ctx.domain_entities)
-        if ctx.domain_entities
-        else "нет явных сущностей"
-    )
-    hints_text = (
-        "\n".join(f"- {h}" for h in ctx.hints_for_tests)
-        if ctx.hints_for_tests
-        else "нет подсказок, опирайся на тексты секций"
+    if envelope_key:
+        return (
+            f'- строго один JSON-объект с единственным полем "{envelope_key}" —\n'
+            "  массивом объектов Attribute:\n"
+            f'  {{"{envelope_key}": [{{...}}, {{...}}, ...]}}',
+            f'Напомню: верни только JSON-объект {{"{envelope_key}": [...]}} '
+            "с объектами Attribute, без дополнительного текста до или после.",
+        )
+    return (
+        "- строго один JSON-массив объектов Attribute.\n"
+        f'- без обёртки вида {{ "attributes": [...] }}, только список:\n'
+        f"  [{{...}}, {{...}}, ...]",
+        "Напомню: верни только JSON-массив объектов Attribute, "
+        "без дополнительного текста до или после.",
     )
 
-    prompt = f"""
-Ты выступаешь в роли Attribute Generator Agent в системе тест-дизайна WEB-интерфейса "Консоли маркетолога".
 
-Тебе дан TestingContext по запросу пользователя.
+# Версия статического префикса промпта; повышать при любой его правке
+ATTRIBUTE_GENERATOR_PROMPT_VERSION = "2"
 
-Запрос пользователя (query):
-\"\"\"{query_text}\"\"\"
 
-Фокус-резюме (focus_summary):
-\"\"\"{ctx.focus_summary}\"\"\"
-
-CORE PASSAGES и SUPPORTING PASSAGES описывают ключевые требования и поведение системы:
-
-{core_text}
-
-{supp_text}
+@lru_cache(maxsize=None)
+def _static_prefix(envelope_key: str | None) -> str:
+    """
+    Статическая часть промпта: роль, задача, требования, формат и схема.
+    Не зависит от запроса, поэтому побайтно одинакова для всех вызовов
+    (общий префикс для кэша контекста у провайдера).
+    """
+    output_format, _ = _output_format(envelope_key)
 
-domain_entities:
-{domain_entities_text}
+    prefix = f"""
+Ты выступаешь в роли Attribute Generator Agent в системе тест-дизайна WEB-интерфейса "Консоли маркетолога".
 
-hints_for_tests:
-{hints_text}
+Тебе дан TestingContext по запросу пользователя — он приведён ниже, после инструкций.
 
 Твоя задача:
 - на основе core_passages, supporting_passages, domain_entities и hints_for_tests
@@ -89,9 +94,7 @@ hints_for_tests:
   - source_quotes: массив коротких цитат из документации, подтверждающих этот атрибут.
 
 Формат вывода:
-- строго один JSON-массив объектов Attribute.
-- без обёртки вида {{ "attributes": [...] }}, только список:
-  [{{...}}, {{...}}, ...]
+{output_format}
 
 Схема одного элемента массива:
 {{
@@ -110,7 +113,100 @@ hints_for_tests:
 - Не выдумывай требования, которых нет в документации.
 - Если информация не очевидна, формулируй атрибут так, чтобы он оставался честным и опирался на текст.
 - Старайся не делать дублирующих атрибутов с одинаковым смыслом.
+"""
+    return prefix.strip()
+
+
+def build_attribute_generator_prompt_parts(
+    ctx: TestingContext,
+    query_override: str | None = None,
+    envelope_key: str | None = None,
+    template: PromptTemplate | None = None,
+    compressor: PromptCompressor | None = None,
+) -> PromptParts:
+    """
+    Промпт AttributeGeneratorAgent, разделённый на статический префикс
+    и динамический суффикс (см. PromptParts).
+
+    template — шаблон из data/prompts (PromptRegistry) вместо встроенного;
+    такие шаблоны сами задают формат вывода, envelope_key к ним не применяется.
+    compressor — сжатие passages; без него текст промпта не меняется.
+    """
+    core_text = _format_passages(ctx.core_passages, "CORE PASSAGES", compressor)
+    supp_text = _format_passages(ctx.supporting_passages, "SUPPORTING PASSAGES", compressor)
+    tokens_saved = compressor.tokens_saved if compressor else 0
 
-Напомню: верни только JSON-массив объектов Attribute, без дополнительного текста до или после.
+    query_text = (query_override or ctx.query).strip()
+
+    domain_entities_text = (
+        "\n".join(f"- {e}" for e in ctx.domain_entities)
+        if ctx.domain_entities
+        else "нет явных сущностей"
+    )
+    hints_text = (
+        "\n".join(f"- {h}" for h in ctx.hints_for_tests)
+        if ctx.hints_for_tests
+        else "нет подсказок, опирайся на тексты секций"
+    )
+
+    if template is not None:
+        parts = template.render(
+            {
+                "ctx": ctx,
+                "query_text": query_text,
+                "core_text": core_text,
+                "supp_text": supp_text,
+                "domain_entities_text": domain_entities_text,
+                "hints_text": hints_text,
+            }
+        )
+        return replace(parts, tokens_saved=tokens_saved)
+
+    _, output_reminder = _output_format(envelope_key)
+    suffix = f"""
+Запрос пользователя (query):
+\"\"\"{query_text}\"\"\"
+
+Фокус-резюме (focus_summary):
+\"\"\"{ctx.focus_summary}\"\"\"
+
+CORE PASSAGES и SUPPORTING PASSAGES описывают ключевые требования и поведение системы:
+
+{core_text}
+
+{supp_text}
+
+domain_entities:
+{domain_entities_text}
+
+hints_for_tests:
+{hints_text}
+
+{output_reminder}
 """
-    return prompt.strip()
+    return PromptParts(
+        name="attribute_generator",
+        version=ATTRIBUTE_GENERATOR_PROMPT_VERSION,
+        static_prefix=_static_prefix(envelope_key),
+        dynamic_suffix=suffix.strip(),
+        tokens_saved=tokens_saved,
+    )
+
+
+def build_attribute_generator_prompt(
+    ctx: TestingContext,
+    query_override: str | None = None,
+    envelope_key: str | None = None,
+) -> str:
+    """
+    Собирает промпт для AttributeGeneratorAgent.
+
+    query_override позволяет подменить текст запроса
+    (например, взять его из data/queries.json).
+    envelope_key — обернуть ответ в объект для JSON-режима (см. _output_format).
+    """
+    return build_attribute_generator_prompt_parts(
+        ctx,
+        query_override=query_override,
+        envelope_key=envelope_key,
+    ).text
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+from dataclasses import replace
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping
 
+from bugsy_multi_agent.llm.prompt_compression import PromptCompressor
+from bugsy_multi_agent.llm.prompt_parts import PromptParts
+from bugsy_multi_agent.llm.prompt_registry import PromptTemplate
 
-def _format_section_candidates(raw: Dict[str, Any]) -> str:
+
+# Версии статических префиксов промптов; повышать при любой их правке
+ONTOLOGY_RETRIEVER_PROMPT_VERSION = "2"
+SECTION_SUMMARY_PROMPT_VERSION = "2"
+ONTOLOGY_REDUCE_PROMPT_VERSION = "2"
+
+
+def _format_section_candidates(
+    raw: Mapping[str, Any],
+    compressor: PromptCompressor | None = None,
+) -> str:
     """
     Превращает section_candidates из raw JSON OntologyRAG в удобочитаемый текст.
-    В LLM-промпт отдаём только нужные поля.
+    В LLM-промпт отдаём только нужные поля; compressor — сжать тексты секций.
     """
     sections = raw.get("section_candidates", [])
     lines = []
@@ -16,6 +31,8 @@ def _format_section_candidates(raw: Dict[str, Any]) -> str:
         title = sec.get("title", "")
         score = sec.get("score", 0)
         text = sec.get("text", "")
+        if compressor is not None:
+            text = compressor.section_text(title, text)
 
         lines.append(
             f"[#{idx}] section_id={section_id} score={score}\n"
@@ -30,20 +47,13 @@ def _format_section_candidates(raw: Dict[str, Any]) -> str:
     return "\n\n".join(lines)
 
 
-def build_ontology_retriever_prompt(
-    raw_context: Dict[str, Any],
-    query_override: str | None = None,
-) -> str:
+@lru_cache(maxsize=None)
+def _ontology_output_schema() -> str:
     """
-    Собирает промпт для OntologyRAGRetrieverAgent.
-
-    query_override позволяет подменить текст запроса
-    (например, взять его из data/queries.json).
+    Описание схемы TestingContext для промпта; сериализуется один раз на процесс
+    и используется и встроенным промптом, и шаблонами из data/prompts.
     """
-    query = (query_override or raw_context.get("query", "")).strip()
-    sections_text = _format_section_candidates(raw_context)
-
-    output_schema_description = json.dumps(
+    return json.dumps(
         {
             "query": "string (исходный запрос пользователя)",
             "focus_summary": "string (очень короткое резюме, 2-3 предложения, что именно нужно протестировать)",
@@ -75,10 +85,18 @@ def build_ontology_retriever_prompt(
         indent=2,
     )
 
-    prompt = f"""
+
+@lru_cache(maxsize=None)
+def _ontology_retriever_prefix() -> str:
+    """
+    Статическая часть промпта OntologyRAG Retriever: роль, задача, правила, схема.
+    """
+    output_schema_description = _ontology_output_schema()
+
+    prefix = f"""
 Ты выступаешь в роли OntologyRAG Retriever Agent для системы тест-дизайна WEB-интерфейса "Консоли маркетолога".
 
-Тебе дан:
+Тебе дан (приведено ниже, после инструкций):
 1) исходный запрос пользователя (query),
 2) список отобранных секций документации (section_candidates) с оценкой релевантности.
 
@@ -103,7 +121,38 @@ def build_ontology_retriever_prompt(
 - Структура должна соответствовать описанию ниже (TestingContext):
 
 {output_schema_description}
+"""
+    return prefix.strip()
+
+
+def build_ontology_retriever_prompt_parts(
+    raw_context: Mapping[str, Any],
+    query_override: str | None = None,
+    template: PromptTemplate | None = None,
+    compressor: PromptCompressor | None = None,
+) -> PromptParts:
+    """
+    Промпт OntologyRAGRetrieverAgent, разделённый на статический префикс
+    и динамический суффикс (см. PromptParts).
+
+    template — шаблон из data/prompts (PromptRegistry) вместо встроенного.
+    compressor — сжатие текстов секций; без него текст промпта не меняется.
+    """
+    query = (query_override or raw_context.get("query", "")).strip()
+    sections_text = _format_section_candidates(raw_context, compressor)
+    tokens_saved = compressor.tokens_saved if compressor else 0
+
+    if template is not None:
+        parts = template.render(
+            {
+                "query": query,
+                "sections_text": sections_text,
+                "output_schema_description": _ontology_output_schema(),
+            }
+        )
+        return replace(parts, tokens_saved=tokens_saved)
 
+    suffix = f"""
 Исходный запрос пользователя (query):
 \"\"\"{query}\"\"\"
 
@@ -113,4 +162,184 @@ def build_ontology_retriever_prompt(
 
 Напомню: верни только JSON-объект TestingContext, без дополнительного текста до или после JSON.
 """
-    return prompt.strip()
+    return PromptParts(
+        name="ontology_retriever",
+        version=ONTOLOGY_RETRIEVER_PROMPT_VERSION,
+        static_prefix=_ontology_retriever_prefix(),
+        dynamic_suffix=suffix.strip(),
+        tokens_saved=tokens_saved,
+    )
+
+
+def build_ontology_retriever_prompt(
+    raw_context: Mapping[str, Any],
+    query_override: str | None = None,
+) -> str:
+    """
+    Собирает промпт для OntologyRAGRetrieverAgent.
+
+    query_override позволяет подменить текст запроса
+    (например, взять его из data/queries.json).
+    """
+    return build_ontology_retriever_prompt_parts(raw_context, query_override).text
+
+
+# ---------- map-reduce: по секции на вызов, затем сборка ----------
+
+
+@lru_cache(maxsize=None)
+def _section_summary_prefix() -> str:
+    output_schema_description = json.dumps(
+        {
+            "section_id": "string (section_id разбираемой секции)",
+            "title": "string",
+            "role": "core | supporting | discarded",
+            "importance": "high | medium | low",
+            "summary": "string (краткое содержание для тест-дизайнера, 3-5 предложений; пусто для discarded)",
+            "domain_entities": ["EntityName", "..."],
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+    prefix = f"""
+Ты выступаешь в роли OntologyRAG Retriever Agent для системы тест-дизайна WEB-интерфейса "Консоли маркетолога".
+
+Тебе дан запрос пользователя и ОДНА секция документации (приведены ниже, после инструкций).
+
+Твоя задача:
+- определить роль секции для UI-тестирования по запросу:
+  - core: ключевая секция, на которой обязательно надо базировать тесты;
+  - supporting: уточняющие детали, примеры, крайние случаи;
+  - discarded: шум (аудит, маркетинг, нерелевантные описания);
+- оценить важность (importance);
+- для core/supporting сделать короткое summary для тест-дизайнера;
+- выделить domain_entities: важные сущности домена из этой секции.
+
+Не придумывай содержимое секции, опирайся только на переданный текст.
+
+Формат вывода — строго один JSON-объект без пояснений:
+
+{output_schema_description}
+"""
+    return prefix.strip()
+
+
+def build_section_summary_prompt_parts(
+    query: str,
+    section: Mapping[str, Any],
+    compressor: PromptCompressor | None = None,
+) -> PromptParts:
+    section_id = section.get("section_id", "")
+    title = section.get("title", "")
+    text = section.get("text", "")
+    if compressor is not None:
+        text = compressor.section_text(title, text)
+
+    suffix = f"""
+Запрос пользователя (query):
+\"\"\"{query.strip()}\"\"\"
+
+Секция section_id={section_id}
+TITLE: {title}
+TEXT:
+{text}
+--- END SECTION ---
+
+Напомню: верни только JSON-объект, без дополнительного текста до или после JSON.
+"""
+    return PromptParts(
+        name="section_summary",
+        version=SECTION_SUMMARY_PROMPT_VERSION,
+        static_prefix=_section_summary_prefix(),
+        dynamic_suffix=suffix.strip(),
+        tokens_saved=compressor.tokens_saved if compressor else 0,
+    )
+
+
+def build_section_summary_prompt(
+    query: str,
+    section: Mapping[str, Any],
+) -> str:
+    """
+    Map-шаг: промпт для классификации и summary одной секции.
+    Ответ — один JSON-объект SectionSummary.
+    """
+    return build_section_summary_prompt_parts(query, section).text
+
+
+@lru_cache(maxsize=None)
+def _ontology_reduce_prefix() -> str:
+    output_schema_description = json.dumps(
+        {
+            "focus_summary": "string (очень короткое резюме, 2-3 предложения, что именно нужно протестировать)",
+            "domain_entities": ["EntityName", "..."],
+            "hints_for_tests": [
+                "Короткая подсказка для тестов, основанная на документации"
+            ],
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+    prefix = f"""
+Ты выступаешь в роли OntologyRAG Retriever Agent для системы тест-дизайна WEB-интерфейса "Консоли маркетолога".
+
+Секции документации по запросу уже разобраны: для каждой известны роль, важность,
+краткое summary и сущности домена (приведены ниже, после инструкций).
+
+Твоя задача:
+- сформулировать focus_summary: что именно нужно протестировать по запросу;
+- свести domain_entities: важные сущности домена без дублей;
+- сформулировать hints_for_tests: какие аспекты логики и ограничений надо покрыть тестами.
+
+Формат вывода — строго один JSON-объект без пояснений:
+
+{output_schema_description}
+"""
+    return prefix.strip()
+
+
+def build_ontology_reduce_prompt_parts(
+    query: str,
+    section_summaries: List[Dict[str, Any]],
+) -> PromptParts:
+    lines = []
+    for idx, sec in enumerate(section_summaries, start=1):
+        entities = ", ".join(sec.get("domain_entities", []))
+        lines.append(
+            f"[#{idx}] section_id={sec.get('section_id', '')} "
+            f"role={sec.get('role', '')} importance={sec.get('importance', '')}\n"
+            f"TITLE: {sec.get('title', '')}\n"
+            f"SUMMARY: {sec.get('summary', '')}\n"
+            f"ENTITIES: {entities}"
+        )
+    summaries_text = "\n\n".join(lines) if lines else "NO SECTIONS."
+
+    suffix = f"""
+Запрос пользователя (query):
+\"\"\"{query.strip()}\"\"\"
+
+Разобранные секции:
+
+{summaries_text}
+
+Напомню: верни только JSON-объект, без дополнительного текста до или после JSON.
+"""
+    return PromptParts(
+        name="ontology_reduce",
+        version=ONTOLOGY_REDUCE_PROMPT_VERSION,
+        static_prefix=_ontology_reduce_prefix(),
+        dynamic_suffix=suffix.strip(),
+    )
+
+
+def build_ontology_reduce_prompt(
+    query: str,
+    section_summaries: List[Dict[str, Any]],
+) -> str:
+    """
+    Reduce-шаг: по коротким summary уже разобранных секций собрать
+    focus_summary, domain_entities и hints_for_tests.
+    """
+    return build_ontology_reduce_prompt_parts(query, section_summaries).text
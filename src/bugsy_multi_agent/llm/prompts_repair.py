@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import json
+from typing import Any, List, Tuple
+
+
+def build_repair_prompt(
+    item_kind: str,
+    field_names: List[str],
+    failures: List[Tuple[Any, str]],
+    envelope_key: str | None = None,
+) -> str:
+    """
+    Короткий промпт на исправление только невалидных элементов ответа.
+
+    failures — пары (исходный элемент, текст ошибки валидации).
+    Ожидаемый ответ — JSON-массив исправленных элементов той же длины и в том же порядке;
+    с envelope_key — объект {"<envelope_key>": [...]} (для JSON-режима).
+    """
+    if envelope_key:
+        answer_format = f'JSON-объект {{"{envelope_key}": [...]}} с массивом'
+    else:
+        answer_format = "JSON-массив"
+    lines = []
+    for idx, (item, error) in enumerate(failures, start=1):
+        lines.append(
+            f"[{idx}] ITEM:\n{json.dumps(item, ensure_ascii=False)}\n"
+            f"ERRORS: {error}"
+        )
+    items_text = "\n\n".join(lines)
+
+    prompt = f"""
+Следующие объекты {item_kind} из твоего предыдущего ответа не прошли валидацию.
+Исправь только указанные ошибки, не меняя смысл и остальные поля.
+
+Поля объекта {item_kind}: {", ".join(field_names)}
+
+{items_text}
+
+Верни строго {answer_format} из {len(failures)} исправленных объектов в том же порядке,
+без пояснений и текста до или после JSON.
+"""
+    return prompt.strip()
@@ -1,21 +1,31 @@
 from __future__ import annotations
 
+from dataclasses import replace
+from functools import lru_cache
 from typing import List
 
+from bugsy_multi_agent.llm.prompt_compression import PromptCompressor
+from bugsy_multi_agent.llm.prompt_parts import PromptParts
+from bugsy_multi_agent.llm.prompt_registry import PromptTemplate
 from bugsy_multi_agent.models.testing_context import TestingContext, Passage
 from bugsy_multi_agent.models.attribute import Attribute
 
 
-def _format_passages(passages: List[Passage], label: str) -> str:
+def _format_passages(
+    passages: List[Passage],
+    label: str,
+    compressor: PromptCompressor | None = None,
+) -> str:
     if not passages:
         return f"{label}: []"
 
     lines = [f"{label}:"]
     for idx, p in enumerate(passages, start=1):
+        summary = compressor.section_text(p.title, p.summary) if compressor else p.summary
         lines.append(
             f"[{idx}] section_id={p.section_id}\n"
             f"TITLE: {p.title}\n"
-            f"SUMMARY: {p.summary}\n"
+            f"SUMMARY: {summary}\n"
         )
     return "\n".join(lines)
 
@@ -38,45 +48,49 @@ def _format_attributes(attrs: List[Attribute]) -> str:
     return "\n".join(lines)
 
 
-def build_scenario_generator_prompt(
-    ctx: TestingContext,
-    attributes: List[Attribute],
-    query_override: str | None = None,
-) -> str:
+def _output_format(envelope_key: str | None) -> tuple[str, str]:
     """
-    Собирает промпт для ScenarioGeneratorAgent.
+    Описание формата вывода и финальное напоминание.
 
-    query_override позволяет подменить текст запроса
-    (например, взять его из data/queries.json).
+    envelope_key задаёт обёртку {"<envelope_key>": [...]} — она нужна для
+    JSON-режима провайдера (response_format=json_object требует объект
+    на верхнем уровне). Без него — голый JSON-массив, как раньше.
     """
-    core_text = _format_passages(ctx.core_passages, "CORE PASSAGES")
-    supp_text = _format_passages(ctx.supporting_passages, "SUPPORTING PASSAGES")
-    attrs_text = _format_attributes(attributes)
-
-    query_text = (query_override or ctx.query).strip()
-
-    prompt = f"""
-Ты выступаешь в роли Scenario Generator Agent в системе тест-дизайна WEB-интерфейса "Консоли маркетолога".
-
-Тебе дано:
-- TestingContext по запросу пользователя,
-- список атомарных атрибутов (требований), которые нужно покрыть сценариями.
-
-Запрос пользователя (query):
-\"\"\"{query_text}\"\"\"
+    if envelope_key:
+        return (
+            f'- строго один JSON-объект с единственным полем "{envelope_key}" —\n'
+            "  массивом объектов Scenario:\n"
+            f'  {{"{envelope_key}": [{{...}}, {{...}}, ...]}}',
+            f'Напомню: верни только JSON-объект {{"{envelope_key}": [...]}} '
+            "с объектами Scenario, без дополнительного текста до или после.",
+        )
+    return (
+        "- строго один JSON-массив объектов Scenario.\n"
+        f'- без обёртки вида {{ "scenarios": [...] }}, только список:\n'
+        f"  [{{...}}, {{...}}, ...]",
+        "Напомню: верни только JSON-массив объектов Scenario, "
+        "без дополнительного текста до или после.",
+    )
 
-Фокус-резюме (focus_summary):
-\"\"\"{ctx.focus_summary}\"\"\"
 
-CORE PASSAGES и SUPPORTING PASSAGES:
+# Версия статического префикса промпта; повышать при любой его правке
+SCENARIO_GENERATOR_PROMPT_VERSION = "2"
 
-{core_text}
 
-{supp_text}
+@lru_cache(maxsize=None)
+def _static_prefix(envelope_key: str | None) -> str:
+    """
+    Статическая часть промпта: роль, задача, требования, формат и схема.
+    Побайтно одинакова для всех вызовов (общий префикс для кэша контекста).
+    """
+    output_format, _ = _output_format(envelope_key)
 
-Список атрибутов:
+    prefix = f"""
+Ты выступаешь в роли Scenario Generator Agent в системе тест-дизайна WEB-интерфейса "Консоли маркетолога".
 
-{attrs_text}
+Тебе дано (приведено ниже, после инструкций):
+- TestingContext по запросу пользователя,
+- список атомарных атрибутов (требований), которые нужно покрыть сценариями.
 
 Твоя задача:
 - сгенерировать набор тестовых сценариев UI-интерфейса, которые стратегически покрывают атрибуты;
@@ -91,9 +105,7 @@ CORE PASSAGES и SUPPORTING PASSAGES:
 - attributes_covered: массив id атрибутов, которые покрывает этот сценарий.
 
 Формат вывода:
-- строго один JSON-массив объектов Scenario.
-- без обёртки вида {{ "scenarios": [...] }}, только список:
-  [{{...}}, {{...}}, ...]
+{output_format}
 
 Схема одного элемента массива:
 {{
@@ -108,7 +120,93 @@ CORE PASSAGES и SUPPORTING PASSAGES:
 - Шаги должны быть реалистичными и соответствовать документации.
 - expected_result должен проверять, что система ведёт себя в соответствии с атрибутами из attributes_covered.
 - Не выдумывай поведение, которого нет в документации.
+"""
+    return prefix.strip()
+
 
-Напомню: верни только JSON-массив объектов Scenario, без дополнительного текста до или после.
+def build_scenario_generator_prompt_parts(
+    ctx: TestingContext,
+    attributes: List[Attribute],
+    query_override: str | None = None,
+    envelope_key: str | None = None,
+    template: PromptTemplate | None = None,
+    compressor: PromptCompressor | None = None,
+) -> PromptParts:
+    """
+    Промпт ScenarioGeneratorAgent, разделённый на статический префикс
+    и динамический суффикс (см. PromptParts).
+
+    template — шаблон из data/prompts (PromptRegistry) вместо встроенного;
+    такие шаблоны сами задают формат вывода, envelope_key к ним не применяется.
+    compressor — сжатие passages и списка атрибутов; без него текст промпта не меняется.
+    """
+    core_text = _format_passages(ctx.core_passages, "CORE PASSAGES", compressor)
+    supp_text = _format_passages(ctx.supporting_passages, "SUPPORTING PASSAGES", compressor)
+    attrs_text = _format_attributes(attributes)
+    if compressor is not None:
+        attrs_text = compressor.attributes(attributes, attrs_text)
+    tokens_saved = compressor.tokens_saved if compressor else 0
+
+    query_text = (query_override or ctx.query).strip()
+
+    if template is not None:
+        parts = template.render(
+            {
+                "ctx": ctx,
+                "query_text": query_text,
+                "core_text": core_text,
+                "supp_text": supp_text,
+                "attrs_text": attrs_text,
+            }
+        )
+        return replace(parts, tokens_saved=tokens_saved)
+
+    _, output_reminder = _output_format(envelope_key)
+
+    suffix = f"""
+Запрос пользователя (query):
+\"\"\"{query_text}\"\"\"
+
+Фокус-резюме (focus_summary):
+\"\"\"{ctx.focus_summary}\"\"\"
+
+CORE PASSAGES и SUPPORTING PASSAGES:
+
+{core_text}
+
+{supp_text}
+
+Список атрибутов:
+
+{attrs_text}
+
+{output_reminder}
 """
-    return prompt.strip()
+    return PromptParts(
+        name="scenario_generator",
+        version=SCENARIO_GENERATOR_PROMPT_VERSION,
+        static_prefix=_static_prefix(envelope_key),
+        dynamic_suffix=suffix.strip(),
+        tokens_saved=tokens_saved,
+    )
+
+
+def build_scenario_generator_prompt(
+    ctx: TestingContext,
+    attributes: List[Attribute],
+    query_override: str | None = None,
+    envelope_key: str | None = None,
+) -> str:
+    """
+    Собирает промпт для ScenarioGeneratorAgent.
+
+    query_override позволяет подменить текст запроса
+    (например, взять его из data/queries.json).
+    envelope_key — обернуть ответ в объект для JSON-режима (см. _output_format).
+    """
+    return build_scenario_generator_prompt_parts(
+        ctx,
+        attributes,
+        query_override=query_override,
+        envelope_key=envelope_key,
+    ).text
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from bugsy_multi_agent.llm.client import LLMClient
+from bugsy_multi_agent.llm.json_utils import extract_json_from_text, unwrap_json_list
+from bugsy_multi_agent.llm.prompts_repair import build_repair_prompt
+
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def _validation_message(obj: Any, model_cls: Type[BaseModel]) -> str | None:
+    """
+    None, если obj валиден для model_cls, иначе короткий текст ошибок.
+    """
+    if not isinstance(obj, dict):
+        return "item is not a JSON object"
+    try:
+        model_cls.model_validate(obj)
+    except ValidationError as e:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or '<root>'}: {err['msg']}"
+            for err in e.errors(include_url=False)
+        )
+    return None
+
+
+def validate_items_with_repair(
+    items: List[Any],
+    model_cls: Type[M],
+    llm_client: LLMClient,
+    max_rounds: int,
+    item_kind: str | None = None,
+    json_object: bool = False,
+) -> List[M]:
+    """
+    Валидирует элементы JSON-массива из ответа LLM как model_cls.
+
+    Валидные элементы сохраняются, а невалидные (вместе с текстом ошибки) уходят
+    в короткий repair-промпт; исправленные встают на свои исходные позиции.
+    Не больше max_rounds раундов; что не удалось исправить — отбрасывается
+    с предупреждением. Если элементы были, но ни один не остался валидным —
+    ValueError; пустой массив валиден и даёт пустой список.
+
+    max_rounds = 0 — прежнее поведение: первая же ошибка пробрасывается.
+    json_object=True — repair-промпт просит объект-обёртку (JSON-режим провайдера).
+    """
+    item_kind = item_kind or model_cls.__name__
+    valid: Dict[int, M] = {}
+    failing: Dict[int, Any] = {}
+
+    for idx, obj in enumerate(items):
+        error = _validation_message(obj, model_cls)
+        if error is None:
+            valid[idx] = model_cls.model_validate(obj)
+        elif max_rounds <= 0:
+            raise ValueError(f"{item_kind} item #{idx + 1} is invalid: {error}")
+        else:
+            failing[idx] = obj
+
+    for round_no in range(1, max_rounds + 1):
+        if not failing:
+            break
+
+        order = list(failing)
+        errors = [_validation_message(failing[idx], model_cls) or "" for idx in order]
+        prompt = build_repair_prompt(
+            item_kind,
+            list(model_cls.model_fields),
+            [(failing[idx], error) for idx, error in zip(order, errors)],
+            envelope_key="items" if json_object else None,
+        )
+        try:
+            repaired = unwrap_json_list(
+                extract_json_from_text(
+                    llm_client.generate(prompt, json_object=json_object)
+                ),
+                "items",
+            )
+        except Exception as e:
+            print(f"Repair round {round_no} for {item_kind} failed: {e}")
+            continue
+        if not isinstance(repaired, list):
+            print(f"Repair round {round_no} for {item_kind}: response is not a JSON array")
+            continue
+
+        for idx, obj in zip(order, repaired):
+            if _validation_message(obj, model_cls) is None:
+                valid[idx] = model_cls.model_validate(obj)
+                del failing[idx]
+            else:
+                failing[idx] = obj
+
+        print(
+            f"Repair round {round_no} for {item_kind}: "
+            f"fixed {len(order) - len(failing)}/{len(order)} items."
+        )
+
+    if failing:
+        print(
+            f"Dropping {len(failing)} invalid {item_kind} items after "
+            f"{max_rounds} repair rounds."
+        )
+    if items and not valid:
+        raise ValueError(f"No valid {item_kind} items in LLM response")
+
+    return [valid[idx] for idx in sorted(valid)]
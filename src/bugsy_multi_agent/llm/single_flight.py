@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """
+    Выполняющийся вызов: результат или исключение ждут все дубликаты.
+    """
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных вызовов (single-flight).
+
+    do(key, fn): если вызов с тем же ключом уже выполняется, поток ждёт его
+    результата (или исключения) вместо собственного вызова fn. Результат
+    не кэшируется: как только первый вызов завершился, следующий do с тем же
+    ключом снова вызывает fn. Потокобезопасен.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call[Any]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Возвращает (результат, shared); shared=True — результат получен
+        от вызова, запущенного другим потоком.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
@@ -4,7 +4,6 @@ import argparse
 
 from bugsy_multi_agent.config.settings import settings
 from bugsy_multi_agent.data_access.json_io import list_json_files
-from bugsy_multi_agent.orchestration.pipeline import Pipeline
 
 
 def cmd_list_queries() -> None:
@@ -22,10 +21,70 @@ def cmd_list_queries() -> None:
         print(" -", path.stem)
 
 
+def cmd_list_prompts() -> None:
+    """
+    Показывает шаблоны промптов из data/prompts/ (проверяя их при загрузке).
+    """
+    from bugsy_multi_agent.llm.prompt_registry import get_prompt_registry
+
+    templates = get_prompt_registry(settings.prompts_dir).list_templates()
+    if not templates:
+        print("No prompt templates found in data/prompts/")
+        return
+
+    print("Available prompt templates (use --prompt STAGE=NAME):")
+    for template in templates:
+        print(f" - {template.stage}={template.name} (digest {template.digest[:8]})")
+
+
+def configure_settings(config_path: str | None, set_specs: list[str] | None) -> None:
+    """
+    Накладывает на settings TOML-конфиг, переменные окружения BUGSY_* и --set NAME=VALUE.
+    """
+    from bugsy_multi_agent.config.settings import SettingsError
+
+    overrides = {}
+    for spec in set_specs or []:
+        name, sep, value = spec.partition("=")
+        if not sep or not name:
+            raise SystemExit(f"Invalid --set value {spec!r}, expected NAME=VALUE")
+        overrides[name.strip()] = value
+
+    try:
+        settings.configure(config_path=config_path, overrides=overrides)
+    except SettingsError as e:
+        raise SystemExit(f"Invalid settings: {e}") from None
+
+
+def cmd_show_settings() -> None:
+    """
+    Печатает действующие значения настраиваемых параметров.
+    """
+    for name, value in settings.tunable_values().items():
+        print(f"{name} = {value!r}")
+
+
+def apply_prompt_overrides(specs: list[str] | None) -> None:
+    """
+    Разбирает --prompt STAGE=NAME и кладёт выбор в settings.prompt_templates.
+    """
+    for spec in specs or []:
+        stage, sep, name = spec.partition("=")
+        if not sep or not stage or not name:
+            raise SystemExit(f"Invalid --prompt value {spec!r}, expected STAGE=NAME")
+        settings.prompt_templates[stage] = name
+
+
 def cmd_run(query_id: str, full: bool) -> None:
     """
     Запускает пайплайн для указанного query_id.
+
+    Pipeline импортируется здесь, а не на уровне модуля: агенты, openai SDK
+    и pydantic-модели нужны только этой команде, list-queries без них
+    стартует в разы быстрее.
     """
+    from bugsy_multi_agent.orchestration.pipeline import Pipeline
+
     pipeline = Pipeline(settings=settings)
 
     if full:
@@ -41,20 +100,312 @@ def cmd_run(query_id: str, full: bool) -> None:
         )
 
 
+def cmd_corpus_coverage(query_ids: list[str], corpus_id: str) -> None:
+    """
+    Сводный отчёт покрытия атрибутов сценариями по нескольким query_id
+    (по умолчанию — по всем запросам, для которых есть сценарии).
+    """
+    from bugsy_multi_agent.agents.scenario_coverage_checker_agent import (
+        ScenarioCoverageCheckerAgent,
+    )
+
+    settings.ensure_dirs()
+    if not query_ids:
+        prefix = "scenarios_"
+        query_ids = [
+            path.stem[len(prefix):]
+            for path in list_json_files(settings.scenario_generator_dir)
+            if path.stem.startswith(prefix)
+        ]
+
+    agent = ScenarioCoverageCheckerAgent(settings=settings)
+    agent.run_corpus(query_ids, corpus_id=corpus_id)
+
+
+def cmd_audit_quotes(query_ids: list[str], corpus_id: str) -> None:
+    """
+    Проверяет source_quotes атрибутов по текстам секций для набора query_id
+    (по умолчанию — для всех запросов, для которых есть атрибуты).
+    """
+    from bugsy_multi_agent.agents.attribute_validator_agent import (
+        AttributeValidatorAgent,
+    )
+
+    settings.ensure_dirs()
+    if not query_ids:
+        prefix = "attributes_"
+        query_ids = [
+            path.stem[len(prefix):]
+            for path in list_json_files(settings.attribute_generator_dir)
+            if path.stem.startswith(prefix)
+        ]
+
+    agent = AttributeValidatorAgent(settings=settings)
+    agent.run_quote_audit(query_ids, corpus_id=corpus_id)
+
+
+def degraded_query_ids() -> list[str]:
+    """
+    query_id, у которых хотя бы один артефакт помечен degraded.
+    """
+    from bugsy_multi_agent.data_access.artifact_meta_store import list_degraded_artifacts
+    from bugsy_multi_agent.orchestration.pipeline import Pipeline
+
+    query_ids: list[str] = []
+    for item in list_degraded_artifacts(settings, Pipeline.STAGES):
+        if item["query_id"] not in query_ids:
+            query_ids.append(item["query_id"])
+    return query_ids
+
+
+def cmd_list_degraded() -> None:
+    """
+    Показывает артефакты, собранные без LLM из-за сбоев (для перегенерации).
+    """
+    from bugsy_multi_agent.data_access.artifact_meta_store import list_degraded_artifacts
+    from bugsy_multi_agent.orchestration.pipeline import Pipeline
+
+    items = list_degraded_artifacts(settings, Pipeline.STAGES)
+    if not items:
+        print("No degraded artifacts.")
+        return
+
+    print("Degraded artifacts (regenerate with: batch --degraded):")
+    for item in items:
+        print(f" - {item['stage']} {item['query_id']}: {'; '.join(item['reasons'])}")
+
+
+def cmd_batch(
+    specs: list[str],
+    default_priority: str,
+    deadline_seconds: float | None,
+    submitter: str,
+    workers: int | None,
+    include_degraded: bool = False,
+    resume: bool = False,
+) -> None:
+    """
+    Пакетный прогон полного пайплайна для набора query_id через планировщик.
+
+    Каждый элемент specs — query_id или query_id:priority
+    (например, query_5:urgent), иначе используется default_priority.
+    include_degraded — добавить query_id с артефактами, помеченными degraded.
+    resume — добавить задания, отложенные прошлым прогоном по бюджету LLM
+    (batch_checkpoint.json), с их невыполненными шагами.
+    """
+    import time
+    import uuid
+
+    from bugsy_multi_agent.data_access.batch_checkpoint_store import (
+        clear_batch_checkpoint,
+        load_batch_checkpoint,
+        save_batch_checkpoint,
+    )
+    from bugsy_multi_agent.orchestration.pipeline import Pipeline
+    from bugsy_multi_agent.orchestration.scheduler import Job, StageScheduler
+
+    if include_degraded:
+        queued = {spec.partition(":")[0] for spec in specs}
+        specs = specs + [q for q in degraded_query_ids() if q not in queued]
+    resumed: list[dict] = []
+    if resume:
+        queued = {spec.partition(":")[0] for spec in specs}
+        resumed = [
+            item for item in load_batch_checkpoint(settings)
+            if item["query_id"] not in queued
+        ]
+        print(f"Resuming {len(resumed)} deferred job(s) from checkpoint.")
+    if not specs and not resumed:
+        print("Nothing to run.")
+        return
+
+    pipeline = Pipeline(settings=settings)
+    scheduler = StageScheduler(pipeline, workers=workers)
+
+    deadline = time.time() + deadline_seconds if deadline_seconds is not None else None
+    jobs: list[Job] = []
+    for spec in specs:
+        query_id, _, priority = spec.partition(":")
+        jobs.append(
+            scheduler.submit(
+                Job(
+                    job_id=uuid.uuid4().hex,
+                    query_id=query_id,
+                    stages=list(pipeline.STAGES),
+                    priority=priority or default_priority,
+                    deadline=deadline,
+                    submitter=submitter,
+                )
+            )
+        )
+    for item in resumed:
+        jobs.append(
+            scheduler.submit(
+                Job(
+                    job_id=uuid.uuid4().hex,
+                    query_id=item["query_id"],
+                    stages=list(item.get("stages") or pipeline.STAGES),
+                    priority=item.get("priority") or default_priority,
+                    deadline=deadline,
+                    submitter=item.get("submitter") or submitter,
+                )
+            )
+        )
+
+    scheduler.start()
+    scheduler.wait_all()
+    scheduler.stop()
+
+    print("Batch finished:")
+    for job in jobs:
+        elapsed = (job.finished_at or 0) - (job.started_at or job.created_at)
+        print(
+            f" - {job.query_id} [{job.priority}]: {job.status} "
+            f"in {elapsed:.1f}s"
+            + (" (deadline missed)" if job.deadline_missed else "")
+            + (f" error={job.error}" if job.error else "")
+        )
+
+    metrics = pipeline.llm_metrics()
+    if metrics:
+        print(f"LLM metrics: {metrics}")
+
+    budget = pipeline.budget
+    if budget is not None:
+        print(f"LLM budget: {budget.snapshot()['run']}")
+
+    # Без --resume отложенное прошлыми прогонами сохраняется в checkpoint,
+    # кроме query_id, которые этот прогон запускал заново
+    ran = {job.query_id for job in jobs}
+    pending = [] if resume else [
+        item for item in load_batch_checkpoint(settings) if item["query_id"] not in ran
+    ]
+    deferred = [job for job in jobs if job.status == "deferred"]
+    pending += [
+        {
+            "query_id": job.query_id,
+            "stages": job.remaining_stages,
+            "priority": job.priority,
+            "submitter": job.submitter,
+        }
+        for job in deferred
+    ]
+    if pending:
+        path = save_batch_checkpoint(
+            settings,
+            pending,
+            budget.snapshot() if budget is not None else None,
+        )
+        print(
+            f"{len(deferred)} job(s) deferred by LLM budget, "
+            f"{len(pending)} pending in checkpoint: {path}\n"
+            "Continue with: batch --resume"
+        )
+    else:
+        clear_batch_checkpoint(settings)
+
+
+def cmd_serve(
+    host: str,
+    port: int,
+    unix_socket: str | None,
+    workers: int,
+) -> None:
+    """
+    Запускает долгоживущий демон с тёплым Pipeline и локальным JSON API заданий.
+    """
+    import os
+    import stat
+
+    from bugsy_multi_agent.orchestration.pipeline import Pipeline
+    from bugsy_multi_agent.orchestration.server import JobManager, make_server
+
+    if settings.budget_run_max_seconds is not None:
+        # У демона нет конца прогона и checkpoint: по истечении времени
+        # он навсегда перестал бы вызывать LLM
+        raise SystemExit(
+            "Invalid settings: budget_run_max_seconds is not supported by serve; "
+            "use token/cost run limits with budget_run_window_seconds"
+        )
+
+    pipeline = Pipeline(settings=settings)
+    job_manager = JobManager(pipeline, workers=workers)
+
+    if unix_socket is not None and os.path.exists(unix_socket):
+        # Оставшийся от прошлого запуска сокет; обычные файлы не трогаем
+        if not stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+            raise FileExistsError(f"{unix_socket} exists and is not a socket")
+        os.unlink(unix_socket)
+
+    server = make_server(job_manager, host=host, port=port, unix_socket=unix_socket)
+    address = unix_socket if unix_socket is not None else f"http://{host}:{port}"
+    print(f"bugsy serve: listening on {address} (workers={workers})")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("bugsy serve: shutting down")
+    finally:
+        server.server_close()
+        job_manager.shutdown()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="bugsy_multi_agent CLI"
     )
 
+    # Общие опции конфигурации, доступные в каждой команде
+    config_options = argparse.ArgumentParser(add_help=False)
+    config_options.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="TOML config file (default: $BUGSY_CONFIG or bugsy.toml in project root)",
+    )
+    config_options.add_argument(
+        "--set",
+        action="append",
+        metavar="NAME=VALUE",
+        help="Override a setting for this run, e.g. llm_max_concurrency=8 (repeatable)",
+    )
+
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     subparsers.add_parser(
         "list-queries",
+        parents=[config_options],
         help="List available query JSON files in data/contexts/",
     )
 
+    subparsers.add_parser(
+        "list-prompts",
+        parents=[config_options],
+        help="List prompt templates available in data/prompts/",
+    )
+
+    subparsers.add_parser(
+        "list-degraded",
+        parents=[config_options],
+        help="List artifacts produced without LLM because of provider failures",
+    )
+
+    subparsers.add_parser(
+        "show-settings",
+        parents=[config_options],
+        help="Print effective tunable settings (defaults + config + env + --set)",
+    )
+
+    prompt_help = (
+        "Use prompt template from data/prompts for a stage, "
+        "e.g. attribute_generator=AG_prompt_2 (repeatable)"
+    )
+
     sp_run = subparsers.add_parser(
         "run",
+        parents=[config_options],
         help="Run pipeline for given query id",
     )
     sp_run.add_argument(
@@ -67,6 +418,118 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Run full pipeline (currently only ontology retriever step)",
     )
+    sp_run.add_argument("--prompt", action="append", metavar="STAGE=NAME", help=prompt_help)
+
+    sp_corpus = subparsers.add_parser(
+        "corpus-coverage",
+        parents=[config_options],
+        help="Aggregated scenario coverage report over many queries",
+    )
+    sp_corpus.add_argument(
+        "query_ids",
+        nargs="*",
+        help="Query ids (default: all queries with generated scenarios)",
+    )
+    sp_corpus.add_argument(
+        "--corpus-id",
+        type=str,
+        default="corpus",
+        help="Name of the aggregated report (corpus/scenario_coverage_<id>.json)",
+    )
+
+    sp_audit = subparsers.add_parser(
+        "audit-quotes",
+        parents=[config_options],
+        help="Check attribute source_quotes against section texts",
+    )
+    sp_audit.add_argument(
+        "query_ids",
+        nargs="*",
+        help="Query ids (default: all queries with generated attributes)",
+    )
+    sp_audit.add_argument(
+        "--corpus-id",
+        type=str,
+        default="corpus",
+        help="Name of the audit report",
+    )
+
+    sp_batch = subparsers.add_parser(
+        "batch",
+        parents=[config_options],
+        help="Run full pipeline for many queries with priority scheduling",
+    )
+    sp_batch.add_argument(
+        "queries",
+        nargs="*",
+        help="Query ids, optionally with priority: query_1 query_5:urgent",
+    )
+    sp_batch.add_argument(
+        "--priority",
+        choices=["urgent", "high", "normal", "bulk"],
+        default="normal",
+        help="Default priority class for queries without explicit one",
+    )
+    sp_batch.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Deadline for the whole batch, seconds from now",
+    )
+    sp_batch.add_argument(
+        "--submitter",
+        type=str,
+        default="cli",
+        help="Submitter name for fair sharing",
+    )
+    sp_batch.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Concurrent stages (default: llm_max_concurrency)",
+    )
+    sp_batch.add_argument(
+        "--degraded",
+        action="store_true",
+        help="Also rerun queries whose artifacts are marked degraded",
+    )
+    sp_batch.add_argument(
+        "--resume",
+        action="store_true",
+        help="Also run jobs deferred by the LLM budget in the previous batch",
+    )
+    sp_batch.add_argument("--prompt", action="append", metavar="STAGE=NAME", help=prompt_help)
+
+    sp_serve = subparsers.add_parser(
+        "serve",
+        parents=[config_options],
+        help="Run long-lived daemon with a local HTTP job API",
+    )
+    sp_serve.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Host to bind (ignored with --unix-socket)",
+    )
+    sp_serve.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to bind (ignored with --unix-socket)",
+    )
+    sp_serve.add_argument(
+        "--unix-socket",
+        type=str,
+        default=None,
+        help="Serve over a Unix socket at this path instead of TCP",
+    )
+    sp_serve.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of jobs executed concurrently (default: server_workers)",
+    )
+    sp_serve.add_argument("--prompt", action="append", metavar="STAGE=NAME", help=prompt_help)
 
     return parser
 
@@ -75,10 +538,40 @@ def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
 
+    configure_settings(args.config, args.set)
+    apply_prompt_overrides(getattr(args, "prompt", None))
+
     if args.command == "list-queries":
         cmd_list_queries()
+    elif args.command == "list-prompts":
+        cmd_list_prompts()
+    elif args.command == "list-degraded":
+        cmd_list_degraded()
+    elif args.command == "show-settings":
+        cmd_show_settings()
     elif args.command == "run":
         cmd_run(args.query_id, args.full)
+    elif args.command == "corpus-coverage":
+        cmd_corpus_coverage(args.query_ids, args.corpus_id)
+    elif args.command == "audit-quotes":
+        cmd_audit_quotes(args.query_ids, args.corpus_id)
+    elif args.command == "batch":
+        cmd_batch(
+            args.queries,
+            args.priority,
+            args.deadline,
+            args.submitter,
+            args.workers,
+            args.degraded,
+            args.resume,
+        )
+    elif args.command == "serve":
+        cmd_serve(
+            args.host,
+            args.port,
+            args.unix_socket,
+            args.workers or settings.server_workers,
+        )
     else:
         parser.error(f"Unknown command: {args.command}")
 
@@ -48,7 +48,7 @@ class AttributeCoverageEntry(BaseModel):
 
 class AttributeCoverageReport(BaseModel):
     """
-    Покрытие domain_entities и core_passages атрибутами.
+    Покрытие domain_entities, core_passages и supporting_passages атрибутами.
     """
 
     query: str
@@ -66,13 +66,34 @@ class ScenarioCoverageEntry(BaseModel):
     scenario_ids: List[str] = Field(default_factory=list)
 
 
+class PriorityCoverageEntry(BaseModel):
+    """
+    Покрытие сценариями атрибутов одного приоритета.
+    """
+
+    priority: str
+    total: int = 0
+    covered: int = 0
+
+    @property
+    def ratio(self) -> float:
+        return self.covered / self.total if self.total else 1.0
+
+
 class ScenarioCoverageReport(BaseModel):
     """
     Покрытие атрибутов сценариями.
+
+    redundant_scenarios — сценарии, все атрибуты которых покрыты
+    ещё хотя бы одним сценарием. duplicate_attribute_ids — id, встретившиеся
+    у нескольких атрибутов (в покрытии учитываются один раз).
     """
 
     query: str
     attribute_coverage: List[ScenarioCoverageEntry] = Field(default_factory=list)
     attributes_without_scenarios: List[str] = Field(default_factory=list)
     scenarios_without_attributes: List[str] = Field(default_factory=list)
+    priority_coverage: Dict[str, PriorityCoverageEntry] = Field(default_factory=dict)
+    redundant_scenarios: List[str] = Field(default_factory=list)
+    duplicate_attribute_ids: List[str] = Field(default_factory=list)
     summary: str = ""
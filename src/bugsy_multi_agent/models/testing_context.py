@@ -38,3 +38,24 @@ class TestingContext(BaseModel):
         Преобразует объект в обычный dict, готовый к json.dump.
         """
         return self.model_dump()
+
+
+class SectionSummary(BaseModel):
+    """
+    Результат map-шага OntologyRAG Retriever по одной секции:
+    роль секции (или решение её отбросить), важность, summary и сущности домена.
+    """
+
+    section_id: str
+    title: str = ""
+    role: Literal["core", "supporting", "discarded"] = "supporting"
+    importance: Literal["high", "medium", "low"] = "medium"
+    summary: str = ""
+    domain_entities: List[str] = Field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SectionSummary":
+        return cls.model_validate(data)
+
+    def to_dict(self) -> dict:
+        return self.model_dump()
@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+import threading
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable, List, TypeVar
 
 from bugsy_multi_agent.config.settings import Settings
+from bugsy_multi_agent.llm.client import DeepSeekLLMClient, LLMClient
+
+if TYPE_CHECKING:
+    from bugsy_multi_agent.llm.prompt_compression import PromptCompressor
+    from bugsy_multi_agent.llm.prompt_parts import PromptParts
+    from bugsy_multi_agent.llm.prompt_registry import PromptTemplate
+
+
+T = TypeVar("T")
 
 
 class AgentBase(ABC):
@@ -11,8 +21,188 @@ class AgentBase(ABC):
     Базовый класс для всех агентов.
     """
 
-    def __init__(self, settings: Settings | None = None) -> None:
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        llm_client: LLMClient | None = None,
+    ) -> None:
         self.settings = settings or Settings()
+        self._llm_client = llm_client
+        # Причины отката на эвристику/заглушку в текущем run(); агент может
+        # выполняться в нескольких потоках сразу, поэтому — по потокам
+        self._degradation = threading.local()
+
+    @property
+    def llm_client(self) -> LLMClient:
+        """
+        LLM-клиент создаётся лениво, при первом обращении.
+        Агенты без LLM (валидаторы, чекеры покрытия) его никогда не создают.
+        """
+        if self._llm_client is None:
+            self._llm_client = DeepSeekLLMClient(
+                base_url=self.settings.llm_base_url,
+                model=self.settings.llm_model,
+                temperature=self.settings.llm_temperature,
+                timeout=self.settings.llm_timeout_seconds,
+                max_retries=self.settings.llm_max_retries,
+                max_tokens=self.settings.llm_max_output_tokens,
+                single_flight=self.settings.llm_single_flight,
+            )
+        return self._llm_client
+
+    @llm_client.setter
+    def llm_client(self, client: LLMClient) -> None:
+        self._llm_client = client
+
+    def stage_llm_client(self, stage: str, fast: bool = False) -> LLMClient:
+        """
+        Клиент для вызова LLM шага stage: модель из settings.llm_stage_models
+        (fast=True — settings.llm_cascade_fast_model); модель не задана — общий клиент.
+        """
+        if fast:
+            model = self.settings.llm_cascade_fast_model
+        else:
+            model = self.settings.llm_stage_models.get(stage)
+        if not model:
+            return self.llm_client
+        return self.llm_client.with_model(model)
+
+    def generate_with_cascade(
+        self,
+        stage: str,
+        prompt: str,
+        parse: Callable[[str, LLMClient, bool], T],
+        json_object: bool = False,
+        check: Callable[[T], str | None] | None = None,
+    ) -> T:
+        """
+        Вызов LLM шага stage и разбор ответа.
+
+        parse(text, client, repair) разбирает ответ (исключение — ответ невалиден);
+        repair=False — без repair-промптов, невалидный элемент сразу ошибка.
+        check(result) — проверка качества: None или причина отказа.
+
+        При settings.llm_cascade (и stage в llm_cascade_stages) сначала пробуется
+        быстрая модель без repair; её ответ принимается, только если разобран
+        и прошёл check, иначе запрос повторяется моделью шага. Счётчики —
+        cascade_fast_accepted / cascade_escalations в метриках клиента.
+        """
+        client = self.stage_llm_client(stage)
+        fast_model = self.settings.llm_cascade_fast_model
+        stage_model = self.settings.llm_stage_models.get(stage) or self.settings.llm_model
+        if (
+            self.settings.llm_cascade
+            and stage in self.settings.llm_cascade_stages
+            and fast_model
+            and fast_model != stage_model
+        ):
+            fast_client = self.stage_llm_client(stage, fast=True)
+            if fast_client is not client:
+                try:
+                    result = parse(
+                        fast_client.generate(prompt, json_object=json_object),
+                        fast_client,
+                        False,
+                    )
+                    reason = check(result) if check is not None else None
+                except Exception as e:
+                    reason = str(e)
+                metrics = getattr(self.llm_client, "metrics", None)
+                if reason is None:
+                    if metrics is not None:
+                        metrics.increment("cascade_fast_accepted")
+                    return result
+                print(
+                    f"{self.__class__.__name__}: fast model rejected for {stage}: "
+                    f"{reason}. Escalating."
+                )
+                if metrics is not None:
+                    metrics.increment("cascade_escalations")
+
+        return parse(client.generate(prompt, json_object=json_object), client, True)
+
+    def note_degraded(self, error: BaseException | str) -> None:
+        """
+        Отмечает, что артефакт текущего run() собран (полностью или частично)
+        без LLM из-за ошибки: такие артефакты помечаются degraded в метаданных
+        и подлежат перегенерации.
+        """
+        from bugsy_multi_agent.llm.budget import BudgetExceededError
+        from bugsy_multi_agent.llm.circuit_breaker import CircuitOpenError
+
+        if isinstance(error, CircuitOpenError):
+            reason = "circuit_open"
+        elif isinstance(error, BudgetExceededError):
+            reason = "budget_exceeded"
+        elif isinstance(error, BaseException):
+            reason = f"{type(error).__name__}: {error}"[:200]
+        else:
+            reason = error
+        reasons = self._degraded_reasons()
+        if reason not in reasons:
+            reasons.append(reason)
+
+    def _degraded_reasons(self) -> List[str]:
+        reasons = getattr(self._degradation, "reasons", None)
+        if reasons is None:
+            reasons = self._degradation.reasons = []
+        return reasons
+
+    def take_degraded_reasons(self) -> List[str]:
+        """
+        Причины деградации, накопленные в этом потоке; список при этом очищается.
+        """
+        reasons = self._degraded_reasons()
+        self._degradation.reasons = []
+        return reasons
+
+    def prompt_template(self, stage: str) -> PromptTemplate | None:
+        """
+        Шаблон промпта из data/prompts, выбранный для шага в
+        settings.prompt_templates; None — использовать встроенный промпт.
+        """
+        name = self.settings.prompt_templates.get(stage)
+        if not name:
+            return None
+        from bugsy_multi_agent.llm.prompt_registry import get_prompt_registry
+
+        return get_prompt_registry(self.settings.prompts_dir).get(stage, name)
+
+    def prompt_compressor(self) -> PromptCompressor | None:
+        """
+        Новый PromptCompressor на один промпт или None, если сжатие выключено
+        (settings.prompt_compression).
+        """
+        if not self.settings.prompt_compression:
+            return None
+        from bugsy_multi_agent.llm.prompt_compression import PromptCompressor
+
+        return PromptCompressor(
+            min_repeat_chars=self.settings.prompt_compression_min_repeat_chars,
+            compact_attributes=self.settings.prompt_compression_compact_attributes,
+        )
+
+    def prompt_text(self, parts: PromptParts) -> str:
+        """
+        Текст промпта для отправки; если сжатие что-то сэкономило — печатает
+        оценку и добавляет её в метрики клиента (prompt_tokens_saved_estimate).
+        """
+        text = parts.text
+        if parts.tokens_saved > 0:
+            from bugsy_multi_agent.llm.prompt_compression import estimate_tokens
+
+            after = estimate_tokens(text)
+            before = after + parts.tokens_saved
+            print(
+                f"{self.__class__.__name__}: prompt {parts.name} compressed "
+                f"~{before} -> ~{after} tokens (saved ~{parts.tokens_saved}, "
+                f"{parts.tokens_saved / before:.0%})"
+            )
+            metrics = getattr(self.llm_client, "metrics", None)
+            if metrics is not None:
+                metrics.increment("prompt_tokens_saved_estimate", parts.tokens_saved)
+                metrics.increment("prompts_compressed")
+        return text
 
     @abstractmethod
     def run(self, query_id: str) -> Any:
@@ -1,30 +1,64 @@
 from __future__ import annotations
 
-from typing import List
-
-from bugsy_multi_agent.agents.ontology_retriever_agent import (
-    OntologyRAGRetrieverAgent,
-)
-from bugsy_multi_agent.agents.attribute_generator_agent import (
-    AttributeGeneratorAgent,
-)
-from bugsy_multi_agent.agents.attribute_validator_agent import (
-    AttributeValidatorAgent,
-)
-from bugsy_multi_agent.agents.attribute_coverage_checker_agent import (
-    AttributeCoverageCheckerAgent,
-)
-from bugsy_multi_agent.agents.scenario_generator_agent import (
-    ScenarioGeneratorAgent,
-)
-from bugsy_multi_agent.config.settings import Settings
-from bugsy_multi_agent.models.attribute import Attribute
-from bugsy_multi_agent.models.reports import (
-    ValidationReport,
-    AttributeCoverageReport,
-)
-from bugsy_multi_agent.models.scenario import Scenario
-from bugsy_multi_agent.models.testing_context import TestingContext
+import threading
+from contextlib import nullcontext
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, ContextManager, Dict, List, Optional
+
+from bugsy_multi_agent.config.settings import Settings, SettingsError
+
+if TYPE_CHECKING:
+    from bugsy_multi_agent.agents.ontology_retriever_agent import (
+        OntologyRAGRetrieverAgent,
+    )
+    from bugsy_multi_agent.agents.attribute_generator_agent import (
+        AttributeGeneratorAgent,
+    )
+    from bugsy_multi_agent.agents.attribute_validator_agent import (
+        AttributeValidatorAgent,
+    )
+    from bugsy_multi_agent.agents.attribute_coverage_checker_agent import (
+        AttributeCoverageCheckerAgent,
+    )
+    from bugsy_multi_agent.agents.scenario_generator_agent import (
+        ScenarioGeneratorAgent,
+    )
+    from bugsy_multi_agent.agents.scenario_validator_agent import (
+        ScenarioValidatorAgent,
+    )
+    from bugsy_multi_agent.agents.scenario_coverage_checker_agent import (
+        ScenarioCoverageCheckerAgent,
+    )
+    from bugsy_multi_agent.llm.budget import BudgetGovernor
+    from bugsy_multi_agent.llm.client import LLMClient
+    from bugsy_multi_agent.models.attribute import Attribute
+    from bugsy_multi_agent.models.reports import (
+        ValidationReport,
+        AttributeCoverageReport,
+        ScenarioCoverageReport,
+    )
+    from bugsy_multi_agent.models.scenario import Scenario
+    from bugsy_multi_agent.models.testing_context import TestingContext
+
+
+class _locked_cached_property(cached_property):
+    """
+    cached_property, значение которого вычисляется один раз на экземпляр
+    под его блокировкой _init_lock (double-checked): рабочие потоки
+    планировщика, одновременно дошедшие до первого шага, получают один
+    и тот же объект, а не каждый свой.
+    """
+
+    def __get__(self, instance: Any, owner: Any = None) -> Any:
+        if instance is None:
+            return self
+        cache = instance.__dict__
+        if self.attrname in cache:
+            return cache[self.attrname]
+        with instance._init_lock:
+            if self.attrname not in cache:
+                cache[self.attrname] = self.func(instance)
+            return cache[self.attrname]
 
 
 class Pipeline:
@@ -37,19 +71,178 @@ class Pipeline:
     3) Attribute Validator Agent -> ValidationReport
     4) Attribute Coverage Checker -> AttributeCoverageReport
     5) Scenario Generator Agent -> список Scenario
+    6) Scenario Validator Agent -> ValidationReport
+    7) Scenario Coverage Checker -> ScenarioCoverageReport
+
+    Агенты (и их LLM-клиенты) создаются лениво, при первом обращении к шагу:
+    модуль агента импортируется только тогда, когда шаг реально запускается.
+    Все LLM-агенты разделяют один клиент с общим ограничителем конкурентности.
+    Если заданы потолки budget_*, клиент учитывает расход в общем BudgetGovernor
+    (budget), а шаги относят свои вызовы LLM к query_id. Ленивые поля создаются
+    под блокировкой: ограничитель, circuit breaker и бюджет одни на пайплайн
+    и при параллельных рабочих потоках.
     """
 
+    # Порядок шагов полного пайплайна; имя шага -> метод run_<имя>
+    STAGES: tuple[str, ...] = (
+        "ontology_retriever",
+        "attribute_generator",
+        "attribute_validator",
+        "attribute_coverage_checker",
+        "scenario_generator",
+        "scenario_validator",
+        "scenario_coverage_checker",
+    )
+
     def __init__(self, settings: Settings | None = None) -> None:
-        self.settings = settings or Settings()
+        self.settings = settings or Settings.load()
+        # Реентерабельная: llm_client создаётся внутри агента, budget — внутри llm_client
+        self._init_lock = threading.RLock()
+        # Настройки, собранные в коде (не через configure), тоже проверяются
+        self.settings.validate()
         self.settings.ensure_dirs()
 
-        self.ontology_agent = OntologyRAGRetrieverAgent(settings=self.settings)
-        self.attribute_generator = AttributeGeneratorAgent(settings=self.settings)
-        self.attribute_validator = AttributeValidatorAgent(settings=self.settings)
-        self.attribute_coverage_checker = AttributeCoverageCheckerAgent(
-            settings=self.settings
+        # Map-reduce строит контекст встроенными промптами секций и reduce;
+        # шаблон ontology_retriever в этом режиме молча не применялся бы
+        if (
+            self.settings.ontology_map_reduce
+            and "ontology_retriever" in self.settings.prompt_templates
+        ):
+            raise SettingsError(
+                "prompt_templates.ontology_retriever cannot be used with "
+                "ontology_map_reduce; disable one of them"
+            )
+
+        # Выбранные шаблоны промптов загружаются и проверяются сразу:
+        # ошибка в имени или шаблоне всплывает до запуска шагов
+        if self.settings.prompt_templates:
+            from bugsy_multi_agent.llm.prompt_registry import get_prompt_registry
+
+            registry = get_prompt_registry(self.settings.prompts_dir)
+            for stage, name in self.settings.prompt_templates.items():
+                registry.get(stage, name)
+
+    # ---------- LLM-клиент и агенты (ленивая инициализация) ----------
+
+    @_locked_cached_property
+    def llm_client(self) -> LLMClient:
+        from bugsy_multi_agent.llm.circuit_breaker import CircuitBreaker
+        from bugsy_multi_agent.llm.client import DeepSeekLLMClient
+        from bugsy_multi_agent.llm.limiter import ConcurrencyLimiter
+
+        return DeepSeekLLMClient(
+            base_url=self.settings.llm_base_url,
+            model=self.settings.llm_model,
+            temperature=self.settings.llm_temperature,
+            timeout=self.settings.llm_timeout_seconds,
+            max_retries=self.settings.llm_max_retries,
+            max_tokens=self.settings.llm_max_output_tokens,
+            single_flight=self.settings.llm_single_flight,
+            circuit_breaker=(
+                CircuitBreaker(
+                    failure_threshold=self.settings.llm_circuit_failure_threshold,
+                    reset_timeout=self.settings.llm_circuit_reset_seconds,
+                )
+                if self.settings.llm_circuit_breaker
+                else None
+            ),
+            limiter=ConcurrencyLimiter(self.settings.llm_max_concurrency),
+            max_continuations=self.settings.llm_max_continuations,
+            json_mode=self.settings.llm_json_mode,
+            budget=self.budget,
         )
-        self.scenario_generator = ScenarioGeneratorAgent(settings=self.settings)
+
+    @_locked_cached_property
+    def budget(self) -> Optional[BudgetGovernor]:
+        """
+        Учёт бюджета LLM на прогон и по query_id; None, если потолки не заданы.
+        """
+        from bugsy_multi_agent.llm.budget import BudgetGovernor, budget_limits_configured
+
+        if not budget_limits_configured(self.settings):
+            return None
+        return BudgetGovernor(self.settings)
+
+    def budget_scope(self, query_id: str) -> ContextManager[None]:
+        """
+        Вызовы LLM внутри блока учитываются в бюджете query_id.
+        """
+        if self.budget is None:
+            return nullcontext()
+        return self.budget.query_scope(query_id)
+
+    def llm_metrics(self) -> Dict[str, int]:
+        """
+        Счётчики общего LLM-клиента; пусто, если клиент ещё не создавался.
+        """
+        client = self.__dict__.get("llm_client")
+        metrics = getattr(client, "metrics", None)
+        return metrics.snapshot() if metrics is not None else {}
+
+    @_locked_cached_property
+    def ontology_agent(self) -> OntologyRAGRetrieverAgent:
+        from bugsy_multi_agent.agents.ontology_retriever_agent import (
+            OntologyRAGRetrieverAgent,
+        )
+
+        return OntologyRAGRetrieverAgent(
+            settings=self.settings,
+            llm_client=self.llm_client,
+        )
+
+    @_locked_cached_property
+    def attribute_generator(self) -> AttributeGeneratorAgent:
+        from bugsy_multi_agent.agents.attribute_generator_agent import (
+            AttributeGeneratorAgent,
+        )
+
+        return AttributeGeneratorAgent(
+            settings=self.settings,
+            llm_client=self.llm_client,
+        )
+
+    @_locked_cached_property
+    def attribute_validator(self) -> AttributeValidatorAgent:
+        from bugsy_multi_agent.agents.attribute_validator_agent import (
+            AttributeValidatorAgent,
+        )
+
+        return AttributeValidatorAgent(settings=self.settings)
+
+    @_locked_cached_property
+    def attribute_coverage_checker(self) -> AttributeCoverageCheckerAgent:
+        from bugsy_multi_agent.agents.attribute_coverage_checker_agent import (
+            AttributeCoverageCheckerAgent,
+        )
+
+        return AttributeCoverageCheckerAgent(settings=self.settings)
+
+    @_locked_cached_property
+    def scenario_generator(self) -> ScenarioGeneratorAgent:
+        from bugsy_multi_agent.agents.scenario_generator_agent import (
+            ScenarioGeneratorAgent,
+        )
+
+        return ScenarioGeneratorAgent(
+            settings=self.settings,
+            llm_client=self.llm_client,
+        )
+
+    @_locked_cached_property
+    def scenario_validator(self) -> ScenarioValidatorAgent:
+        from bugsy_multi_agent.agents.scenario_validator_agent import (
+            ScenarioValidatorAgent,
+        )
+
+        return ScenarioValidatorAgent(settings=self.settings)
+
+    @_locked_cached_property
+    def scenario_coverage_checker(self) -> ScenarioCoverageCheckerAgent:
+        from bugsy_multi_agent.agents.scenario_coverage_checker_agent import (
+            ScenarioCoverageCheckerAgent,
+        )
+
+        return ScenarioCoverageCheckerAgent(settings=self.settings)
 
     # ---------- отдельные шаги ----------
 
@@ -70,6 +263,23 @@ class Pipeline:
     def run_scenario_generator(self, query_id: str) -> List[Scenario]:
         return self.scenario_generator.run(query_id)
 
+    def run_scenario_validator(self, query_id: str) -> ValidationReport:
+        return self.scenario_validator.run(query_id)
+
+    def run_scenario_coverage_checker(
+        self, query_id: str
+    ) -> ScenarioCoverageReport:
+        return self.scenario_coverage_checker.run(query_id)
+
+    def run_stage(self, stage: str, query_id: str) -> Any:
+        """
+        Запускает один шаг по имени из STAGES.
+        """
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
+        with self.budget_scope(query_id):
+            return getattr(self, f"run_{stage}")(query_id)
+
     # ---------- полный пайплайн ----------
 
     def run_full_pipeline(self, query_id: str) -> None:
@@ -81,24 +291,41 @@ class Pipeline:
         - валидация атрибутов
         - отчёт по покрытию атрибутами
         - генерация сценариев
+        - валидация сценариев
+        - отчёт по покрытию атрибутов сценариями
         """
-        testing_context = self.run_ontology_retriever(query_id)
-        print("---- OntologyRAG Retriever step done ----")
-        print(f"Core passages: {len(testing_context.core_passages)}")
-        print(f"Supporting passages: {len(testing_context.supporting_passages)}")
-
-        attributes = self.run_attribute_generator(query_id)
-        print("---- Attribute Generator step done ----")
-        print(f"Attributes generated: {len(attributes)}")
-
-        validation_report = self.run_attribute_validator(query_id)
-        print("---- Attribute Validator step done ----")
-        print(validation_report.summary)
-
-        coverage_report = self.run_attribute_coverage_checker(query_id)
-        print("---- Attribute Coverage Checker step done ----")
-        print(coverage_report.summary)
-
-        scenarios = self.run_scenario_generator(query_id)
-        print("---- Scenario Generator step done ----")
-        print(f"Scenarios generated: {len(scenarios)}")
+        with self.budget_scope(query_id):
+            testing_context = self.run_ontology_retriever(query_id)
+            print("---- OntologyRAG Retriever step done ----")
+            print(f"Core passages: {len(testing_context.core_passages)}")
+            print(f"Supporting passages: {len(testing_context.supporting_passages)}")
+
+            attributes = self.run_attribute_generator(query_id)
+            print("---- Attribute Generator step done ----")
+            print(f"Attributes generated: {len(attributes)}")
+
+            validation_report = self.run_attribute_validator(query_id)
+            print("---- Attribute Validator step done ----")
+            print(validation_report.summary)
+
+            coverage_report = self.run_attribute_coverage_checker(query_id)
+            print("---- Attribute Coverage Checker step done ----")
+            print(coverage_report.summary)
+
+            scenarios = self.run_scenario_generator(query_id)
+            print("---- Scenario Generator step done ----")
+            print(f"Scenarios generated: {len(scenarios)}")
+
+            scenario_validation_report = self.run_scenario_validator(query_id)
+            print("---- Scenario Validator step done ----")
+            print(scenario_validation_report.summary)
+
+            scenario_coverage_report = self.run_scenario_coverage_checker(query_id)
+            print("---- Scenario Coverage Checker step done ----")
+            print(scenario_coverage_report.summary)
+
+        metrics = self.llm_metrics()
+        if metrics:
+            print(f"LLM metrics: {metrics}")
+        if self.budget is not None:
+            print(f"LLM budget: {self.budget.snapshot()['run']}")
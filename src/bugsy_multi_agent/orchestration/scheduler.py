@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bugsy_multi_agent.data_access.context_store import save_raw_context
+from bugsy_multi_agent.orchestration.pipeline import Pipeline
+
+
+# Классы приоритета: меньше ранг -> раньше выполняется
+PRIORITY_CLASSES: Dict[str, int] = {
+    "urgent": 0,
+    "high": 1,
+    "normal": 2,
+    "bulk": 3,
+}
+
+JobStatus = str  # "queued" | "running" | "done" | "failed" | "deferred"
+
+
+def to_jsonable(result: Any) -> Any:
+    """
+    Превращает результат шага (pydantic-модель или список моделей) в JSON-совместимый объект.
+    """
+    if isinstance(result, list):
+        return [to_jsonable(item) for item in result]
+    if hasattr(result, "model_dump"):
+        return result.model_dump()
+    return result
+
+
+@dataclass
+class Job:
+    """
+    Задание: прогон набора шагов пайплайна для одного query_id.
+
+    priority — класс из PRIORITY_CLASSES, deadline — абсолютное время (time.time()),
+    submitter — кто поставил задание (для справедливого разделения между пакетами).
+    raw_context — контекст OntologyRAG, который записывается в data/contexts/
+    перед первым шагом, когда задание уже владеет query_id.
+    artifacts — результаты шагов; словарь только заменяется целиком, поэтому
+    прочитанную ссылку можно сериализовать из другого потока.
+    """
+
+    job_id: str
+    query_id: str
+    stages: List[str]
+    priority: str = "normal"
+    deadline: Optional[float] = None
+    submitter: str = "default"
+    status: JobStatus = "queued"
+    current_stage: Optional[str] = None
+    next_stage_index: int = 0
+    artifacts: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    raw_context: Optional[Dict[str, Any]] = field(default=None, repr=False)
+
+    @property
+    def remaining_stages(self) -> List[str]:
+        return self.stages[self.next_stage_index:]
+
+    @property
+    def in_progress(self) -> bool:
+        """
+        Хотя бы один шаг уже выполнен: такие задания доводятся до конца в первую очередь.
+        """
+        return self.next_stage_index > 0
+
+    @property
+    def deadline_missed(self) -> bool:
+        if self.deadline is None:
+            return False
+        finished = self.finished_at if self.finished_at is not None else time.time()
+        return finished > self.deadline
+
+    def to_status_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "query_id": self.query_id,
+            "stages": self.stages,
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "deadline_missed": self.deadline_missed,
+            "submitter": self.submitter,
+            "status": self.status,
+            "current_stage": self.current_stage,
+            "completed_stages": list(self.artifacts),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class StageScheduler:
+    """
+    Планировщик шагов пайплайна с классами приоритета, дедлайнами и справедливым
+    разделением между отправителями.
+
+    Единица планирования — один шаг (Pipeline.run_stage) одного задания.
+    Число рабочих потоков по умолчанию равно Settings.llm_max_concurrency:
+    планировщик решает, какой шаг получит следующий слот, а общий
+    ConcurrencyLimiter LLM-клиента ограничивает сами запросы.
+
+    Порядок выбора следующего шага:
+    1) самый высокий класс приоритета, в котором есть готовые шаги;
+    2) внутри класса — задание с дедлайном, который наступит в ближайшие
+       deadline_slack секунд (EDF);
+    3) иначе — уже начатые задания раньше новых у всех отправителей: среди
+       отправителей с начатыми заданиями (если таких нет — среди всех)
+       выбирается тот, у кого меньше всего выполненных шагов (fair share),
+       а у него — начатые задания, затем по дедлайну и порядку постановки.
+
+    Задания одного query_id не перемежаются: агенты обмениваются данными через
+    файлы data/contexts/ и data/outputs/ по query_id, поэтому задание владеет
+    своим query_id от постановки в очередь до завершения, а следующие задания
+    того же query_id ждут в порядке постановки.
+
+    Если у пайплайна есть BudgetGovernor и бюджет прогона исчерпан, перед каждым
+    шагом спрашивается job_decision: отложенное задание завершается со статусом
+    deferred (невыполненные шаги — Job.remaining_stages), уже идущие шаги
+    доводятся до конца.
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        workers: Optional[int] = None,
+        deadline_slack: float = 30.0,
+        on_job_finished: Optional[Callable[[Job], None]] = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.workers = workers or pipeline.settings.llm_max_concurrency
+        self.deadline_slack = deadline_slack
+        self.on_job_finished = on_job_finished
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # ранг приоритета -> submitter -> heap[(not in_progress, deadline, seq, job)]
+        self._ready: Dict[int, Dict[str, List[Tuple[int, float, int, Job]]]] = {}
+        # submitter -> число отданных на выполнение шагов (виртуальное время)
+        self._usage: Dict[str, int] = {}
+        # query_id -> job_id задания, которое сейчас владеет query_id
+        self._query_owners: Dict[str, str] = {}
+        # query_id -> задания, ждущие освобождения query_id (в порядке постановки)
+        self._blocked: Dict[str, List[Job]] = {}
+        self._unfinished = 0
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    # ---------- приём заданий ----------
+
+    def submit(self, job: Job) -> Job:
+        if not isinstance(job.priority, str) or job.priority not in PRIORITY_CLASSES:
+            raise ValueError(
+                f"Unknown priority class: {job.priority}. "
+                f"Expected one of: {', '.join(PRIORITY_CLASSES)}"
+            )
+        for stage in job.stages:
+            if not isinstance(stage, str) or stage not in self.pipeline.STAGES:
+                raise ValueError(f"Unknown pipeline stage: {stage}")
+
+        with self._cond:
+            if job.submitter not in self._usage or not self._has_pending(job.submitter):
+                # Новый (или вернувшийся) отправитель стартует с текущего минимума,
+                # а не с нуля: иначе он надолго вытеснил бы остальных.
+                self._usage[job.submitter] = max(
+                    self._usage.get(job.submitter, 0),
+                    self._min_active_usage(),
+                )
+            self._unfinished += 1
+            if job.stages:
+                self._push(job)
+            else:
+                self._finish(job, "done")
+            self._cond.notify()
+        return job
+
+    # ---------- жизненный цикл ----------
+
+    def start(self) -> None:
+        """
+        Запускает рабочие потоки. Повторный вызов ничего не делает.
+        """
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for idx in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"bugsy-scheduler-{idx}",
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждёт завершения всех поставленных заданий. Возвращает False по таймауту.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unfinished == 0, timeout=timeout)
+
+    def stop(self) -> None:
+        """
+        Останавливает рабочие потоки после завершения текущих шагов.
+        Невыполненные шаги остаются в очереди.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    # ---------- очередь ----------
+
+    def _push(self, job: Job) -> None:
+        owner = self._query_owners.setdefault(job.query_id, job.job_id)
+        if owner != job.job_id:
+            self._blocked.setdefault(job.query_id, []).append(job)
+            return
+        rank = PRIORITY_CLASSES[job.priority]
+        deadline = job.deadline if job.deadline is not None else math.inf
+        heap = self._ready.setdefault(rank, {}).setdefault(job.submitter, [])
+        heapq.heappush(
+            heap,
+            (0 if job.in_progress else 1, deadline, next(self._seq), job),
+        )
+
+    def _has_pending(self, submitter: str) -> bool:
+        if any(submitter in by_submitter for by_submitter in self._ready.values()):
+            return True
+        return any(
+            job.submitter == submitter
+            for jobs in self._blocked.values()
+            for job in jobs
+        )
+
+    def _min_active_usage(self) -> int:
+        active = {
+            submitter
+            for by_submitter in self._ready.values()
+            for submitter in by_submitter
+        }
+        return min((self._usage[s] for s in active), default=0)
+
+    def _pop_next(self) -> Optional[Job]:
+        if not self._ready:
+            return None
+
+        rank = min(self._ready)
+        by_submitter = self._ready[rank]
+        now = time.time()
+
+        # Горящие дедлайны обслуживаются раньше fair share. Куча упорядочена
+        # сначала по in_progress, поэтому ближайший дедлайн ищется по всей куче.
+        earliest = min(
+            (entry[1], entry[2], submitter)
+            for submitter, heap in by_submitter.items()
+            for entry in heap
+        )
+        if earliest[0] - now <= self.deadline_slack:
+            submitter = earliest[2]
+            heap = by_submitter[submitter]
+            index = next(i for i, entry in enumerate(heap) if entry[2] == earliest[1])
+            job = heap[index][3]
+            heap[index] = heap[-1]
+            heap.pop()
+            heapq.heapify(heap)
+        else:
+            # Начатые задания доводятся до конца раньше новых у всех отправителей:
+            # fair share выбирает только среди отправителей с начатыми заданиями,
+            # а если таких нет — среди всех
+            candidates = [s for s, heap in by_submitter.items() if heap[0][0] == 0]
+            submitter = min(
+                candidates or by_submitter,
+                key=lambda s: (self._usage.get(s, 0), by_submitter[s][0][2]),
+            )
+            heap = by_submitter[submitter]
+            job = heapq.heappop(heap)[3]
+        if not heap:
+            del by_submitter[submitter]
+            if not by_submitter:
+                del self._ready[rank]
+
+        self._usage[submitter] = self._usage.get(submitter, 0) + 1
+        return job
+
+    def _finish(self, job: Job, status: JobStatus) -> None:
+        job.status = status
+        job.current_stage = None
+        job.finished_at = time.time()
+        job.raw_context = None
+        self._unfinished -= 1
+        if self._query_owners.get(job.query_id) == job.job_id:
+            budget = self.pipeline.budget
+            if budget is not None:
+                budget.finish_query(job.query_id)
+            # query_id переходит к следующему ждущему заданию
+            del self._query_owners[job.query_id]
+            waiting = self._blocked.get(job.query_id)
+            if waiting:
+                next_job = waiting.pop(0)
+                if not waiting:
+                    del self._blocked[job.query_id]
+                self._push(next_job)
+        if self.on_job_finished is not None:
+            self.on_job_finished(job)
+
+    # ---------- выполнение ----------
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    job = self._pop_next()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    return
+                budget = self.pipeline.budget
+                if budget is not None and budget.job_decision(job.priority) == "defer":
+                    print(
+                        f"StageScheduler: job {job.job_id} deferred for "
+                        f"query_id={job.query_id} before stage="
+                        f"{job.stages[job.next_stage_index]} (LLM budget exceeded)"
+                    )
+                    self._finish(job, "deferred")
+                    self._cond.notify_all()
+                    continue
+                stage = job.stages[job.next_stage_index]
+                job.status = "running"
+                job.current_stage = stage
+                if job.started_at is None:
+                    job.started_at = time.time()
+
+            error: Optional[Exception] = None
+            try:
+                if job.raw_context is not None:
+                    save_raw_context(self.pipeline.settings, job.query_id, job.raw_context)
+                    job.raw_context = None
+                result = self.pipeline.run_stage(stage, job.query_id)
+                artifact = to_jsonable(result)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                if error is None:
+                    # Словарь не меняется на месте, а заменяется новым: HTTP-потоки
+                    # сериализуют job.artifacts без блокировки планировщика
+                    job.artifacts = {**job.artifacts, stage: artifact}
+                if error is not None:
+                    job.error = f"{type(error).__name__}: {error}"
+                    print(
+                        f"StageScheduler: job {job.job_id} failed for "
+                        f"query_id={job.query_id} at stage={stage}: {error}"
+                    )
+                    self._finish(job, "failed")
+                else:
+                    job.next_stage_index += 1
+                    if job.next_stage_index < len(job.stages):
+                        job.status = "queued"
+                        job.current_stage = None
+                        self._push(job)
+                    else:
+                        self._finish(job, "done")
+                self._cond.notify_all()
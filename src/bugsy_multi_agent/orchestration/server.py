@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import json
+import math
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional
+
+from bugsy_multi_agent.data_access.context_store import (
+    get_context_path,
+    validate_query_id,
+)
+from bugsy_multi_agent.orchestration.pipeline import Pipeline
+from bugsy_multi_agent.orchestration.scheduler import Job, StageScheduler
+
+
+class ContextConflictError(ValueError):
+    """
+    raw_context для query_id, у которого контекст уже есть, без replace_context.
+    """
+
+
+class JobManager:
+    """
+    Держит тёплый Pipeline (агенты, общий LLM-клиент) и выполняет задания
+    через StageScheduler: с учётом приоритета, дедлайна и отправителя.
+
+    Результаты шагов хранятся в памяти; завершённые задания вытесняются
+    по LRU, когда их становится больше max_finished_jobs.
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        workers: int = 4,
+        max_finished_jobs: int = 1000,
+    ) -> None:
+        self.pipeline = pipeline
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self.scheduler = StageScheduler(
+            pipeline,
+            workers=workers,
+            on_job_finished=self._on_job_finished,
+        )
+        self.scheduler.start()
+
+    # ---------- приём заданий ----------
+
+    def submit(
+        self,
+        query_id: Optional[str] = None,
+        raw_context: Optional[dict] = None,
+        stages: Optional[List[str]] = None,
+        priority: str = "normal",
+        deadline_seconds: Optional[float] = None,
+        submitter: str = "default",
+        replace_context: bool = False,
+    ) -> Job:
+        """
+        Ставит задание в очередь.
+
+        - query_id: существующий data/contexts/{query_id}.json;
+        - raw_context: сырой контекст OntologyRAG; сохраняется в data/contexts/
+          под query_id (или под сгенерированным id, если query_id не задан)
+          перед первым шагом задания, когда предыдущие задания этого query_id
+          уже завершены;
+        - replace_context: разрешить raw_context заменить существующий контекст
+          query_id; без него замена — ContextConflictError;
+        - deadline_seconds: дедлайн относительно текущего момента.
+
+        query_id — только [A-Za-z0-9_.-]. Некорректные поля — ValueError,
+        до записи каких-либо файлов.
+        """
+        if query_id is None and raw_context is None:
+            raise ValueError("Either query_id or raw_context must be provided")
+        if query_id is not None:
+            validate_query_id(query_id)
+        if not isinstance(replace_context, bool):
+            raise ValueError("replace_context must be a boolean")
+        if raw_context is not None and not isinstance(raw_context, dict):
+            raise ValueError("raw_context must be a JSON object")
+        if stages is not None and (
+            not isinstance(stages, list) or not all(isinstance(s, str) for s in stages)
+        ):
+            raise ValueError("stages must be a list of stage names")
+        if not isinstance(priority, str):
+            raise ValueError("priority must be a string")
+        if not isinstance(submitter, str) or not submitter:
+            raise ValueError("submitter must be a non-empty string")
+        if deadline_seconds is not None and (
+            isinstance(deadline_seconds, bool)
+            or not isinstance(deadline_seconds, (int, float))
+            or not math.isfinite(deadline_seconds)
+        ):
+            raise ValueError("deadline_seconds must be a number")
+
+        job_id = uuid.uuid4().hex
+        if query_id is None:
+            query_id = f"job_{job_id[:12]}"
+
+        job = Job(
+            job_id=job_id,
+            query_id=query_id,
+            stages=list(stages or self.pipeline.STAGES),
+            priority=priority,
+            deadline=(
+                time.time() + deadline_seconds
+                if deadline_seconds is not None
+                else None
+            ),
+            submitter=submitter,
+            raw_context=raw_context,
+        )
+
+        with self._jobs_lock:
+            if raw_context is not None and not replace_context:
+                pending = any(
+                    j.query_id == query_id and j.raw_context is not None
+                    for j in self._jobs.values()
+                )
+                if pending or get_context_path(self.pipeline.settings, query_id).exists():
+                    raise ContextConflictError(
+                        f"Context for query_id={query_id} already exists; "
+                        f"set replace_context to overwrite it"
+                    )
+            self._jobs[job_id] = job
+        try:
+            self.scheduler.submit(job)
+        except ValueError:
+            with self._jobs_lock:
+                del self._jobs[job_id]
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+            return job
+
+    def list_jobs(self) -> List[Job]:
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def shutdown(self) -> None:
+        self.scheduler.stop()
+
+    # ---------- вытеснение ----------
+
+    def _on_job_finished(self, job: Job) -> None:
+        with self._jobs_lock:
+            finished = [
+                job_id
+                for job_id, j in self._jobs.items()
+                if j.status in ("done", "failed", "deferred")
+            ]
+            # OrderedDict упорядочен по последнему обращению: старые идут первыми
+            for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[job_id]
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    Локальный JSON API:
+
+    - GET  /health                          -> {"status": "ok", ...}
+    - POST /jobs                            -> {"job_id": ...}
+      тело: {"query_id": "...", "raw_context": {...}, "replace_context": false,
+             "stages": [...], "priority": "urgent|high|normal|bulk",
+             "deadline_seconds": 60, "submitter": "..."}
+      400 — некорректные поля, 409 — контекст query_id уже есть,
+      а replace_context не задан
+    - GET  /jobs                            -> список статусов
+    - GET  /jobs/{job_id}                   -> статус задания
+    - GET  /jobs/{job_id}/artifacts         -> все готовые артефакты
+    - GET  /jobs/{job_id}/artifacts/{stage} -> артефакт одного шага
+    """
+
+    server_version = "bugsy-serve/1.0"
+    job_manager: JobManager  # подставляется в make_server
+
+    def address_string(self) -> str:
+        # Для Unix-сокета client_address — пустая строка, а не (host, port)
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json_body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return {}
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def do_GET(self) -> None:
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        manager = self.job_manager
+
+        if parts == ["health"]:
+            self._send_json(
+                200,
+                {
+                    "status": "ok",
+                    "jobs": len(manager.list_jobs()),
+                    "llm": manager.pipeline.llm_metrics(),
+                    "budget": (
+                        manager.pipeline.budget.snapshot()["run"]
+                        if manager.pipeline.budget is not None
+                        else None
+                    ),
+                },
+            )
+            return
+
+        if parts == ["jobs"]:
+            self._send_json(
+                200,
+                [job.to_status_dict() for job in manager.list_jobs()],
+            )
+            return
+
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = manager.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+                return
+            if len(parts) == 2:
+                self._send_json(200, job.to_status_dict())
+                return
+            # Снимок: планировщик заменяет job.artifacts новым словарём
+            artifacts = job.artifacts
+            if len(parts) == 3 and parts[2] == "artifacts":
+                self._send_json(200, artifacts)
+                return
+            if len(parts) == 4 and parts[2] == "artifacts":
+                if parts[3] not in artifacts:
+                    self._send_json(
+                        404,
+                        {"error": f"Artifact '{parts[3]}' is not ready"},
+                    )
+                    return
+                self._send_json(200, artifacts[parts[3]])
+                return
+
+        self._send_json(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self) -> None:
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if parts != ["jobs"]:
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        try:
+            body = self._read_json_body()
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object")
+            job = self.job_manager.submit(
+                query_id=body.get("query_id"),
+                raw_context=body.get("raw_context"),
+                stages=body.get("stages"),
+                priority=body.get("priority", "normal"),
+                deadline_seconds=body.get("deadline_seconds"),
+                submitter=body.get("submitter", "default"),
+                replace_context=body.get("replace_context", False),
+            )
+        except ContextConflictError as e:
+            self._send_json(409, {"error": str(e)})
+            return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self._send_json(202, job.to_status_dict())
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    job_manager: JobManager,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+) -> socketserver.BaseServer:
+    """
+    Создаёт HTTP-сервер поверх TCP (host:port) или Unix-сокета.
+    """
+    handler = type(
+        "BoundJobRequestHandler",
+        (JobRequestHandler,),
+        {"job_manager": job_manager},
+    )
+    if unix_socket is not None:
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)